@@ -0,0 +1,34 @@
+10 REM TARGETS 8K 5.21 Z80
+20 REM BUBBLE SORT OF 60 ELEMENTS AND AN 8X8 MATRIX PRODUCT
+100 DIM A(60),X(8,8),Y(8,8),Z(8,8)
+110 R=7
+120 FOR I=1 TO 60
+130 R=R*13+7:R=R-INT(R/101)*101
+140 A(I)=R
+150 NEXT I
+160 FOR I=1 TO 59
+170 FOR J=1 TO 60-I
+180 IF A(J)<=A(J+1) THEN 200
+190 T=A(J):A(J)=A(J+1):A(J+1)=T
+200 NEXT J
+210 NEXT I
+220 FOR I=1 TO 59
+230 IF A(I)>A(I+1) THEN PRINT "BAD SORT"
+240 NEXT I
+300 FOR I=1 TO 8
+310 FOR J=1 TO 8
+320 X(I,J)=I+J:Y(I,J)=I-J
+330 NEXT J
+340 NEXT I
+350 FOR I=1 TO 8
+360 FOR J=1 TO 8
+370 S=0
+380 FOR K=1 TO 8
+390 S=S+X(I,K)*Y(K,J)
+400 NEXT K
+410 Z(I,J)=S
+420 NEXT J
+430 NEXT I
+440 IF Z(8,8)<>-308 THEN PRINT "BAD PRODUCT";Z(8,8)
+450 PRINT "DONE"
+460 END
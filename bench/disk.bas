@@ -0,0 +1,20 @@
+10 REM TARGETS 5.21 Z80
+20 REM RANDOM FILE FIELD/LSET/PUT AND GET/CVS LOOPS
+100 OPEN "R",#1,"BENCH.DAT",32
+110 FIELD #1,20 AS N$,4 AS X$,8 AS D$
+120 FOR I=1 TO 50
+130 LSET N$="RECORD"+STR$(I)
+140 LSET X$=MKS$(I*1.5)
+150 LSET D$=MKD$(I/3)
+160 PUT #1,I
+170 NEXT I
+180 S=0
+190 FOR I=50 TO 1 STEP -1
+200 GET #1,I
+210 S=S+CVS(X$)
+220 NEXT I
+230 CLOSE #1
+240 KILL "BENCH.DAT"
+250 IF S<>1912.5 THEN PRINT "BAD";S
+260 PRINT "DONE"
+270 END
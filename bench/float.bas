@@ -0,0 +1,10 @@
+10 REM TARGETS 8K 5.21 Z80
+20 REM TRANSCENDENTAL FUNCTIONS AND POWERS
+100 S=0
+110 FOR I=1 TO 100
+120 X=I/10
+130 S=S+SIN(X)*COS(X)+SQR(X)+LOG(X)+EXP(X/10)+X^1.5
+140 NEXT I
+150 IF S<100 THEN PRINT "BAD";S
+160 PRINT "DONE"
+170 END
@@ -0,0 +1,14 @@
+10 REM TARGETS 5.21 Z80
+20 REM STRING COLLECTION WITH 200 STRINGS IN USE
+100 DIM A$(200)
+110 FOR I=1 TO 200: A$(I)=STR$(I): NEXT I
+120 FOR K=1 TO 10
+130 FOR I=1 TO 200 STEP K
+140 A$(I)=LEFT$(A$(I)+"ABCDEFGHIJ",5+K)
+150 NEXT I
+160 F=FRE("")
+170 NEXT K
+180 T=0: FOR I=1 TO 200: T=T+LEN(A$(I)): NEXT I
+190 PRINT T; A$(1); A$(200)
+200 PRINT "DONE"
+210 END
@@ -0,0 +1,25 @@
+10 REM TARGETS 4K 8K 5.21 Z80
+20 REM NESTED GOSUB/RETURN AND COMPUTED DISPATCH (4K HAS NO ON GOSUB)
+100 S=0
+110 FOR I=1 TO 300
+120 GOSUB 1000
+130 M=I-INT(I/3)*3
+132 IF M=0 THEN GOSUB 2000
+134 IF M=1 THEN GOSUB 2100
+136 IF M=2 THEN GOSUB 2200
+140 NEXT I
+150 IF S<>1200 THEN PRINT "BAD";S
+160 PRINT "DONE"
+170 END
+1000 GOSUB 1100
+1010 RETURN
+1100 GOSUB 1200
+1110 RETURN
+1200 S=S+1
+1210 RETURN
+2000 S=S+2
+2010 RETURN
+2100 S=S+3
+2110 RETURN
+2200 S=S+4
+2210 RETURN
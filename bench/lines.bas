@@ -0,0 +1,219 @@
+10 REM TARGETS 5.21 Z80
+20 REM RESTORE TO LATE LINES OF A LONG PROGRAM, SO EACH ONE SEARCHES FOR ITS LINE
+100 S=0
+110 FOR I=1 TO 200
+120 K=I-INT(I/4)*4
+130 ON K+1 GOSUB 200,210,220,230
+140 READ X: S=S+X
+150 NEXT I
+160 IF S<>500 THEN PRINT "BAD";S
+170 PRINT "DONE"
+180 END
+200 RESTORE 9010: RETURN
+210 RESTORE 9020: RETURN
+220 RESTORE 9030: RETURN
+230 RESTORE 9040: RETURN
+1000 REM FILLER LINE 1000
+1010 REM FILLER LINE 1010
+1020 REM FILLER LINE 1020
+1030 REM FILLER LINE 1030
+1040 REM FILLER LINE 1040
+1050 REM FILLER LINE 1050
+1060 REM FILLER LINE 1060
+1070 REM FILLER LINE 1070
+1080 REM FILLER LINE 1080
+1090 REM FILLER LINE 1090
+1100 REM FILLER LINE 1100
+1110 REM FILLER LINE 1110
+1120 REM FILLER LINE 1120
+1130 REM FILLER LINE 1130
+1140 REM FILLER LINE 1140
+1150 REM FILLER LINE 1150
+1160 REM FILLER LINE 1160
+1170 REM FILLER LINE 1170
+1180 REM FILLER LINE 1180
+1190 REM FILLER LINE 1190
+1200 REM FILLER LINE 1200
+1210 REM FILLER LINE 1210
+1220 REM FILLER LINE 1220
+1230 REM FILLER LINE 1230
+1240 REM FILLER LINE 1240
+1250 REM FILLER LINE 1250
+1260 REM FILLER LINE 1260
+1270 REM FILLER LINE 1270
+1280 REM FILLER LINE 1280
+1290 REM FILLER LINE 1290
+1300 REM FILLER LINE 1300
+1310 REM FILLER LINE 1310
+1320 REM FILLER LINE 1320
+1330 REM FILLER LINE 1330
+1340 REM FILLER LINE 1340
+1350 REM FILLER LINE 1350
+1360 REM FILLER LINE 1360
+1370 REM FILLER LINE 1370
+1380 REM FILLER LINE 1380
+1390 REM FILLER LINE 1390
+1400 REM FILLER LINE 1400
+1410 REM FILLER LINE 1410
+1420 REM FILLER LINE 1420
+1430 REM FILLER LINE 1430
+1440 REM FILLER LINE 1440
+1450 REM FILLER LINE 1450
+1460 REM FILLER LINE 1460
+1470 REM FILLER LINE 1470
+1480 REM FILLER LINE 1480
+1490 REM FILLER LINE 1490
+1500 REM FILLER LINE 1500
+1510 REM FILLER LINE 1510
+1520 REM FILLER LINE 1520
+1530 REM FILLER LINE 1530
+1540 REM FILLER LINE 1540
+1550 REM FILLER LINE 1550
+1560 REM FILLER LINE 1560
+1570 REM FILLER LINE 1570
+1580 REM FILLER LINE 1580
+1590 REM FILLER LINE 1590
+1600 REM FILLER LINE 1600
+1610 REM FILLER LINE 1610
+1620 REM FILLER LINE 1620
+1630 REM FILLER LINE 1630
+1640 REM FILLER LINE 1640
+1650 REM FILLER LINE 1650
+1660 REM FILLER LINE 1660
+1670 REM FILLER LINE 1670
+1680 REM FILLER LINE 1680
+1690 REM FILLER LINE 1690
+1700 REM FILLER LINE 1700
+1710 REM FILLER LINE 1710
+1720 REM FILLER LINE 1720
+1730 REM FILLER LINE 1730
+1740 REM FILLER LINE 1740
+1750 REM FILLER LINE 1750
+1760 REM FILLER LINE 1760
+1770 REM FILLER LINE 1770
+1780 REM FILLER LINE 1780
+1790 REM FILLER LINE 1790
+1800 REM FILLER LINE 1800
+1810 REM FILLER LINE 1810
+1820 REM FILLER LINE 1820
+1830 REM FILLER LINE 1830
+1840 REM FILLER LINE 1840
+1850 REM FILLER LINE 1850
+1860 REM FILLER LINE 1860
+1870 REM FILLER LINE 1870
+1880 REM FILLER LINE 1880
+1890 REM FILLER LINE 1890
+1900 REM FILLER LINE 1900
+1910 REM FILLER LINE 1910
+1920 REM FILLER LINE 1920
+1930 REM FILLER LINE 1930
+1940 REM FILLER LINE 1940
+1950 REM FILLER LINE 1950
+1960 REM FILLER LINE 1960
+1970 REM FILLER LINE 1970
+1980 REM FILLER LINE 1980
+1990 REM FILLER LINE 1990
+2000 REM FILLER LINE 2000
+2010 REM FILLER LINE 2010
+2020 REM FILLER LINE 2020
+2030 REM FILLER LINE 2030
+2040 REM FILLER LINE 2040
+2050 REM FILLER LINE 2050
+2060 REM FILLER LINE 2060
+2070 REM FILLER LINE 2070
+2080 REM FILLER LINE 2080
+2090 REM FILLER LINE 2090
+2100 REM FILLER LINE 2100
+2110 REM FILLER LINE 2110
+2120 REM FILLER LINE 2120
+2130 REM FILLER LINE 2130
+2140 REM FILLER LINE 2140
+2150 REM FILLER LINE 2150
+2160 REM FILLER LINE 2160
+2170 REM FILLER LINE 2170
+2180 REM FILLER LINE 2180
+2190 REM FILLER LINE 2190
+2200 REM FILLER LINE 2200
+2210 REM FILLER LINE 2210
+2220 REM FILLER LINE 2220
+2230 REM FILLER LINE 2230
+2240 REM FILLER LINE 2240
+2250 REM FILLER LINE 2250
+2260 REM FILLER LINE 2260
+2270 REM FILLER LINE 2270
+2280 REM FILLER LINE 2280
+2290 REM FILLER LINE 2290
+2300 REM FILLER LINE 2300
+2310 REM FILLER LINE 2310
+2320 REM FILLER LINE 2320
+2330 REM FILLER LINE 2330
+2340 REM FILLER LINE 2340
+2350 REM FILLER LINE 2350
+2360 REM FILLER LINE 2360
+2370 REM FILLER LINE 2370
+2380 REM FILLER LINE 2380
+2390 REM FILLER LINE 2390
+2400 REM FILLER LINE 2400
+2410 REM FILLER LINE 2410
+2420 REM FILLER LINE 2420
+2430 REM FILLER LINE 2430
+2440 REM FILLER LINE 2440
+2450 REM FILLER LINE 2450
+2460 REM FILLER LINE 2460
+2470 REM FILLER LINE 2470
+2480 REM FILLER LINE 2480
+2490 REM FILLER LINE 2490
+2500 REM FILLER LINE 2500
+2510 REM FILLER LINE 2510
+2520 REM FILLER LINE 2520
+2530 REM FILLER LINE 2530
+2540 REM FILLER LINE 2540
+2550 REM FILLER LINE 2550
+2560 REM FILLER LINE 2560
+2570 REM FILLER LINE 2570
+2580 REM FILLER LINE 2580
+2590 REM FILLER LINE 2590
+2600 REM FILLER LINE 2600
+2610 REM FILLER LINE 2610
+2620 REM FILLER LINE 2620
+2630 REM FILLER LINE 2630
+2640 REM FILLER LINE 2640
+2650 REM FILLER LINE 2650
+2660 REM FILLER LINE 2660
+2670 REM FILLER LINE 2670
+2680 REM FILLER LINE 2680
+2690 REM FILLER LINE 2690
+2700 REM FILLER LINE 2700
+2710 REM FILLER LINE 2710
+2720 REM FILLER LINE 2720
+2730 REM FILLER LINE 2730
+2740 REM FILLER LINE 2740
+2750 REM FILLER LINE 2750
+2760 REM FILLER LINE 2760
+2770 REM FILLER LINE 2770
+2780 REM FILLER LINE 2780
+2790 REM FILLER LINE 2790
+2800 REM FILLER LINE 2800
+2810 REM FILLER LINE 2810
+2820 REM FILLER LINE 2820
+2830 REM FILLER LINE 2830
+2840 REM FILLER LINE 2840
+2850 REM FILLER LINE 2850
+2860 REM FILLER LINE 2860
+2870 REM FILLER LINE 2870
+2880 REM FILLER LINE 2880
+2890 REM FILLER LINE 2890
+2900 REM FILLER LINE 2900
+2910 REM FILLER LINE 2910
+2920 REM FILLER LINE 2920
+2930 REM FILLER LINE 2930
+2940 REM FILLER LINE 2940
+2950 REM FILLER LINE 2950
+2960 REM FILLER LINE 2960
+2970 REM FILLER LINE 2970
+2980 REM FILLER LINE 2980
+2990 REM FILLER LINE 2990
+9010 DATA 1
+9020 DATA 2
+9030 DATA 3
+9040 DATA 4
@@ -0,0 +1,7 @@
+10 REM TARGETS 5.21 Z80
+20 REM PRINT USING FORMATTING OF NUMBERS AND STRINGS
+100 FOR I=1 TO 60
+110 PRINT USING "###.## **$#,###.## +#.##^^^^ \   \";I*1.25,I*123.5,I/7,"ABCDEFG"
+120 NEXT I
+130 PRINT "DONE"
+140 END
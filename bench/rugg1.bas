@@ -0,0 +1,6 @@
+10 REM TARGETS 4K 8K 5.21 Z80
+20 REM RUGG/FELDMAN BM1: EMPTY FOR LOOP
+300 FOR K=1 TO 1000
+500 NEXT K
+700 PRINT "DONE"
+800 END
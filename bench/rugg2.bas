@@ -0,0 +1,7 @@
+10 REM TARGETS 4K 8K 5.21 Z80
+20 REM RUGG/FELDMAN BM2: IF/GOTO LOOP
+300 K=0
+400 K=K+1
+500 IF K<1000 THEN 400
+700 PRINT "DONE"
+800 END
@@ -0,0 +1,10 @@
+10 REM TARGETS 4K 8K 5.21 Z80
+20 REM RUGG/FELDMAN BM5: BM4 PLUS GOSUB
+300 K=0
+400 K=K+1
+410 A=K/2*3+4-5
+420 GOSUB 1000
+500 IF K<1000 THEN 400
+700 PRINT "DONE"
+800 END
+1000 RETURN
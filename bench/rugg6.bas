@@ -0,0 +1,13 @@
+10 REM TARGETS 4K 8K 5.21 Z80
+20 REM RUGG/FELDMAN BM6: BM5 PLUS AN INNER FOR LOOP
+300 K=0
+310 DIM M(5)
+400 K=K+1
+410 A=K/2*3+4-5
+420 GOSUB 1000
+430 FOR L=1 TO 5
+440 NEXT L
+500 IF K<1000 THEN 400
+700 PRINT "DONE"
+800 END
+1000 RETURN
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+run_bench.py - Cycle counts of the benchmark corpus on every interpreter
+
+Each bench/*.bas program names the interpreters it runs on in its first
+line (10 REM TARGETS 4K 8K 5.21 Z80).  For every program and target the
+program is typed in under emu80 with cycle counting on, and only the
+T-states from RUN to the end of the program are counted, so start-up and
+program entry do not dilute the figure.  Emulated cycles are exactly
+repeatable: any change from the stored baseline comes from the code.
+Each interpreter is booted once, to a snapshot taken at its first
+prompt, and every run starts from that snapshot.  mbasicz runs on the
+Z80 core and is timed in Z80 T-states, the others on the 8080, so the
+5.21 and z80 columns compare the two builds on their own processors.
+
+By default 5.21 and mbasicz are first rebuilt from source (as in
+verify_all.py), while 4K and 8K, whose reconstructed sources do not yet
+assemble to a working image, are measured on their reference binaries;
+--prebuilt uses the reference binaries throughout and --image replaces
+one target's image.  Results are compared with
+bench/baselines.json; a cycle count above baseline by more than
+--threshold percent, a changed program output or a program that does
+not print DONE is flagged and makes the exit status nonzero.  --save
+records the current results as the new baselines.  --jit runs the
+programs on compiled basic blocks (emu80/jit.py), which gives the same
+counts sooner.
+
+Usage:
+    python3 bench/run_bench.py [--targets 4k,8k,5.21,z80] [--bench NAME,...]
+                               [--prebuilt] [--image TARGET=FILE] [--jobs N]
+                               [--threshold PCT] [--save] [--json FILE] [--jit]
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from emu80 import CPM, Altair, Z80, STOP_EXIT, STOP_INPUT   # noqa: E402
+from emu80.snapshot import save, restore                    # noqa: E402
+from verify_all import build_image                          # noqa: E402
+
+BASELINES = os.path.join(BENCH_DIR, 'baselines.json')
+BOOT_LIMIT = 20_000_000        # instructions for start-up
+ENTRY_LIMIT = 20_000_000       # instructions for typing the program in
+LIMIT = 200_000_000             # instructions for the run itself
+
+# name: (machine, prebuilt image, answers to the start-up questions, build from
+# source, CPU it runs and is timed on)
+TARGETS = {
+    '4k': ('altair', '4k8k/4k/4kbas40.bin', '\n\nY\n', False, '8080'),
+    '8k': ('altair', '4k8k/8k/8kbas.bin', '\n\nY\n', False, '8080'),
+    '5.21': ('cpm', 'mbasic_521/com/mbasic.com', '', True, '8080'),
+    'z80': ('cpm', 'mbasicz/out/mbasicz.com', '', True, 'z80'),
+}
+
+TARGETS_RE = re.compile(r'^\s*\d+\s+REM\s+TARGETS\s+(.*)$', re.I)
+
+
+def load_benchmarks(names=None):
+    """Return {name: (targets, program text)} for bench/*.bas."""
+    benchmarks = {}
+    for path in sorted(glob.glob(os.path.join(BENCH_DIR, '*.bas'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if names and name not in names:
+            continue
+        with open(path) as f:
+            text = f.read()
+        m = TARGETS_RE.match(text.split('\n', 1)[0])
+        targets = m.group(1).lower().split() if m else list(TARGETS)
+        benchmarks[name] = (targets, text)
+    return benchmarks
+
+
+def boot(target, image_path, snapshot):
+    """Boot a target to its first prompt and save a snapshot; returns an error or None."""
+    kind, _, answers, _, cpu = TARGETS[target]
+    cpu = Z80() if cpu == 'z80' else None
+    with open(image_path, 'rb') as f:
+        image = f.read()
+    with tempfile.TemporaryDirectory(prefix='bench_') as tmp:
+        if kind == 'altair':
+            machine = Altair(image, cpu=cpu)
+        else:
+            machine = CPM(image, directory=tmp, cpu=cpu)
+        machine.feed(answers)
+        stop = machine.run(BOOT_LIMIT)
+        if stop != STOP_INPUT:
+            return f'{target}: stopped ({stop}) during start-up'
+        save(machine, snapshot)
+    return None
+
+
+def run_benchmark(job):
+    """Run one (target, snapshot, benchmark, program, jit) job; returns a result dict."""
+    target, snapshot, name, program, jit = job
+    result = {'target': target, 'bench': name, 'status': 'ok'}
+    start = time.time()
+    with tempfile.TemporaryDirectory(prefix='bench_') as tmp:
+        machine = restore(snapshot, directory=tmp, timed=True, jit=jit)
+        cpu = machine.cpu
+        machine.feed(program)
+        stop = machine.run(machine.instructions + ENTRY_LIMIT)
+        if stop != STOP_INPUT:
+            result['status'] = f'stopped ({stop}) before RUN'
+        else:
+            cycles, instructions, shown = cpu.cycles, machine.instructions, len(machine.output)
+            machine.feed('RUN\n')
+            stop = machine.run(machine.instructions + LIMIT)
+            output = bytes(machine.output[shown:]).replace(b'\r', b'')
+            result.update(cycles=cpu.cycles - cycles,
+                          instructions=machine.instructions - instructions,
+                          output=hashlib.sha1(output).hexdigest()[:12])
+            if stop not in (STOP_INPUT, STOP_EXIT):
+                result['status'] = f'stopped ({stop})'
+            elif b'DONE' not in output or b'BAD' in output:
+                result['status'] = 'wrong output'
+                result['text'] = output.decode('latin-1')[-400:]
+    result['seconds'] = round(time.time() - start, 2)
+    return result
+
+
+def target_images(names, tmp, prebuilt=False, overrides=None):
+    """Map each target to the image to run, building into tmp where needed.
+
+    overrides maps targets to image files given by the user.
+    """
+    overrides = overrides or {}
+    images = {}
+    for name in names:
+        if name in overrides:
+            images[name] = overrides[name]
+        elif prebuilt or not TARGETS[name][3]:
+            images[name] = os.path.join(ROOT, TARGETS[name][1])
+        else:
+            out_dir = os.path.join(tmp, name)
+            os.makedirs(out_dir)
+            image, failure = build_image(name, out_dir)
+            if image is None:
+                sys.exit(f"{name}: {failure['status']}\n{failure['output']}")
+            images[name] = image
+    return images
+
+
+def compare(results, baselines, threshold):
+    """Add baseline figures and a verdict to each result; returns the regressions."""
+    regressions = []
+    for r in results:
+        base = baselines.get(r['target'], {}).get(r['bench'])
+        r['verdict'] = ''
+        if r['status'] != 'ok':
+            r['verdict'] = r['status']
+        elif base is None:
+            r['verdict'] = 'new'
+            continue
+        else:
+            r['baseline'] = base['cycles']
+            r['change'] = 100.0 * (r['cycles'] - base['cycles']) / base['cycles']
+            if r['output'] != base['output']:
+                r['verdict'] = 'output changed'
+            elif r['change'] > threshold:
+                r['verdict'] = 'REGRESSION'
+            elif r['change'] < 0:
+                r['verdict'] = 'faster'
+        if r['verdict'] not in ('', 'faster', 'new'):
+            regressions.append(r)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the BASIC benchmarks and compare cycle counts')
+    parser.add_argument('--targets', default=','.join(TARGETS),
+                        help=f"Comma-separated targets (default: {','.join(TARGETS)})")
+    parser.add_argument('--bench', help='Comma-separated benchmark names (default: all)')
+    parser.add_argument('--prebuilt', action='store_true',
+                        help='Use the reference binaries instead of building from source')
+    parser.add_argument('--image', action='append', default=[], metavar='TARGET=FILE',
+                        help='Benchmark this image for a target (repeatable)')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='Parallel runs (default: number of CPUs)')
+    parser.add_argument('--threshold', type=float, default=0.0,
+                        help='Percent increase over baseline tolerated (default: 0)')
+    parser.add_argument('--save', action='store_true', help='Store the results as the baselines')
+    parser.add_argument('--json', help='Write the results as JSON to this file')
+    parser.add_argument('--jit', action='store_true', help='Run on compiled basic blocks')
+    args = parser.parse_args()
+
+    names = [t.strip() for t in args.targets.split(',') if t.strip()]
+    unknown = [t for t in names if t not in TARGETS]
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(unknown)}")
+    benchmarks = load_benchmarks(args.bench.split(',') if args.bench else None)
+
+    start = time.time()
+    with tempfile.TemporaryDirectory(prefix='bench_images_') as tmp:
+        images = target_images(names, tmp, args.prebuilt,
+                               dict(item.split('=', 1) for item in args.image))
+        snapshots = {}
+        for name, image in images.items():
+            snapshots[name] = os.path.join(tmp, f'{name}.snap')
+            error = boot(name, image, snapshots[name])
+            if error:
+                sys.exit(error)
+        jobs = [(target, snapshots[target], bench, program, args.jit)
+                for bench, (targets, program) in benchmarks.items()
+                for target in names if target in targets]
+        with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(jobs)))) as pool:
+            results = list(pool.map(run_benchmark, jobs))
+    wall = time.time() - start
+
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as f:
+            baselines = json.load(f)
+    regressions = compare(results, baselines, args.threshold)
+
+    print(f"{'Benchmark':12} {'Target':6} {'T-states':>12} {'Baseline':>12} {'Change':>8}  Verdict")
+    print('-' * 66)
+    for r in results:
+        cycles = f"{r['cycles']:12d}" if 'cycles' in r else f"{'':12}"
+        base = f"{r['baseline']:12d}" if 'baseline' in r else f"{'':12}"
+        change = f"{r['change']:+7.2f}%" if 'change' in r else f"{'':8}"
+        print(f"{r['bench']:12} {r['target']:6} {cycles} {base} {change}  {r['verdict']}")
+    for r in results:
+        if 'text' in r:
+            print()
+            print(f"{r['bench']} on {r['target']}: {r['status']}")
+            print(r['text'].rstrip())
+    print()
+    print(f"{len(results)} runs in {wall:.1f}s, {len(regressions)} flagged")
+
+    if args.save:
+        for r in results:
+            if r['status'] == 'ok':
+                baselines.setdefault(r['target'], {})[r['bench']] = {
+                    'cycles': r['cycles'], 'instructions': r['instructions'],
+                    'output': r['output']}
+        with open(BASELINES, 'w') as f:
+            json.dump(baselines, f, indent=1, sort_keys=True)
+            f.write('\n')
+        print(f"Baselines saved to {os.path.relpath(BASELINES, ROOT)}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'wall_seconds': round(wall, 2), 'results': results}, f, indent=1)
+
+    return 1 if regressions and not args.save else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,20 @@
+10 REM TARGETS 4K 8K 5.21 Z80
+20 REM SIEVE OF ERATOSTHENES UP TO 1000, TWICE
+100 DIM F(1000)
+110 FOR P=1 TO 2
+120 C=0
+130 FOR I=2 TO 1000
+140 F(I)=0
+150 NEXT I
+160 FOR I=2 TO 1000
+170 IF F(I)<>0 THEN 220
+180 C=C+1
+190 IF I>31 THEN 220
+200 FOR J=I*I TO 1000 STEP I
+210 F(J)=1
+215 NEXT J
+220 NEXT I
+230 NEXT P
+240 IF C<>168 THEN PRINT "BAD";C
+250 PRINT "DONE"
+260 END
@@ -0,0 +1,13 @@
+10 REM TARGETS 8K 5.21 Z80
+20 REM STRING CONCATENATION CHURN; FILLS STRING SPACE AND FORCES COLLECTION
+100 FOR I=1 TO 200
+110 A$=""
+120 FOR J=1 TO 10
+130 A$=A$+CHR$(65+J)
+140 NEXT J
+150 B$=LEFT$(A$,5)+MID$(A$,6,2)+RIGHT$(A$,3)
+160 IF B$<>"BCDEFGHIJK" THEN PRINT "BAD ";B$
+170 C$=STR$(I)
+180 NEXT I
+190 PRINT "DONE"
+200 END
@@ -0,0 +1,33 @@
+10 REM TARGETS 8K 5.21 Z80
+20 REM A LOOP OVER VARIABLES MADE AFTER 120 OTHERS
+100 A0=0:A1=1:A2=2:A3=3:A4=4
+105 A5=5:A6=6:A7=7:A8=8:A9=9
+110 B0=10:B1=11:B2=12:B3=13:B4=14
+115 B5=15:B6=16:B7=17:B8=18:B9=19
+120 C0=20:C1=21:C2=22:C3=23:C4=24
+125 C5=25:C6=26:C7=27:C8=28:C9=29
+130 D0=30:D1=31:D2=32:D3=33:D4=34
+135 D5=35:D6=36:D7=37:D8=38:D9=39
+140 E0=40:E1=41:E2=42:E3=43:E4=44
+145 E5=45:E6=46:E7=47:E8=48:E9=49
+150 F0=50:F1=51:F2=52:F3=53:F4=54
+155 F5=55:F6=56:F7=57:F8=58:F9=59
+160 G0=60:G1=61:G2=62:G3=63:G4=64
+165 G5=65:G6=66:G7=67:G8=68:G9=69
+170 H0=70:H1=71:H2=72:H3=73:H4=74
+175 H5=75:H6=76:H7=77:H8=78:H9=79
+180 I0=80:I1=81:I2=82:I3=83:I4=84
+185 I5=85:I6=86:I7=87:I8=88:I9=89
+190 J0=90:J1=91:J2=92:J3=93:J4=94
+195 J5=95:J6=96:J7=97:J8=98:J9=99
+200 K0=100:K1=101:K2=102:K3=103:K4=104
+205 K5=105:K6=106:K7=107:K8=108:K9=109
+210 L0=110:L1=111:L2=112:L3=113:L4=114
+215 L5=115:L6=116:L7=117:L8=118:L9=119
+300 S=0
+310 FOR I=1 TO 500
+320 S=S+L9+L8-K7*2+J6
+330 NEXT I
+340 IF S<>59500 THEN PRINT "BAD";S
+350 PRINT "DONE"
+360 END
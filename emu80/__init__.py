@@ -0,0 +1,36 @@
+"""
+emu80 - Intel 8080 and Z80 emulator for running the interpreters headless
+
+    cpu.py      CPU core: opcode templates compiled into a dispatch array,
+                8080 T-state table
+    z80.py      Z80 core: the CB/DD/ED/FD tables, JR/DJNZ, Z80 flags and
+                T-states, on the same templates
+    jit.py      basic blocks compiled into one function each, dropped
+                when their bytes are written
+    machine.py  run loop, console queues, traps and breakpoints
+    cpm.py      CP/M 2.2 stand-in (BDOS/BIOS traps, console, host files)
+    altair.py   Altair with an 88-SIO console, for 4K and 8K BASIC
+    diffrun.py  lockstep differential run of two images
+    trace.py    code/data coverage bitmaps and ud80 -d/-e options
+    profile.py  per-routine T-state profile and call graph
+    blocks.py   basic-block counts, opcode histograms and JP->JR candidates
+    snapshot.py save a machine after start-up, restore it copy-on-write
+
+Usage:
+    python3 -m emu80 mbasic_521/out/mbasic_go.com --input prog.txt
+
+    from emu80 import CPM
+    machine = CPM(image, directory='work')
+    machine.feed('PRINT 2+2\\nSYSTEM\\n')
+    machine.run()
+"""
+
+from .cpu import CPU
+from .z80 import Z80
+from .machine import (Machine, STOP_EXIT, STOP_INPUT, STOP_LIMIT, STOP_HALT,
+                      STOP_BREAK)
+from .cpm import CPM
+from .altair import Altair
+
+__all__ = ['CPU', 'Z80', 'Machine', 'CPM', 'Altair', 'STOP_EXIT', 'STOP_INPUT',
+           'STOP_LIMIT', 'STOP_HALT', 'STOP_BREAK']
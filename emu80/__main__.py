@@ -0,0 +1,63 @@
+"""
+Run a CP/M .COM file under the emulator.
+
+Usage:
+    python3 -m emu80 <program.com> [args...] [--input FILE] [--dir DIR]
+                     [--limit N] [--stats] [--z80] [--jit]
+
+Console input comes from --input (or from stdin when it is not a
+terminal); the run stops when the program exits or asks for more input
+than was given.  --z80 runs it on the Z80 core instead of the 8080, and
+--jit runs compiled basic blocks (see jit.py) instead of one handler per
+instruction.
+"""
+
+import sys
+import time
+import argparse
+
+from .cpu import CPU
+from .z80 import Z80
+from .cpm import CPM
+from .machine import STOP_INPUT, STOP_HALT, STOP_LIMIT
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python3 -m emu80', description='Run a CP/M .COM file')
+    parser.add_argument('program', help='.COM file to run')
+    parser.add_argument('args', nargs='*', help='Command line tail passed to the program')
+    parser.add_argument('--input', help='File with console input (default: stdin if not a terminal)')
+    parser.add_argument('--dir', default='.', help='Directory used as drive A: (default: .)')
+    parser.add_argument('--limit', type=int, help='Stop after this many instructions')
+    parser.add_argument('--stats', action='store_true', help='Print instruction and T-state counts and speed')
+    parser.add_argument('--z80', action='store_true', help='Run on the Z80 core')
+    parser.add_argument('--jit', action='store_true', help='Run compiled basic blocks')
+    args = parser.parse_args()
+
+    with open(args.program, 'rb') as f:
+        image = f.read()
+    cpu = (Z80 if args.z80 else CPU)(timed=args.stats, jit=args.jit)
+    machine = CPM(image, ' '.join(args.args), args.dir, cpu=cpu)
+    if args.input:
+        with open(args.input, 'rb') as f:
+            machine.feed(f.read())
+    elif not sys.stdin.isatty():
+        machine.feed(sys.stdin.buffer.read())
+
+    start = time.time()
+    reason = machine.run(args.limit)
+    elapsed = time.time() - start
+
+    sys.stdout.write(machine.output_text())
+    sys.stdout.flush()
+    if reason in (STOP_INPUT, STOP_HALT, STOP_LIMIT):
+        print(f"\n[stopped: {reason} at PC={machine.cpu.pc:04X}]", file=sys.stderr)
+    if args.stats:
+        rate = machine.instructions / elapsed if elapsed else 0
+        print(f"{machine.instructions} instructions, {machine.cpu.cycles} T-states "
+              f"in {elapsed:.2f}s ({rate / 1e6:.2f} M/s)", file=sys.stderr)
+    return 0 if reason != STOP_HALT else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+altair.py - Altair 8800 with an 88-SIO serial console, for 4K and 8K BASIC
+
+The image is loaded at 0 and started there, with RAM filling the rest of
+the 64K.  The console is the 88-SIO at ports 0 (status) and 1 (data):
+status bit 0 is low when a character is waiting and the output-ready bits
+are always low.  Every other port reads as FF, including the sense
+switches (port FF) unless switches is given: 8K BASIC picks its console
+board from their upper nibble at start-up, and all up keeps the 88-SIO.
+
+BASIC polls the status port both in its input wait loop and, once per
+statement, to look for CONTROL-C.  Scripted input is only reported at
+the wait loop (IN 0; ANI with bit 0; JNZ/JZ back to the IN), so it is
+not swallowed by the CONTROL-C check; an empty queue there stops run()
+with STOP_INPUT.
+
+Usage:
+    from emu80.altair import Altair
+    machine = Altair(open('8kbas.bin', 'rb').read())
+    machine.feed(open('tests/test_full.txt').read())
+    machine.run()
+"""
+
+from .machine import Machine, InputNeeded
+
+
+SIO_STATUS = 0x00
+SIO_DATA = 0x01
+SENSE_SWITCHES = 0xFF
+
+STATUS_READY = 0x00         # character waiting, transmitter ready
+STATUS_IDLE = 0x01          # no character waiting, transmitter ready
+
+ANI = 0xE6
+JNZ = 0xC2
+JZ = 0xCA
+
+
+class Altair(Machine):
+    """An Altair with RAM from 0 to FFFF and an 88-SIO console."""
+
+    def __init__(self, image, cpu=None, typeahead=False, origin=0, switches=0xFF):
+        super().__init__(cpu, typeahead)
+        self.switches = switches
+        self.mem[origin:origin + len(image)] = image
+        self.cpu.pc = origin
+        self.cpu.port_in = self._port_in
+        self.cpu.port_out = self._port_out
+
+    def _input_wait(self, pc):
+        """True if the IN at pc is a loop waiting for a received character."""
+        mem = self.mem
+        if mem[(pc + 2) & 0xFFFF] != ANI or not mem[(pc + 3) & 0xFFFF] & 0x01:
+            return False
+        jump = mem[(pc + 4) & 0xFFFF]
+        target = mem[(pc + 5) & 0xFFFF] | (mem[(pc + 6) & 0xFFFF] << 8)
+        return jump in (JNZ, JZ) and target == pc
+
+    def _port_in(self, port):
+        if port == SIO_STATUS:
+            waiting = self._input_wait(self.cpu.pc)
+            if self.input and (waiting or self.typeahead):
+                return STATUS_READY
+            if waiting:
+                raise InputNeeded
+            return STATUS_IDLE
+        if port == SIO_DATA:
+            return self._getc()
+        if port == SENSE_SWITCHES:
+            return self.switches
+        return 0xFF
+
+    def _port_out(self, port, value):
+        if port == SIO_DATA:
+            self._putc(value)
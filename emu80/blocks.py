@@ -0,0 +1,468 @@
+"""
+blocks.py - Basic-block counts, opcode histograms and JP->JR candidates
+
+A BlockCounter gives a machine its own handler set whose prologue counts
+every executed instruction per address and per opcode, and notices
+control leaving the straight line: when an instruction does not start
+where the previous one ended, the previous one is counted as a taken
+branch and this one as a block entry; after a jump, call, return or HLT
+that was not taken the next instruction also starts a block.  Nothing
+else is recorded, so a run leaves a few 64K count arrays.
+
+Counts are saved to a compact binary .blk file (one record per executed
+address: its instruction bytes, executions, block entries and taken
+transfers, plus the exact opcode histogram) which is summed across runs
+with merge.  summary folds a .blk file onto the labels of a .sym file:
+the opcode histogram, the hottest basic blocks as LABEL+offset, the
+routines with their instruction counts and commonest opcodes, every
+instruction of chosen labels (--label chrgtr), and the executed JMP/Jcc
+whose target is within JR range with the T-states JR would save or cost
+on the Z80 (JR is 12 T-states taken and 7 not taken, JP always 10), so
+the Z80 rewrite can convert the branches where JR is a win.  A run with
+--z80 counts a Z80 image on the Z80 core; its histogram is by first
+byte (prefixes included) and instructions are listed in Zilog syntax.
+
+Usage:
+    python3 -m emu80.blocks run <image> <input>... [--altair] [--z80] [--blk FILE]
+                                [--prefix TEXT] [--suffix TEXT] [--new]
+                                [--limit N] [--dir DIR]
+    python3 -m emu80.blocks merge <out.blk> <in.blk>...
+    python3 -m emu80.blocks summary <blk> [--sym FILE] [--src DIR]
+                                    [--top N] [--label NAME,...] [-o FILE]
+
+    python3 -m emu80.blocks run mbasic_521/out/mbasic_go.com bench.txt --blk 521.blk
+    python3 -m emu80.blocks summary 521.blk --sym mbasic_521/out/mbasic_go.sym \\
+        --label chrgtr,garba2
+"""
+
+import os
+import sys
+import struct
+import shutil
+import argparse
+import tempfile
+
+from .cpu import CYCLES
+from .z80 import Z80, instruction_entry
+from .cpm import CPM
+from .altair import Altair
+from .trace import _encoded
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'mbasic_521', 'utils'))
+from symtab import load_symbols                     # noqa: E402
+from i8080 import MNEMONIC, format_instruction      # noqa: E402
+import z80 as z80_decoder                           # noqa: E402
+
+
+MAGIC = b'EMU80BLK'
+VERSION = 2
+SIZE = 0x10000
+SYSTEM = '<system>'
+
+HEADER = struct.Struct('<BIQHHB')       # version, runs, instructions, origin, image end, Z80
+RECORD = struct.Struct('<HB4sQQQ')      # address, length, bytes, executed, entries, taken
+
+# Instructions that may transfer control: Rcc Jcc Ccc RST, JMP CALL RET
+# and their aliases, PCHL and HLT
+ENDS = bytes(1 if (op & 0xC7) in (0xC0, 0xC2, 0xC4, 0xC7) or
+             op in (0xC3, 0xCB, 0xC9, 0xD9, 0xCD, 0xDD, 0xED, 0xFD, 0xE9, 0x76) else 0
+             for op in range(256))
+
+# On the Z80, CB DD ED FD are prefixes and D9 is EXX, and JR/DJNZ branch
+Z80_ENDS = bytes(0 if op in (0xCB, 0xD9, 0xDD, 0xED, 0xFD) else
+                 1 if op in (0x10, 0x18, 0x20, 0x28, 0x30, 0x38) else ENDS[op]
+                 for op in range(256))
+
+# Branches the Z80 can encode as JR: JP, JP NZ, JP Z, JP NC, JP C
+JR_OPS = (0xC3, 0xC2, 0xCA, 0xD2, 0xDA)
+JP_CYCLES = 10
+JR_TAKEN = 12
+JR_NOT_TAKEN = 7
+
+# LAST holds the address after the previous instruction, its address and
+# whether it could branch; a TAKEN index of SIZE absorbs the first entry
+PROLOGUE = '''COUNT_AT[pc] += 1
+OPS[{op}] += 1
+if pc != LAST[0]:
+    ENTRIES[pc] += 1
+    TAKEN[LAST[1]] += 1
+elif LAST[2]:
+    ENTRIES[pc] += 1
+LAST[0] = PC
+LAST[1] = pc
+LAST[2] = ENDS[{op}]'''
+
+
+class Counts:
+    """Execution, block-entry and taken counts of one or more runs."""
+
+    def __init__(self):
+        self.executed = [0] * SIZE
+        self.entries = [0] * SIZE
+        self.taken = [0] * SIZE
+        self.code = {}                  # address -> instruction bytes
+        self.ops = [0] * 256
+        self.runs = 0
+        self.origin = 0
+        self.end = SIZE
+        self.z80 = False
+
+    @property
+    def instructions(self):
+        return sum(self.ops)
+
+    def merge(self, other):
+        for name in ('executed', 'entries', 'taken'):
+            mine, theirs = getattr(self, name), getattr(other, name)
+            for addr in range(SIZE):
+                if theirs[addr]:
+                    mine[addr] += theirs[addr]
+        for addr, code in other.code.items():
+            self.code.setdefault(addr, code)
+        for op in range(256):
+            self.ops[op] += other.ops[op]
+        if not self.runs:
+            self.origin, self.end, self.z80 = other.origin, other.end, other.z80
+        self.runs += other.runs
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(MAGIC + HEADER.pack(VERSION, self.runs, self.instructions,
+                                        self.origin, min(self.end, 0xFFFF), self.z80))
+            f.write(struct.pack('<256Q', *self.ops))
+            addrs = sorted(self.code)
+            f.write(struct.pack('<I', len(addrs)))
+            for addr in addrs:
+                code = self.code[addr]
+                f.write(RECORD.pack(addr, len(code), code, self.executed[addr],
+                                    self.entries[addr], self.taken[addr]))
+
+    @classmethod
+    def load(cls, path):
+        counts = cls()
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path}: not a block count file")
+        pos = len(MAGIC)
+        version, counts.runs, _, counts.origin, counts.end, z80 = HEADER.unpack_from(data, pos)
+        counts.z80 = bool(z80)
+        if version != VERSION:
+            raise ValueError(f"{path}: block count version {version}, expected {VERSION}")
+        pos += HEADER.size
+        counts.ops = list(struct.unpack_from('<256Q', data, pos))
+        pos += 256 * 8
+        n, = struct.unpack_from('<I', data, pos)
+        pos += 4
+        for _ in range(n):
+            addr, length, code, executed, entries, taken = RECORD.unpack_from(data, pos)
+            pos += RECORD.size
+            counts.code[addr] = code[:length]
+            counts.executed[addr] = executed
+            counts.entries[addr] = entries
+            counts.taken[addr] = taken
+        return counts
+
+
+class BlockCounter:
+    """Counts instructions and block entries of the machine attached to it."""
+
+    def __init__(self):
+        self.count_at = [0] * SIZE
+        self.entries = [0] * SIZE
+        self.taken = [0] * (SIZE + 1)
+        self.ops = [0] * 256
+        self.last = [-1, SIZE, 0]
+        self.cpu = None
+        self.env = {'COUNT_AT': self.count_at, 'OPS': self.ops, 'ENTRIES': self.entries,
+                    'TAKEN': self.taken, 'LAST': self.last}
+
+    def attach(self, machine):
+        cpu = machine.cpu
+        ends = Z80_ENDS if isinstance(cpu, Z80) else ENDS
+        cpu.handlers = cpu.compile_handlers({}, dict(self.env, ENDS=ends), prologue=PROLOGUE)
+        self.cpu = cpu
+        return machine
+
+    def result(self, origin=0, end=SIZE):
+        """Return the counts recorded so far as a one-run Counts.
+
+        Instruction bytes are read from memory as it is now, so an
+        address whose code was overwritten shows the last version.
+        """
+        counts = Counts()
+        mem = self.cpu.mem
+        for addr in range(SIZE):
+            n = self.count_at[addr]
+            if n:
+                counts.executed[addr] = n
+                counts.entries[addr] = self.entries[addr]
+                counts.taken[addr] = self.taken[addr]
+                length = self.cpu.length_at(addr)
+                counts.code[addr] = bytes(mem[(addr + k) & 0xFFFF] for k in range(length))
+        counts.ops = list(self.ops)
+        counts.runs = 1
+        counts.origin, counts.end = origin, end
+        counts.z80 = isinstance(self.cpu, Z80)
+        return counts
+
+
+def _operand(code):
+    if len(code) == 3:
+        return code[1] | (code[2] << 8)
+    return code[1] if len(code) == 2 else -1
+
+
+def _text(counts, addr):
+    code = counts.code[addr]
+    if counts.z80:
+        return z80_decoder.format_instruction(code, 0, origin=addr)
+    return format_instruction(code[0], _operand(code))
+
+
+def _cycles(counts, code):
+    """T-states of an instruction from the static table, branches untaken."""
+    return instruction_entry(code, 0)[3] if counts.z80 else CYCLES[code[0]]
+
+
+def _op_name(counts, op):
+    if not counts.z80:
+        return MNEMONIC[op].rstrip(',')
+    entry = z80_decoder.TABLES[0][op]
+    if entry is None:
+        return f'{op:02X} prefix'
+    return entry[0].replace('{nn}', 'nn').replace('{n}', 'n').replace('{e}', 'e')
+
+
+def blocks(counts):
+    """Yield (start, [addresses], entries) of every executed basic block."""
+    ends = Z80_ENDS if counts.z80 else ENDS
+    for start in sorted(a for a in counts.code if counts.entries[a]):
+        addrs = []
+        addr = start
+        while addr in counts.code:
+            if addrs and counts.entries[addr]:
+                break
+            addrs.append(addr)
+            code = counts.code[addr]
+            if ends[code[0]]:
+                break
+            addr += len(code)
+        yield start, addrs, counts.entries[start]
+
+
+def jr_candidates(counts):
+    """Executed JMP/JZ/JNZ/JC/JNC sites with their target in JR range.
+
+    Returns (address, executed, taken, displacement, T-state change) tuples;
+    the change is what JR costs over JP (negative is a saving).
+    """
+    result = []
+    for addr, code in counts.code.items():
+        if code[0] not in JR_OPS or not counts.executed[addr]:
+            continue
+        displacement = _operand(code) - (addr + 2)
+        if not -128 <= displacement <= 127:
+            continue
+        executed, taken = counts.executed[addr], counts.taken[addr]
+        change = (taken * JR_TAKEN + (executed - taken) * JR_NOT_TAKEN) - executed * JP_CYCLES
+        result.append((addr, executed, taken, displacement, change))
+    return result
+
+
+class Summary:
+    """Block counts folded onto the labels of a symbol table."""
+
+    def __init__(self, counts, syms=None):
+        self.counts = counts
+        self.syms = syms
+
+    def name(self, addr):
+        if addr >= self.counts.end:
+            return SYSTEM
+        hit = self.syms.lookup(addr) if self.syms is not None else None
+        return hit[0] if hit else f'{addr:04X}'
+
+    def where(self, addr):
+        if addr >= self.counts.end:
+            return SYSTEM
+        return self.syms.describe(addr) if self.syms is not None else f'{addr:04X}'
+
+    def routines(self):
+        """Return {label: {instructions, cycles, blocks, ops}} sorted by cycles."""
+        routines = {}
+        for addr, code in self.counts.code.items():
+            n = self.counts.executed[addr]
+            r = routines.setdefault(self.name(addr), {'instructions': 0, 'cycles': 0,
+                                                      'blocks': 0, 'ops': {}})
+            r['instructions'] += n
+            r['cycles'] += n * _cycles(self.counts, code)
+            r['blocks'] += 1 if self.counts.entries[addr] else 0
+            r['ops'][code[0]] = r['ops'].get(code[0], 0) + n
+        return dict(sorted(routines.items(), key=lambda kv: -kv[1]['cycles']))
+
+    def hot_blocks(self):
+        """Return (cycles, start, addrs, entries) of every block, hottest first."""
+        counts = self.counts
+        result = []
+        for start, addrs, entries in blocks(counts):
+            cycles = sum(counts.executed[a] * _cycles(counts, counts.code[a]) for a in addrs)
+            result.append((cycles, start, addrs, entries))
+        result.sort(key=lambda b: -b[0])
+        return result
+
+
+def _percent(part, whole):
+    return 100.0 * part / whole if whole else 0.0
+
+
+def print_summary(summary, top=30, labels=(), out=sys.stdout):
+    counts = summary.counts
+    total = counts.instructions
+    cycles = sum(counts.executed[a] * _cycles(counts, c) for a, c in counts.code.items())
+    print(f"{counts.runs} runs: {total} instructions, about {cycles} T-states "
+          f"(conditional CALL/RET counted untaken), {len(counts.code)} addresses executed",
+          file=out)
+
+    print(file=out)
+    print("Opcode histogram", file=out)
+    ranked = sorted(range(256), key=lambda op: -counts.ops[op])
+    for op in ranked[:top]:
+        if counts.ops[op]:
+            print(f"  {op:02X}  {_op_name(counts, op):10} {counts.ops[op]:12d} "
+                  f"{_percent(counts.ops[op], total):6.2f}%", file=out)
+
+    print(file=out)
+    print("Hottest basic blocks (T-states from the static table)", file=out)
+    print(f"  {'cycles':>12} {'entries':>10} {'instrs':>6}  block", file=out)
+    for block_cycles, start, addrs, entries in summary.hot_blocks()[:top]:
+        last = addrs[-1]
+        print(f"  {block_cycles:12d} {entries:10d} {len(addrs):6d}  {start:04X}-{last:04X} "
+              f"{summary.where(start)}  ..{_text(counts, last)}", file=out)
+
+    print(file=out)
+    print("Routines", file=out)
+    print(f"  {'cycles':>12} {'instrs':>12} {'blocks':>6}  label  (commonest opcodes)", file=out)
+    for name, r in list(summary.routines().items())[:top]:
+        common = sorted(r['ops'].items(), key=lambda kv: -kv[1])[:3]
+        ops = ', '.join(f"{_op_name(counts, op)} {_percent(n, r['instructions']):.0f}%"
+                        for op, n in common)
+        print(f"  {r['cycles']:12d} {r['instructions']:12d} {r['blocks']:6d}  {name}  ({ops})",
+              file=out)
+
+    for label in labels:
+        print(file=out)
+        addrs = sorted(a for a in counts.code if summary.name(a).lower() == label.lower())
+        if not addrs:
+            print(f"{label}: not executed or not a label", file=out)
+            continue
+        print(f"{label}", file=out)
+        for addr in addrs:
+            code = counts.code[addr]
+            mark = '>' if counts.entries[addr] else ' '
+            ends = Z80_ENDS if counts.z80 else ENDS
+            taken = f"  taken {counts.taken[addr]}" if ends[code[0]] else ''
+            print(f"  {mark} {addr:04X} {summary.where(addr):16} {_text(counts, addr):16} "
+                  f"{counts.executed[addr]:12d}{taken}", file=out)
+
+    candidates = [c for c in jr_candidates(counts) if c[0] < counts.end]
+    print(file=out)
+    saving = sum(c[4] for c in candidates if c[4] < 0)
+    print(f"JP->JR candidates: {len(candidates)} executed branches in range, "
+          f"{-saving} T-states saved by converting those where JR is faster", file=out)
+    print(f"  {'executed':>12} {'taken':>12} {'disp':>5} {'change':>10}  branch", file=out)
+    for addr, executed, taken, displacement, change in sorted(candidates,
+                                                              key=lambda c: -c[1])[:top]:
+        print(f"  {executed:12d} {taken:12d} {displacement:+5d} {change:+10d}  "
+              f"{addr:04X} {summary.where(addr):16} {_text(counts, addr)}", file=out)
+
+
+def count_runs(image, inputs, altair=False, prefix='', suffix='', limit=None, directory=None,
+               z80=False):
+    """Run image once per input file under a BlockCounter; yield (input, stop, Counts)."""
+    origin = 0 if altair else 0x100
+    for path in inputs:
+        with open(path, 'r', errors='replace') as f:
+            script = prefix + f.read() + suffix
+        with tempfile.TemporaryDirectory(prefix='blocks_') as tmp:
+            cpu = Z80() if z80 else None
+            if altair:
+                machine = Altair(image, cpu=cpu)
+            else:
+                if directory:
+                    shutil.copytree(directory, tmp, dirs_exist_ok=True)
+                machine = CPM(image, directory=tmp, cpu=cpu)
+            counter = BlockCounter()
+            counter.attach(machine)
+            machine.feed(script)
+            stop = machine.run(limit)
+        yield path, stop, counter.result(origin, origin + len(image))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python3 -m emu80.blocks',
+                                     description='Basic-block counts and opcode histograms')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('run', help='Run input scripts and add their counts to a .blk file')
+    p.add_argument('image', help='Image to run (.COM, or a bare image with --altair)')
+    p.add_argument('inputs', nargs='+', help='Console input files, one run each')
+    p.add_argument('--altair', action='store_true', help='Run as an Altair image loaded at 0')
+    p.add_argument('--z80', action='store_true', help='Run on the Z80 core')
+    p.add_argument('--blk', default='emu80.blk', help='Count file to add to (default: emu80.blk)')
+    p.add_argument('--new', action='store_true', help='Start a new count file instead of adding')
+    p.add_argument('--prefix', default='', help='Text sent before each input, \\n for newline')
+    p.add_argument('--suffix', default='', help='Text sent after each input, e.g. RUN\\n')
+    p.add_argument('--limit', type=int, help='Stop each run after this many instructions')
+    p.add_argument('--dir', help='Directory copied to drive A: of each CP/M run')
+
+    p = sub.add_parser('merge', help='Add count files together')
+    p.add_argument('output', help='Merged count file')
+    p.add_argument('counts', nargs='+', help='Count files to merge')
+
+    p = sub.add_parser('summary', help='Print the counts by label')
+    p.add_argument('blk', help='Count file')
+    p.add_argument('--sym', help='Symbol file')
+    p.add_argument('--src', help='Source directory, for module names of labels')
+    p.add_argument('--top', type=int, default=30, help='Entries per table (default: 30)')
+    p.add_argument('--label', default='', help='Comma-separated labels to list instruction by instruction')
+    p.add_argument('-o', '--output', help='Summary file (default: stdout)')
+
+    args = parser.parse_args()
+
+    if args.command == 'merge':
+        merged = Counts()
+        for path in args.counts:
+            merged.merge(Counts.load(path))
+        merged.save(args.output)
+        print(f"{args.output}: {merged.runs} runs, {merged.instructions} instructions")
+        return 0
+
+    if args.command == 'summary':
+        counts = Counts.load(args.blk)
+        syms = load_symbols(args.sym, args.src, min_addr=counts.origin) if args.sym else None
+        labels = [name.strip() for name in args.label.split(',') if name.strip()]
+        if args.output:
+            with open(args.output, 'w') as f:
+                print_summary(Summary(counts, syms), args.top, labels, f)
+        else:
+            print_summary(Summary(counts, syms), args.top, labels)
+        return 0
+
+    with open(args.image, 'rb') as f:
+        image = f.read()
+    counts = Counts()
+    if os.path.exists(args.blk) and not args.new:
+        counts = Counts.load(args.blk)
+    for path, stop, run in count_runs(image, args.inputs, args.altair, _encoded(args.prefix),
+                                      _encoded(args.suffix), args.limit, args.dir, args.z80):
+        counts.merge(run)
+        print(f"{path}: stopped with '{stop}', {run.instructions} instructions, "
+              f"{sum(1 for a in run.code if run.entries[a])} blocks")
+    counts.save(args.blk)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,464 @@
+"""
+cpm.py - Minimal CP/M 2.2 machine for running .COM files headless
+
+The BDOS entry (location 5) and the BIOS jump table hold HLT instructions
+at trap addresses; when the CPU halts on one, the matching Python handler
+runs and the machine returns to the caller as if the routine had executed
+a RET.  The console reads from an input queue and writes to an output
+buffer, and files are mapped one to one onto a host directory.
+
+    console     BDOS 1, 2, 6, 9, 10, 11 and BIOS CONST, CONIN, CONOUT, LIST
+    files       open, close, search, delete, make, rename, sequential and
+                random read/write, file size, set random record
+    disks       a single drive; select/reset/login calls are accepted
+
+Usage:
+    from emu80.cpm import CPM
+    machine = CPM(open('mbasic.com', 'rb').read(), directory='work')
+    machine.feed('PRINT 2+2\\nSYSTEM\\n')
+    machine.run()
+    print(machine.output_text())
+"""
+
+import os
+
+from .machine import Machine, InputNeeded, HLT, STOP_EXIT, STOP_HALT
+
+
+
+# Memory layout of a 64K system
+BDOS_ENTRY = 0xEC06
+BIOS_BASE = 0xFA00
+BIOS_TRAPS = 0xFA80
+BIOS_ENTRIES = 17
+
+TPA = 0x100
+DEFAULT_FCB = 0x5C
+DEFAULT_DMA = 0x80
+
+RECORD = 128
+EOF_BYTE = 0x1A
+
+class CPM(Machine):
+    """A CP/M 2.2 machine: CPU, memory image, console and file system."""
+
+    def __init__(self, image, args='', directory='.', cpu=None, typeahead=False):
+        super().__init__(cpu, typeahead)
+        self.directory = directory
+        self.printer = bytearray()
+        self.dma = DEFAULT_DMA
+        self.search = []
+        self.exit_code = None
+        self._install(image, args)
+
+    # Memory setup
+
+    def _install(self, image, args):
+        mem = self.mem
+        mem[TPA:TPA + len(image)] = image
+        # Warm boot vector at 0 points at the BIOS WBOOT entry; BDOS at 5
+        mem[0:3] = bytes((0xC3, (BIOS_BASE + 3) & 0xFF, (BIOS_BASE + 3) >> 8))
+        mem[5:8] = bytes((0xC3, BDOS_ENTRY & 0xFF, BDOS_ENTRY >> 8))
+        mem[BDOS_ENTRY] = HLT
+        self.traps[BDOS_ENTRY] = self._bdos
+        bios = [self._boot, self._wboot, self._const, self._conin, self._conout,
+                self._list, self._conout, self._reader]
+        for i in range(BIOS_ENTRIES):
+            trap = BIOS_TRAPS + i
+            entry = BIOS_BASE + 3 * i
+            mem[entry:entry + 3] = bytes((0xC3, trap & 0xFF, trap >> 8))
+            mem[trap] = HLT
+            self.traps[trap] = bios[i] if i < len(bios) else self._nothing
+
+        tail = (' ' + args.upper()) if args else ''
+        tail = tail.encode('ascii')[:RECORD - 2]
+        mem[DEFAULT_DMA] = len(tail)
+        mem[DEFAULT_DMA + 1:DEFAULT_DMA + 1 + len(tail)] = tail
+        mem[DEFAULT_DMA + 1 + len(tail)] = 0
+        words = args.split()
+        self._parse_fcb(DEFAULT_FCB, words[0] if words else '')
+        self._parse_fcb(DEFAULT_FCB + 16, words[1] if len(words) > 1 else '')
+
+        cpu = self.cpu
+        cpu.pc = TPA
+        cpu.sp = BDOS_ENTRY - 6
+        cpu.sp = (cpu.sp - 2) & 0xFFFF          # return address 0 = warm boot
+        mem[cpu.sp] = mem[cpu.sp + 1] = 0
+
+    def _parse_fcb(self, addr, name):
+        mem = self.mem
+        mem[addr:addr + 16] = bytes(16)
+        name = name.upper()
+        if len(name) > 1 and name[1] == ':':
+            mem[addr] = ord(name[0]) - ord('A') + 1
+            name = name[2:]
+        base, _, ext = name.partition('.')
+        mem[addr + 1:addr + 9] = base[:8].ljust(8).encode('ascii', 'replace')
+        mem[addr + 9:addr + 12] = ext[:3].ljust(3).encode('ascii', 'replace')
+
+    # Traps
+
+    def trap(self, addr):
+        """Run the BDOS or BIOS routine trapped at addr, then return from it."""
+        handler = self.traps.get(addr)
+        if handler is None:
+            return STOP_HALT
+        stop = handler()
+        if not stop:
+            self._ret()
+        return stop
+
+    def _ret(self):
+        cpu = self.cpu
+        mem = self.mem
+        cpu.pc = mem[cpu.sp] | (mem[(cpu.sp + 1) & 0xFFFF] << 8)
+        cpu.sp = (cpu.sp + 2) & 0xFFFF
+
+    def _result(self, value):
+        """Return value in A and L, and its high byte in B and H, as the BDOS does."""
+        cpu = self.cpu
+        cpu.a = cpu.l = value & 0xFF
+        cpu.b = cpu.h = (value >> 8) & 0xFF
+
+    # Console
+
+    def _status(self):
+        return 0xFF if self.typeahead and self.input else 0
+
+    # BIOS
+
+    def _boot(self):
+        return self._wboot()
+
+    def _wboot(self):
+        self.exit_code = 0
+        return STOP_EXIT
+
+    def _const(self):
+        self.cpu.a = self._status()
+
+    def _conin(self):
+        self.cpu.a = self._getc()
+
+    def _conout(self):
+        self._putc(self.cpu.c)
+
+    def _list(self):
+        self.printer.append(self.cpu.c)
+
+    def _reader(self):
+        self.cpu.a = EOF_BYTE
+
+    def _nothing(self):
+        self.cpu.a = 0
+
+    # BDOS
+
+    def _bdos(self):
+        cpu = self.cpu
+        func = cpu.c
+        de = (cpu.d << 8) | cpu.e
+        handler = BDOS_FUNCTIONS.get(func)
+        if handler is None:
+            self._result(0)
+            return None
+        stop = handler(self, de)
+        # Calls write at most the FCB or line buffer at DE and the DMA record
+        cpu.invalidate(de, de + 0x102)
+        cpu.invalidate(self.dma, self.dma + RECORD)
+        return stop
+
+    def _bdos_reset(self, de):
+        return self._wboot()
+
+    def _bdos_conin(self, de):
+        c = self._getc()
+        self._putc(c)
+        self._result(c)
+
+    def _bdos_conout(self, de):
+        self._putc(de & 0xFF)
+        self._result(0)
+
+    def _bdos_list(self, de):
+        self.printer.append(de & 0xFF)
+        self._result(0)
+
+    def _bdos_direct(self, de):
+        e = de & 0xFF
+        if e == 0xFF:
+            self._result(self._getc() if self.input else 0)
+        elif e == 0xFE:
+            self._result(self._status())
+        else:
+            self._putc(e)
+            self._result(0)
+
+    def _bdos_print(self, de):
+        mem = self.mem
+        while mem[de] != ord('$'):
+            self._putc(mem[de])
+            de = (de + 1) & 0xFFFF
+        self._result(0)
+
+    def _bdos_readline(self, de):
+        mem = self.mem
+        size = mem[de]
+        if b'\r' not in self.input and len(self.input) < size:
+            raise InputNeeded
+        line = bytearray()
+        while len(line) < size:
+            c = self._getc()
+            if c == 0x0D:
+                break
+            line.append(c)
+            self._putc(c)
+        self._putc(0x0D)
+        self._putc(0x0A)
+        mem[de + 1] = len(line)
+        mem[de + 2:de + 2 + len(line)] = line
+        self._result(0)
+
+    def _bdos_status(self, de):
+        self._result(self._status())
+
+    def _bdos_version(self, de):
+        self._result(0x22)
+
+    def _bdos_zero(self, de):
+        self._result(0)
+
+    def _bdos_login(self, de):
+        self._result(1)
+
+    def _bdos_setdma(self, de):
+        self.dma = de
+        self._result(0)
+
+    # Files
+
+    def _fcb_name(self, fcb):
+        """Return (base, ext) of an FCB, stripped of attribute bits."""
+        raw = bytes(b & 0x7F for b in self.mem[fcb + 1:fcb + 12])
+        text = raw.decode('ascii', 'replace')
+        return text[:8].rstrip(), text[8:].rstrip()
+
+    def _host_files(self):
+        try:
+            return sorted(f for f in os.listdir(self.directory)
+                          if os.path.isfile(os.path.join(self.directory, f)))
+        except OSError:
+            return []
+
+    def _find(self, fcb):
+        """Return the host path of the file an FCB names, or None."""
+        base, ext = self._fcb_name(fcb)
+        want = f'{base}.{ext}' if ext else base
+        for name in self._host_files():
+            if name.upper() == want:
+                return os.path.join(self.directory, name)
+        return None
+
+    def _matches(self, fcb):
+        """Return host names matching an FCB, with ? wildcards."""
+        raw = bytes(b & 0x7F for b in self.mem[fcb + 1:fcb + 12]).decode('ascii', 'replace')
+        pattern = raw[:8] + raw[8:]
+        out = []
+        for name in self._host_files():
+            base, _, ext = name.upper().partition('.')
+            if len(base) > 8 or len(ext) > 3:
+                continue
+            padded = base.ljust(8) + ext.ljust(3)
+            if all(p == '?' or p == c for p, c in zip(pattern, padded)):
+                out.append(name)
+        return out
+
+    @staticmethod
+    def _record(ex, cr, s2=0):
+        return ((s2 & 0x3F) << 12) | ((ex & 0x1F) << 7) | (cr & 0x7F)
+
+    def _set_position(self, fcb, record):
+        mem = self.mem
+        mem[fcb + 32] = record & 0x7F
+        mem[fcb + 12] = (record >> 7) & 0x1F
+        mem[fcb + 14] = (record >> 12) & 0x3F
+
+    def _set_extent_size(self, fcb, path):
+        """Set the record count (RC) of the FCB's current extent."""
+        mem = self.mem
+        records = (os.path.getsize(path) + RECORD - 1) // RECORD
+        extent = ((mem[fcb + 14] & 0x3F) << 5) | (mem[fcb + 12] & 0x1F)
+        mem[fcb + 15] = max(0, min(RECORD, records - extent * RECORD))
+
+    def _bdos_open(self, de):
+        path = self._find(de)
+        if path is None:
+            self._result(0xFF)
+            return
+        self.mem[de + 14] = 0
+        self._set_extent_size(de, path)
+        self._result(0)
+
+    def _bdos_close(self, de):
+        self._result(0 if self._find(de) else 0xFF)
+
+    def _dir_entry(self, name):
+        """Write a directory entry for host file name into the DMA buffer."""
+        mem = self.mem
+        base, _, ext = name.upper().partition('.')
+        entry = bytearray(32)
+        entry[1:9] = base.ljust(8).encode('ascii', 'replace')
+        entry[9:12] = ext.ljust(3).encode('ascii', 'replace')
+        records = (os.path.getsize(os.path.join(self.directory, name)) + RECORD - 1) // RECORD
+        entry[12] = min(records // RECORD, 0x1F)
+        entry[15] = min(records, RECORD) if records <= RECORD else records % RECORD or RECORD
+        mem[self.dma:self.dma + 32] = entry
+        mem[self.dma + 32:self.dma + RECORD] = bytes([0xE5]) * (RECORD - 32)
+
+    def _bdos_search_first(self, de):
+        self.search = self._matches(de)
+        self._bdos_search_next(de)
+
+    def _bdos_search_next(self, de):
+        if not self.search:
+            self._result(0xFF)
+            return
+        self._dir_entry(self.search.pop(0))
+        self._result(0)
+
+    def _bdos_delete(self, de):
+        names = self._matches(de)
+        for name in names:
+            os.remove(os.path.join(self.directory, name))
+        self._result(0 if names else 0xFF)
+
+    def _read(self, de, record):
+        path = self._find(de)
+        if path is None:
+            return 0xFF
+        with open(path, 'rb') as f:
+            f.seek(record * RECORD)
+            data = f.read(RECORD)
+        if not data:
+            return 1
+        self.mem[self.dma:self.dma + RECORD] = data.ljust(RECORD, bytes((EOF_BYTE,)))
+        return 0
+
+    def _write(self, de, record):
+        path = self._find(de)
+        if path is None:
+            return 0xFF
+        with open(path, 'r+b') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < record * RECORD:
+                f.write(bytes(record * RECORD - f.tell()))
+            f.seek(record * RECORD)
+            f.write(self.mem[self.dma:self.dma + RECORD])
+        return 0
+
+    def _bdos_read_seq(self, de):
+        mem = self.mem
+        record = self._record(mem[de + 12], mem[de + 32], mem[de + 14])
+        status = self._read(de, record)
+        if status == 0:
+            self._set_position(de, record + 1)
+            self._set_extent_size(de, self._find(de))
+        self._result(status)
+
+    def _bdos_write_seq(self, de):
+        mem = self.mem
+        record = self._record(mem[de + 12], mem[de + 32], mem[de + 14])
+        status = self._write(de, record)
+        if status == 0:
+            self._set_position(de, record + 1)
+            self._set_extent_size(de, self._find(de))
+        self._result(status)
+
+    def _bdos_make(self, de):
+        base, ext = self._fcb_name(de)
+        name = f'{base}.{ext}' if ext else base
+        if not base:
+            self._result(0xFF)
+            return
+        path = self._find(de) or os.path.join(self.directory, name)
+        open(path, 'wb').close()
+        mem = self.mem
+        mem[de + 12] = mem[de + 14] = mem[de + 15] = mem[de + 32] = 0
+        self._result(0)
+
+    def _bdos_rename(self, de):
+        path = self._find(de)
+        base, ext = self._fcb_name(de + 16)
+        if path is None or not base:
+            self._result(0xFF)
+            return
+        os.replace(path, os.path.join(self.directory, f'{base}.{ext}' if ext else base))
+        self._result(0)
+
+    def _random_record(self, de):
+        mem = self.mem
+        return mem[de + 33] | (mem[de + 34] << 8) | ((mem[de + 35] & 3) << 16)
+
+    def _bdos_read_random(self, de):
+        record = self._random_record(de)
+        status = self._read(de, record)
+        if status == 0:
+            self._set_position(de, record)
+        self._result(6 if status == 1 else status)
+
+    def _bdos_write_random(self, de):
+        record = self._random_record(de)
+        status = self._write(de, record)
+        if status == 0:
+            self._set_position(de, record)
+        self._result(status)
+
+    def _bdos_file_size(self, de):
+        path = self._find(de)
+        records = 0 if path is None else (os.path.getsize(path) + RECORD - 1) // RECORD
+        mem = self.mem
+        mem[de + 33] = records & 0xFF
+        mem[de + 34] = (records >> 8) & 0xFF
+        mem[de + 35] = (records >> 16) & 0xFF
+        self._result(0 if path else 0xFF)
+
+    def _bdos_set_random(self, de):
+        mem = self.mem
+        record = self._record(mem[de + 12], mem[de + 32], mem[de + 14])
+        mem[de + 33] = record & 0xFF
+        mem[de + 34] = (record >> 8) & 0xFF
+        mem[de + 35] = (record >> 16) & 0xFF
+        self._result(0)
+
+
+BDOS_FUNCTIONS = {
+    0: CPM._bdos_reset,
+    1: CPM._bdos_conin,
+    2: CPM._bdos_conout,
+    5: CPM._bdos_list,
+    6: CPM._bdos_direct,
+    9: CPM._bdos_print,
+    10: CPM._bdos_readline,
+    11: CPM._bdos_status,
+    12: CPM._bdos_version,
+    13: CPM._bdos_zero,
+    14: CPM._bdos_zero,
+    15: CPM._bdos_open,
+    16: CPM._bdos_close,
+    17: CPM._bdos_search_first,
+    18: CPM._bdos_search_next,
+    19: CPM._bdos_delete,
+    20: CPM._bdos_read_seq,
+    21: CPM._bdos_write_seq,
+    22: CPM._bdos_make,
+    23: CPM._bdos_rename,
+    24: CPM._bdos_login,
+    25: CPM._bdos_zero,
+    26: CPM._bdos_setdma,
+    32: CPM._bdos_zero,
+    33: CPM._bdos_read_random,
+    34: CPM._bdos_write_random,
+    35: CPM._bdos_file_size,
+    36: CPM._bdos_set_random,
+    40: CPM._bdos_write_random,
+}
@@ -0,0 +1,468 @@
+"""
+cpu.py - Intel 8080 CPU core
+
+Every opcode is described once, as a short Python source template working
+on the registers A B C D E H L F SP as local variables:
+
+    PC          address of the next instruction (already advanced)
+    N / NN      8-bit / 16-bit operand of the instruction
+    RD(addr)    memory read
+    WR(addr, v) memory write
+
+and three hooks that cost nothing in the plain handlers: EXTRA(n) for
+the extra T-states of a taken conditional CALL or RET, CALLED(target, SP)
+after a CALL or RST has pushed its return address, and RETURNED(PC, SP)
+after a RET has popped it.
+
+At import the templates are expanded into 256 handler functions, one per
+opcode, which load the registers they use from the CPU, run the template
+and store them back.  The run loop is then a dispatch array lookup per
+instruction; flags come from the precomputed SZP table, so no handler
+branches on the opcode.  The same templates are reused by other executors
+(timing, tracing, profiling) with different expansions of the macros.
+CYCLES holds the 8080 T-states of every opcode; CPU(timed=True) uses
+handlers that add them to cpu.cycles.  z80.py builds the Z80 core on the
+same machinery (function_source() with DISP and IX/IY templates), and
+executors compile their handlers through cpu.compile_handlers() so they
+run on either.
+
+Usage:
+    from emu80.cpu import CPU
+    cpu = CPU()
+    cpu.mem[0x100:0x100 + len(image)] = image
+    cpu.pc = 0x100
+    cpu.run()
+"""
+
+import re
+
+
+# Flag bits in F (PSW low byte); bit 1 always reads as 1 on the 8080
+FLAG_S = 0x80
+FLAG_Z = 0x40
+FLAG_AC = 0x10
+FLAG_P = 0x04
+FLAG_C = 0x01
+
+# SZP[v] holds the sign, zero and parity flags for result v
+SZP = bytes((v & FLAG_S) | (FLAG_Z if v == 0 else 0) |
+            (FLAG_P if bin(v).count('1') % 2 == 0 else 0) | 0x02
+            for v in range(256))
+
+REGS = ['B', 'C', 'D', 'E', 'H', 'L', 'M', 'A']
+
+# Register names usable in templates, in load order (IX and IY are Z80 only)
+REGISTERS = ('A', 'B', 'C', 'D', 'E', 'H', 'L', 'F', 'SP', 'IX', 'IY')
+
+# Condition codes, tested against F
+CONDS = ['not F & 0x40', 'F & 0x40', 'not F & 0x01', 'F & 0x01',
+         'not F & 0x04', 'F & 0x04', 'not F & 0x80', 'F & 0x80']
+
+_HL = '((H << 8) | L)'
+_PUSH_PC = ('SP = (SP - 2) & 0xFFFF\n'
+            'WR(SP, PC & 0xFF)\n'
+            'WR((SP + 1) & 0xFFFF, PC >> 8)')
+_POP_PC = ('PC = RD(SP) | (RD((SP + 1) & 0xFFFF) << 8)\n'
+           'SP = (SP + 2) & 0xFFFF')
+_CALL = _PUSH_PC + '\nPC = NN\nCALLED(PC, SP)'
+_RET = _POP_PC + '\nRETURNED(PC, SP)'
+
+
+def _indent(body):
+    return '\n'.join('    ' + line for line in body.splitlines())
+
+
+def _get(r):
+    """Expression reading register r (M is memory at HL)."""
+    return f'RD({_HL})' if r == 'M' else r
+
+
+def _put(r, value):
+    """Statement writing value to register r."""
+    return f'WR({_HL}, {value})' if r == 'M' else f'{r} = {value}'
+
+
+def _alu(op, v):
+    """Template for ALU operation op (0-7) with operand expression v."""
+    load = f'v = {v}\n'
+    if op in (0, 1):            # ADD, ADC
+        carry = ' + (F & 1)' if op == 1 else ''
+        return load + (f'x = A + v{carry}\n'
+                       'F = SZP[x & 0xFF] | (x >> 8) | ((A ^ v ^ x) & 0x10)\n'
+                       'A = x & 0xFF')
+    if op in (2, 3, 7):         # SUB, SBB, CMP
+        borrow = ' - (F & 1)' if op == 3 else ''
+        body = (f'x = A - v{borrow}\n'
+                'F = SZP[x & 0xFF] | ((x >> 8) & 1) | (~(A ^ v ^ x) & 0x10)')
+        return load + body + ('' if op == 7 else '\nA = x & 0xFF')
+    if op == 4:                 # ANA: AC is the OR of bit 3 of the operands
+        return load + ('F = SZP[A & v] | (((A | v) & 0x08) << 1)\n'
+                       'A = A & v')
+    sym = '^' if op == 5 else '|'
+    return load + f'A = A {sym} v\nF = SZP[A]'
+
+
+def _templates():
+    """Return the source template of every opcode."""
+    t = [None] * 256
+
+    t[0x00] = ''
+    for op in range(0x08, 0x40, 8):
+        t[op] = ''                                  # undocumented NOPs
+
+    for rp, (hi, lo) in enumerate((('B', 'C'), ('D', 'E'), ('H', 'L'))):
+        base = rp << 4
+        t[base + 0x01] = f'{hi} = NN >> 8\n{lo} = NN & 0xFF'
+        t[base + 0x03] = (f'{lo} = ({lo} + 1) & 0xFF\n'
+                          f'if not {lo}:\n    {hi} = ({hi} + 1) & 0xFF')
+        t[base + 0x0B] = (f'{lo} = ({lo} - 1) & 0xFF\n'
+                          f'if {lo} == 0xFF:\n    {hi} = ({hi} - 1) & 0xFF')
+        t[base + 0x09] = (f'x = {_HL} + (({hi} << 8) | {lo})\n'
+                          'F = (F & 0xFE) | (x >> 16)\n'
+                          'H = (x >> 8) & 0xFF\nL = x & 0xFF')
+    t[0x31] = 'SP = NN'
+    t[0x33] = 'SP = (SP + 1) & 0xFFFF'
+    t[0x3B] = 'SP = (SP - 1) & 0xFFFF'
+    t[0x39] = (f'x = {_HL} + SP\n'
+               'F = (F & 0xFE) | (x >> 16)\n'
+               'H = (x >> 8) & 0xFF\nL = x & 0xFF')
+
+    t[0x02] = 'WR((B << 8) | C, A)'
+    t[0x12] = 'WR((D << 8) | E, A)'
+    t[0x0A] = 'A = RD((B << 8) | C)'
+    t[0x1A] = 'A = RD((D << 8) | E)'
+    t[0x22] = 'WR(NN, L)\nWR((NN + 1) & 0xFFFF, H)'
+    t[0x2A] = 'L = RD(NN)\nH = RD((NN + 1) & 0xFFFF)'
+    t[0x32] = 'WR(NN, A)'
+    t[0x3A] = 'A = RD(NN)'
+
+    for r in range(8):
+        reg = REGS[r]
+        t[(r << 3) | 0x04] = (f'x = ({_get(reg)} + 1) & 0xFF\n'
+                              + _put(reg, 'x') + '\n'
+                              'F = (F & 1) | SZP[x] | (0 if x & 0x0F else 0x10)')
+        t[(r << 3) | 0x05] = (f'x = ({_get(reg)} - 1) & 0xFF\n'
+                              + _put(reg, 'x') + '\n'
+                              'F = (F & 1) | SZP[x] | (0 if x & 0x0F == 0x0F else 0x10)')
+        t[(r << 3) | 0x06] = _put(reg, 'N')
+
+    t[0x07] = 'A = ((A << 1) | (A >> 7)) & 0xFF\nF = (F & 0xFE) | (A & 1)'
+    t[0x0F] = 'F = (F & 0xFE) | (A & 1)\nA = ((A >> 1) | (A << 7)) & 0xFF'
+    t[0x17] = 'x = (A << 1) | (F & 1)\nF = (F & 0xFE) | (x >> 8)\nA = x & 0xFF'
+    t[0x1F] = 'x = A | ((F & 1) << 8)\nF = (F & 0xFE) | (A & 1)\nA = x >> 1'
+    t[0x27] = ('v = 0\nx = F & 1\n'
+               'if (A & 0x0F) > 9 or F & 0x10:\n    v = 0x06\n'
+               'if A > 0x99 or x:\n    v |= 0x60\n    x = 1\n'
+               'y = A + v\n'
+               'F = SZP[y & 0xFF] | x | ((A ^ v ^ y) & 0x10)\n'
+               'A = y & 0xFF')
+    t[0x2F] = 'A ^= 0xFF'
+    t[0x37] = 'F |= 1'
+    t[0x3F] = 'F ^= 1'
+
+    for op in range(0x40, 0x80):
+        t[op] = _put(REGS[(op >> 3) & 7], _get(REGS[op & 7]))
+    t[0x76] = 'cpu.halted = True'
+
+    for op in range(0x80, 0xC0):
+        t[op] = _alu((op >> 3) & 7, _get(REGS[op & 7]))
+
+    for cc in range(8):
+        base = 0xC0 | (cc << 3)
+        cond = CONDS[cc]
+        t[base + 0] = f'if {cond}:\n' + _indent('EXTRA(6)\n' + _RET)
+        t[base + 2] = f'if {cond}:\n    PC = NN'
+        t[base + 4] = f'if {cond}:\n' + _indent('EXTRA(6)\n' + _CALL)
+        t[base + 6] = _alu(cc, 'N')
+        t[base + 7] = _PUSH_PC + f'\nPC = 0x{cc << 3:02X}\nCALLED(PC, SP)'
+
+    for rp, (hi, lo) in enumerate((('B', 'C'), ('D', 'E'), ('H', 'L'))):
+        t[0xC1 + (rp << 4)] = (f'{lo} = RD(SP)\n{hi} = RD((SP + 1) & 0xFFFF)\n'
+                               'SP = (SP + 2) & 0xFFFF')
+        t[0xC5 + (rp << 4)] = (f'SP = (SP - 2) & 0xFFFF\n'
+                               f'WR(SP, {lo})\nWR((SP + 1) & 0xFFFF, {hi})')
+    t[0xF1] = ('F = (RD(SP) & 0xD5) | 0x02\nA = RD((SP + 1) & 0xFFFF)\n'
+               'SP = (SP + 2) & 0xFFFF')
+    t[0xF5] = 'SP = (SP - 2) & 0xFFFF\nWR(SP, F)\nWR((SP + 1) & 0xFFFF, A)'
+
+    t[0xC3] = t[0xCB] = 'PC = NN'
+    t[0xC9] = t[0xD9] = _RET
+    t[0xCD] = t[0xDD] = t[0xED] = t[0xFD] = _CALL
+    t[0xD3] = 'cpu.port_out(N, A)'
+    t[0xDB] = 'A = cpu.port_in(N) & 0xFF'
+    t[0xE3] = ('x = RD(SP)\nWR(SP, L)\nL = x\n'
+               'x = RD((SP + 1) & 0xFFFF)\nWR((SP + 1) & 0xFFFF, H)\nH = x')
+    t[0xE9] = f'PC = {_HL}'
+    t[0xEB] = 'x = D\nD = H\nH = x\nx = E\nE = L\nL = x'
+    t[0xF3] = 'cpu.inte = False'
+    t[0xFB] = 'cpu.inte = True'
+    t[0xF9] = f'SP = {_HL}'
+    return t
+
+
+TEMPLATES = _templates()
+
+_REG_RE = re.compile(r'\b(A|B|C|D|E|H|L|F|SP|IX|IY)\b')
+_ASSIGN_RE = re.compile(r'\b(A|B|C|D|E|H|L|F|SP|IX|IY)\s*[|^&+-]?=(?!=)')
+_NN_RE = re.compile(r'\bNN\b')
+_N_RE = re.compile(r'\bN\b')
+
+# LENGTH[op] is the instruction length implied by its template
+LENGTH = bytes(3 if _NN_RE.search(t) else 2 if _N_RE.search(t) else 1 for t in TEMPLATES)
+
+
+def _cycles():
+    """Return the 8080 T-states of every opcode.
+
+    Conditional CALL and RET are listed untaken; EXTRA(6) in their
+    templates adds the difference when the condition holds.
+    """
+    c = [4] * 256                                   # NOP, rotates, ALU r, ...
+    for rp in range(4):
+        base = rp << 4
+        c[base + 0x01] = 10                         # LXI
+        c[base + 0x03] = c[base + 0x0B] = 5         # INX, DCX
+        c[base + 0x09] = 10                         # DAD
+    c[0x02] = c[0x12] = c[0x0A] = c[0x1A] = 7       # STAX, LDAX
+    c[0x22] = c[0x2A] = 16                          # SHLD, LHLD
+    c[0x32] = c[0x3A] = 13                          # STA, LDA
+    for r in range(8):
+        memory = r == 6
+        c[(r << 3) | 0x04] = c[(r << 3) | 0x05] = 10 if memory else 5
+        c[(r << 3) | 0x06] = 10 if memory else 7
+    for op in range(0x40, 0x80):
+        c[op] = 7 if op & 7 == 6 or (op >> 3) & 7 == 6 else 5
+    c[0x76] = 7                                     # HLT
+    for op in range(0x80, 0xC0):
+        c[op] = 7 if op & 7 == 6 else 4
+    for cc in range(8):
+        base = 0xC0 | (cc << 3)
+        c[base + 0] = 5                             # Rcc (11 taken)
+        c[base + 2] = 10                            # Jcc
+        c[base + 4] = 11                            # Ccc (17 taken)
+        c[base + 6] = 7                             # ALU immediate
+        c[base + 7] = 11                            # RST
+    for rp in range(4):
+        c[0xC1 + (rp << 4)] = 10                    # POP
+        c[0xC5 + (rp << 4)] = 11                    # PUSH
+    c[0xC3] = c[0xCB] = 10                          # JMP
+    c[0xC9] = c[0xD9] = 10                          # RET
+    c[0xCD] = c[0xDD] = c[0xED] = c[0xFD] = 17      # CALL
+    c[0xD3] = c[0xDB] = 10                          # OUT, IN
+    c[0xE3] = 18                                    # XTHL
+    c[0xE9] = c[0xF9] = 5                           # PCHL, SPHL
+    return bytes(c)
+
+
+CYCLES = _cycles()
+
+
+def registers_used(body):
+    """Return the template registers named in body, in load order."""
+    used = set(_REG_RE.findall(body))
+    return [r for r in REGISTERS if r in used]
+
+
+def registers_written(body):
+    """Return the template registers assigned in body, in load order."""
+    written = set(_ASSIGN_RE.findall(body))
+    return [r for r in REGISTERS if r in written]
+
+
+def expand_macros(src, macros):
+    """Replace each NAME(args) call in src by macros[NAME](*args)."""
+    for name, fn in macros.items():
+        pat = re.compile(r'\b' + name + r'\(')
+        while True:
+            m = pat.search(src)
+            if not m:
+                break
+            depth = 0
+            args = []
+            start = m.end()
+            for k in range(m.end() - 1, len(src)):
+                ch = src[k]
+                if ch == '(':
+                    depth += 1
+                elif ch == ')':
+                    depth -= 1
+                    if depth == 0:
+                        break
+                elif ch == ',' and depth == 1:
+                    args.append(src[start:k].strip())
+                    start = k + 1
+            args.append(src[start:k].strip())
+            src = src[:m.start()] + fn(*args) + src[k + 1:]
+    return src
+
+
+# Plain memory access, used by the interpreter handlers; the hooks
+# compile to nothing.  Other macro sets fall back on these.
+PLAIN_MACROS = {
+    'RD': lambda addr: f'mem[{addr}]',
+    'WR': lambda addr, value: f'mem[{addr}] = {value}',
+    'EXTRA': lambda n: 'pass',
+    'CALLED': lambda target, sp: 'pass',
+    'RETURNED': lambda pc, sp: 'pass',
+}
+
+# Cycle counting: every instruction adds its T-states to cpu.cycles
+TIMED_MACROS = {'EXTRA': lambda n: f'cpu.cycles += {n}'}
+TIMED_PROLOGUE = 'cpu.cycles += {cycles}'
+
+
+# How each operand name is loaded, k being its offset from the opcode
+_OPERAND_LOADS = {
+    'N': 'N = mem[(pc + {k}) & 0xFFFF]',
+    'NN': 'NN = mem[(pc + {k}) & 0xFFFF] | (mem[(pc + {k1}) & 0xFFFF] << 8)',
+    'DISP': 'DISP = mem[(pc + {k}) & 0xFFFF]\nDISP -= (DISP & 0x80) << 1',
+}
+
+
+def _operands(n):
+    """Operand offsets of an 8080 instruction of length n."""
+    return {'N': 1} if n == 2 else {'NN': 1} if n == 3 else {}
+
+
+def function_source(name, body, n, operands=None, macros=PLAIN_MACROS, prologue=None,
+                    cycles=0, op=0):
+    """Return the source of a handler running template body.
+
+    n is the instruction length and operands maps N, NN or DISP (a signed
+    byte) to its offset in the instruction.  macros missing from the given
+    set are taken from PLAIN_MACROS.  prologue is extra source run first,
+    with pc set, {n} replaced by the instruction length, {cycles} by its
+    T-states and {op} by the first opcode byte.
+    """
+    macros = {**PLAIN_MACROS, **macros}
+    lines = [f'def {name}(cpu, mem):',
+             '    pc = cpu.pc',
+             f'    PC = (pc + {n}) & 0xFFFF']
+    if prologue:
+        lines.append(_indent(prologue.format(n=n, cycles=cycles, op=op)))
+    for operand, k in (operands or {}).items():
+        lines.append(_indent(_OPERAND_LOADS[operand].format(k=k, k1=k + 1)))
+    lines += [f'    {r} = cpu.{r.lower()}' for r in registers_used(body)]
+    if body:
+        lines.append(_indent(expand_macros(body, macros)))
+    lines += [f'    cpu.{r.lower()} = {r}' for r in registers_written(body)]
+    lines.append('    cpu.pc = PC')
+    return '\n'.join(lines) + '\n'
+
+
+def handler_source(op, macros=PLAIN_MACROS, name=None, prologue=None):
+    """Return the source of the handler function for one opcode.
+
+    The handler takes (cpu, mem), executes one instruction at cpu.pc and
+    leaves cpu.pc at the next one; see function_source() for macros and
+    prologue.
+    """
+    n = LENGTH[op]
+    return function_source(name or f'op_{op:02X}', TEMPLATES[op], n, _operands(n), macros,
+                           prologue, CYCLES[op], op)
+
+
+def build_handlers(macros=PLAIN_MACROS, env=None, prologue=None):
+    """Compile the 256 handlers with the given memory macros.
+
+    env supplies extra globals the macros and prologue refer to.
+    """
+    namespace = {'SZP': SZP}
+    if env:
+        namespace.update(env)
+    src = '\n'.join(handler_source(op, macros, prologue=prologue) for op in range(256))
+    exec(compile(src, f'<emu80 handlers>', 'exec'), namespace)
+    return [namespace[f'op_{op:02X}'] for op in range(256)]
+
+
+HANDLERS = build_handlers()
+TIMED_HANDLERS = build_handlers(TIMED_MACROS, prologue=TIMED_PROLOGUE)
+
+
+class CPU:
+    """8080 registers, 64 KB of memory and the run loop.
+
+    port_in(port) and port_out(port, value) are called for IN and OUT;
+    HLT stops run() with halted set and pc past the HLT.  With timed set,
+    cycles counts the T-states executed.  With jit set, run() executes
+    compiled basic blocks (see jit.py) while the handlers are unchanged.
+    """
+
+    __slots__ = ('mem', 'a', 'b', 'c', 'd', 'e', 'h', 'l', 'f', 'sp', 'pc',
+                 'halted', 'inte', 'port_in', 'port_out', 'handlers', 'executed',
+                 'cycles', 'blocks')
+
+    CYCLES = CYCLES
+    GLOBALS = {'SZP': SZP}              # tables the templates refer to
+
+    def __init__(self, mem=None, timed=False, jit=False):
+        self.mem = mem if mem is not None else bytearray(0x10000)
+        self.a = self.b = self.c = self.d = self.e = self.h = self.l = 0
+        self.f = 0x02
+        self.sp = 0
+        self.pc = 0
+        self.halted = False
+        self.inte = False
+        self.port_in = lambda port: 0xFF
+        self.port_out = lambda port, value: None
+        self.handlers = TIMED_HANDLERS if timed else HANDLERS
+        self.executed = 0
+        self.cycles = 0
+        self.blocks = None
+        if jit:
+            from .jit import BlockCache
+            self.blocks = BlockCache(self, timed)
+
+    @staticmethod
+    def compile_handlers(macros=PLAIN_MACROS, env=None, prologue=None):
+        """Handlers for this CPU with other macros; see build_handlers()."""
+        return build_handlers(macros, env, prologue)
+
+    def length_at(self, addr):
+        """Length of the instruction at addr."""
+        return LENGTH[self.mem[addr]]
+
+    def template_at(self, addr):
+        """Return (template, length, operand offsets, T-states) of the
+        instruction at addr."""
+        op = self.mem[addr]
+        n = LENGTH[op]
+        return TEMPLATES[op], n, _operands(n), CYCLES[op]
+
+    def invalidate(self, start, end=None):
+        """Note that bytes [start, end) changed behind the CPU's back."""
+        if self.blocks is not None:
+            self.blocks.invalidate(start, end)
+
+    def step(self):
+        """Execute one instruction."""
+        self.handlers[self.mem[self.pc]](self, self.mem)
+
+    def run(self, limit=None):
+        """Run until HLT or limit instructions; returns the number executed.
+
+        The count is also left in executed, including when a port handler
+        raises out of the loop.
+        """
+        if self.blocks is not None and self.handlers is self.blocks.handlers:
+            return self.blocks.run(limit)
+        mem = self.mem
+        handlers = self.handlers
+        limit = -1 if limit is None else limit
+        n = 0
+        try:
+            while not self.halted and n != limit:
+                handlers[mem[self.pc]](self, mem)
+                n += 1
+        finally:
+            self.executed = n
+        return n
+
+    def registers(self):
+        """Return the registers as a dict, for display and snapshots."""
+        return {r: getattr(self, r) for r in ('a', 'f', 'b', 'c', 'd', 'e', 'h', 'l', 'sp', 'pc')}
+
+    def __repr__(self):
+        return (f"CPU(A={self.a:02X} F={self.f:02X} BC={self.b:02X}{self.c:02X} "
+                f"DE={self.d:02X}{self.e:02X} HL={self.h:02X}{self.l:02X} "
+                f"SP={self.sp:04X} PC={self.pc:04X})")
@@ -0,0 +1,271 @@
+"""
+diffrun.py - Run two images in lockstep and report where they first diverge
+
+Both images get the same console input.  A breakpoint on NEWSTT stops
+each machine at every statement boundary; there the console output
+produced since the previous boundary and a few words of interpreter
+state (TXTTAB, VARTAB, FRETOP by default) are compared.  The first
+boundary where they differ is reported with the statement count, the
+current line number and the surrounding output, so a rewrite can be
+checked for behaviour without being byte-identical.
+
+Addresses come from each image's .sym file (the sibling of the image by
+default, else the other image's), and can be given directly with
+--addrs-a/--addrs-b for builds whose labels are not public, such as the
+single-module mbasicz.  With --relative each watched word is compared as
+an offset from the first one, which hides a difference in load address.
+
+Usage:
+    python3 -m emu80.diffrun <a> <b> --input FILE [--altair]
+                             [--sym-a FILE] [--sym-b FILE]
+                             [--addrs-a NAME=HEX,...] [--addrs-b NAME=HEX,...]
+                             [--watch txttab,vartab,fretop] [--relative]
+                             [--dir DIR] [--limit N] [--json FILE]
+
+    python3 -m emu80.diffrun com/mbasic.com ../mbasicz/out/mbasicz.com \\
+        --sym-a out/mbasic_go.sym --input prog.txt
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+
+from .cpm import CPM
+from .altair import Altair
+from .machine import STOP_BREAK, STOP_LIMIT
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'mbasic_521', 'utils'))
+from symtab import parse_sym_file       # noqa: E402
+
+
+WATCH = ['txttab', 'vartab', 'fretop']
+BOUNDARY = 'newstt'
+LINE = 'curlin'
+CONTEXT = 60
+
+
+class Side:
+    """One machine of the pair with its addresses and comparison state."""
+
+    def __init__(self, label, machine, addrs):
+        self.label = label
+        self.machine = machine
+        self.addrs = addrs
+        self.statements = 0
+        self.shown = 0              # output already compared
+        self.reason = None
+        machine.add_breakpoint(addrs[BOUNDARY], self._boundary)
+
+    def _boundary(self, machine):
+        self.statements += 1
+        return STOP_BREAK
+
+    def word(self, name):
+        addr = self.addrs[name]
+        mem = self.machine.mem
+        return mem[addr] | (mem[(addr + 1) & 0xFFFF] << 8)
+
+    def line(self):
+        """Current BASIC line number, or None when unknown or direct mode."""
+        if LINE not in self.addrs:
+            return None
+        n = self.word(LINE)
+        return None if n == 0xFFFF else n
+
+    def state(self, watch, relative):
+        values = {name: self.word(name) for name in watch}
+        if relative and watch:
+            base = values[watch[0]]
+            values = {name: (v - base) & 0xFFFF for name, v in values.items()}
+        return values
+
+    def advance(self, limit):
+        self.reason = self.machine.run(limit)
+        return self.reason
+
+    def new_output(self):
+        return bytes(self.machine.output[self.shown:])
+
+
+def _first_difference(x, y):
+    for i, (p, q) in enumerate(zip(x, y)):
+        if p != q:
+            return i
+    return min(len(x), len(y))
+
+
+def _context(side, offset):
+    """Output of side around absolute output offset, as text."""
+    out = side.machine.output
+    start = max(0, offset - CONTEXT)
+    return out[start:offset + CONTEXT // 3].decode('latin-1')
+
+
+def _divergence(kind, a, b, **details):
+    report = {'kind': kind, 'statement': a.statements,
+              'line_a': a.line(), 'line_b': b.line(),
+              'pc_a': a.machine.cpu.pc, 'pc_b': b.machine.cpu.pc}
+    report.update(details)
+    return report
+
+
+def diff_run(a, b, watch=WATCH, relative=False, limit=None):
+    """Run Side a and b in lockstep; return a report dict.
+
+    report['divergence'] is None when the runs agree to the end.
+    """
+    divergence = None
+    while divergence is None:
+        ra = a.advance(limit)
+        rb = b.advance(limit)
+        out_a, out_b = a.new_output(), b.new_output()
+        if out_a != out_b:
+            i = _first_difference(out_a, out_b)
+            divergence = _divergence('output', a, b, offset=a.shown + i,
+                                     context_a=_context(a, a.shown + i),
+                                     context_b=_context(b, b.shown + i))
+            break
+        a.shown += len(out_a)
+        b.shown += len(out_b)
+        if ra != rb:
+            divergence = _divergence('stop', a, b, stop_a=ra, stop_b=rb)
+            break
+        if ra != STOP_BREAK:
+            break
+        sa, sb = a.state(watch, relative), b.state(watch, relative)
+        if sa != sb:
+            divergence = _divergence('state', a, b, state_a=sa, state_b=sb,
+                                     context_a=_context(a, a.shown),
+                                     context_b=_context(b, b.shown))
+
+    return {'statements': a.statements, 'instructions_a': a.machine.instructions,
+            'instructions_b': b.machine.instructions, 'stop_a': a.reason,
+            'stop_b': b.reason, 'watch': list(watch), 'relative': relative,
+            'divergence': divergence}
+
+
+def print_report(report, out=sys.stdout):
+    print(f"Statements compared: {report['statements']}", file=out)
+    print(f"Instructions: A {report['instructions_a']}  B {report['instructions_b']}", file=out)
+    d = report['divergence']
+    if d is None:
+        print(f"No divergence; both stopped with '{report['stop_a']}'", file=out)
+        return
+
+    def where(side):
+        line = d[f'line_{side}']
+        at = f"line {line}" if line is not None else "direct mode"
+        return f"{at}, PC={d[f'pc_{side}']:04X}"
+
+    print(file=out)
+    print(f"First divergence ({d['kind']}) after statement {d['statement']}:", file=out)
+    print(f"  A: {where('a')}", file=out)
+    print(f"  B: {where('b')}", file=out)
+    if d['kind'] == 'stop':
+        print(f"  A stopped with '{d['stop_a']}', B with '{d['stop_b']}'", file=out)
+    elif d['kind'] == 'state':
+        for name in report['watch']:
+            va, vb = d['state_a'][name], d['state_b'][name]
+            mark = '  <--' if va != vb else ''
+            print(f"  {name:8} A={va:04X}  B={vb:04X}{mark}", file=out)
+    else:
+        print(f"  at output offset {d['offset']}", file=out)
+    if 'context_a' in d:
+        for side in 'ab':
+            print(f"  --- {side.upper()} output up to here ---", file=out)
+            for text in d[f'context_{side}'].replace('\r\n', '\n').split('\n'):
+                print(f"  | {text}", file=out)
+
+
+def parse_addrs(text):
+    """Parse 'name=HEX,name=HEX' into a dict of lower-case names."""
+    addrs = {}
+    for item in filter(None, (s.strip() for s in (text or '').split(','))):
+        name, _, value = item.partition('=')
+        addrs[name.strip().lower()] = int(value, 16)
+    return addrs
+
+
+def resolve(names, sym_path, overrides):
+    """Addresses for names from a .sym file, with overrides taking priority."""
+    addrs = {}
+    if sym_path:
+        for addr, name in parse_sym_file(sym_path):
+            addrs.setdefault(name.lower(), addr)
+    addrs.update(overrides)
+    missing = [n for n in names if n not in addrs]
+    return {n: addrs[n] for n in list(names) + [LINE] if n in addrs}, missing
+
+
+def _default_sym(image):
+    path = os.path.splitext(image)[0] + '.sym'
+    return path if os.path.exists(path) else None
+
+
+def _machine(image_path, args, workdir):
+    with open(image_path, 'rb') as f:
+        image = f.read()
+    if args.altair:
+        return Altair(image)
+    os.makedirs(workdir, exist_ok=True)
+    if args.dir:
+        shutil.copytree(args.dir, workdir, dirs_exist_ok=True)
+    return CPM(image, directory=workdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python3 -m emu80.diffrun',
+                                     description='Run two images in lockstep and find the first divergence')
+    parser.add_argument('a', help='First (reference) image')
+    parser.add_argument('b', help='Second image')
+    parser.add_argument('--input', required=True, help='File with console input for both runs')
+    parser.add_argument('--altair', action='store_true',
+                        help='Run as Altair images loaded at 0 (4K/8K BASIC) instead of CP/M')
+    parser.add_argument('--sym-a', help='Symbol file for A (default: A with .sym, else B\'s)')
+    parser.add_argument('--sym-b', help='Symbol file for B (default: B with .sym, else A\'s)')
+    parser.add_argument('--addrs-a', help='Address overrides for A, e.g. newstt=12A0,txttab=079A')
+    parser.add_argument('--addrs-b', help='Address overrides for B')
+    parser.add_argument('--watch', default=','.join(WATCH),
+                        help=f"Words compared at each statement (default: {','.join(WATCH)})")
+    parser.add_argument('--relative', action='store_true',
+                        help='Compare watched words as offsets from the first one')
+    parser.add_argument('--dir', help='Directory copied to drive A: of each run')
+    parser.add_argument('--limit', type=int, help='Stop each run after this many instructions')
+    parser.add_argument('--json', help='Write the report as JSON to this file')
+    args = parser.parse_args()
+
+    watch = [w.strip().lower() for w in args.watch.split(',') if w.strip()]
+    sym_a = args.sym_a or _default_sym(args.a)
+    sym_b = args.sym_b or _default_sym(args.b)
+    sym_a, sym_b = sym_a or sym_b, sym_b or sym_a
+    addrs_a, missing_a = resolve([BOUNDARY] + watch, sym_a, parse_addrs(args.addrs_a))
+    addrs_b, missing_b = resolve([BOUNDARY] + watch, sym_b, parse_addrs(args.addrs_b))
+    if missing_a or missing_b:
+        parser.error(f"no address for A: {', '.join(missing_a) or '-'}; "
+                     f"B: {', '.join(missing_b) or '-'} (use --sym-x or --addrs-x)")
+
+    with open(args.input, 'rb') as f:
+        script = f.read()
+    with tempfile.TemporaryDirectory(prefix='diffrun_') as tmp:
+        sides = []
+        for label, path, addrs in (('A', args.a, addrs_a), ('B', args.b, addrs_b)):
+            machine = _machine(path, args, os.path.join(tmp, label))
+            machine.feed(script)
+            sides.append(Side(label, machine, addrs))
+        report = diff_run(sides[0], sides[1], watch, args.relative, args.limit)
+
+    print_report(report)
+    if report['stop_a'] == STOP_LIMIT:
+        print(f"(instruction limit {args.limit} reached)")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=1)
+    return 0 if report['divergence'] is None else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,264 @@
+"""
+jit.py - Basic-block cache: straight-line code compiled into one function
+
+The handler loop pays a dispatch, an operand fetch and a load and store
+of every register it touches for each instruction.  A BlockCache instead
+translates the straight-line run of instructions starting at an address
+into a single generated function, from the same templates: operands and
+PC become constants, registers are loaded once at the top and stored
+once at the bottom, and a timed block adds its T-states in one sum (the
+EXTRA of a taken conditional still adds its own).  A conditional jump,
+call or return does not end a block: when it is taken the block stores
+the registers written so far and returns early, so one block covers the
+whole run of straight-line code and untaken branches.  A block ends with
+the first instruction that always transfers control or halts, or after
+MAX_INSTRUCTIONS; an IN or OUT always runs on its own through the
+handler, so a port routine that raises (console input needed) leaves
+the registers exactly as the handler loop would.
+
+Compiled blocks stay valid while their bytes do: every memory write in
+block and step code checks a 64K map of the bytes that compiled blocks
+cover, and a write to one of them drops those blocks, to be compiled
+again from the new bytes the next time they run.  A block that may write
+to memory checks after that instruction whether it was dropped itself,
+and if so returns there, so code that patches its own operands (the
+divide loop of mbasicz) runs the new bytes at once.  An operand that
+has been written to while compiled is read from memory when the block
+runs instead of being made a constant, and is left out of the map, so
+such code is compiled once rather than on every patch.  Writes made by the machine itself (breakpoints,
+BDOS buffers) are reported through cpu.invalidate(), and a new memory
+object (a restored snapshot) empties the cache.  Instruction and T-state
+counts are exactly those of the handler loop; near an instruction limit
+the last instructions are stepped one at a time.
+
+The cache only runs while the CPU uses the handlers it was created with,
+so executors that install their own (trace, profile, blocks) run through
+their handlers as before.
+
+Usage:
+    from emu80 import CPU, CPM
+    machine = CPM(image, cpu=CPU(timed=True, jit=True))
+"""
+
+import re
+
+from .cpu import PLAIN_MACROS, TIMED_MACROS, TIMED_PROLOGUE, expand_macros, \
+    registers_used, registers_written
+
+
+SIZE = 0x10000
+MAX_INSTRUCTIONS = 64
+MAX_SPAN = MAX_INSTRUCTIONS * 4         # bytes a block can cover
+
+_PC_ASSIGN_RE = re.compile(r'\bPC\s*=(?!=)')
+_JUMP_RE = re.compile(r'^PC\s*=(?!=)', re.M)         # unconditional: not indented
+_WR_RE = re.compile(r'\bWR\(([^,]*),')
+# Operands that code patches are read when the block runs
+_OPERAND_SOURCE = {
+    'N': '(mem[0x{0:04X}])',
+    'NN': '(mem[0x{0:04X}] | (mem[0x{1:04X}] << 8))',
+    'DISP': '(mem[0x{0:04X}] - ((mem[0x{0:04X}] & 0x80) << 1))',
+}
+_OPERAND_RE = {name: re.compile(r'\b' + name + r'\b') for name in ('NN', 'N', 'DISP', 'pc')}
+
+# Memory writes note when they hit compiled code; one line, so that the
+# expansion can stand anywhere a statement can
+CHECKED_WR = lambda addr, value: (f'at_ = {addr}; mem[at_] = {value}; '  # noqa: E731
+                                  'CODE[at_] and INVALIDATE(at_)')
+
+
+def branches(body):
+    """True if the template can transfer control."""
+    return bool(_PC_ASSIGN_RE.search(body))
+
+
+def ends_block(body):
+    """True if the template always transfers control, or can halt."""
+    return bool(_JUMP_RE.search(body)) or 'cpu.halted' in body
+
+
+def writes_into(body, start, end):
+    """True if the template can write to memory in [start, end)."""
+    for addr in _WR_RE.findall(body):
+        if not re.fullmatch(r'0x[0-9A-F]+', addr) or start <= int(addr, 16) < end:
+            return True
+    return False
+
+
+def runs_alone(body):
+    """True if the instruction must run through its handler (port I/O)."""
+    return 'cpu.port_' in body
+
+
+class BlockCache:
+    """Compiled basic blocks of one CPU's memory."""
+
+    def __init__(self, cpu, timed=False):
+        self.cpu = cpu
+        self.timed = timed
+        self.handlers = cpu.handlers
+        self.macros = dict(PLAIN_MACROS, WR=CHECKED_WR)
+        if timed:
+            self.macros.update(TIMED_MACROS)
+        self.code = [0] * SIZE                  # address -> blocks covering it
+        self.blocks = [None] * SIZE             # start -> (function, instructions)
+        self.globals = dict(cpu.GLOBALS, CODE=self.code, BLOCKS=self.blocks,
+                            INVALIDATE=self.invalidate)
+        self._step = None
+        self.compiled = 0
+        self.dropped = 0
+        self.flush()
+
+    def flush(self):
+        """Forget every block, and take up the CPU's current memory."""
+        self.mem = self.cpu.mem
+        self.blocks[:] = [None] * SIZE
+        self.ends = [0] * SIZE                  # start -> end of its bytes
+        self.loose = {}                         # start -> operands read at run time
+        self.patched = bytearray(SIZE)          # bytes written while compiled
+        self.code[:] = bytes(SIZE)
+
+    def invalidate(self, start, end=None):
+        """Drop the blocks covering any byte in [start, end)."""
+        end = start + 1 if end is None else min(end, SIZE)
+        code = self.code
+        if not any(code[start:end]):
+            return
+        for addr in range(start, end):
+            if code[addr]:
+                self.patched[addr] = 1
+        ends = self.ends
+        for addr in range(max(0, start - MAX_SPAN), end):
+            if ends[addr] > start:
+                self._drop(addr)
+
+    def _drop(self, start):
+        code = self.code
+        loose = self.loose.pop(start, ())
+        for addr in range(start, self.ends[start]):
+            if addr not in loose:
+                code[addr] -= 1
+        self.blocks[start] = None
+        self.ends[start] = 0
+        self.dropped += 1
+
+    def _step_handlers(self):
+        """Handlers for single instructions, with the checked writes."""
+        if self._step is None:
+            self._step = self.cpu.compile_handlers(
+                self.macros, self.globals, prologue=TIMED_PROLOGUE if self.timed else None)
+        return self._step
+
+    def compile(self, start):
+        """Compile the block at start; returns (function, instructions).
+
+        The function returns the number of instructions it executed.
+        """
+        cpu = self.cpu
+        mem = self.mem
+        addr = start
+        bodies = []
+        loose = []
+        while len(bodies) < MAX_INSTRUCTIONS:
+            body, n, operands, t = cpu.template_at(addr)
+            if addr + n > SIZE or runs_alone(body):
+                break
+            for name, k in operands.items():
+                at = addr + k
+                size = 2 if name == 'NN' else 1
+                if any(self.patched[at:at + size]):
+                    value = _OPERAND_SOURCE[name].format(at, at + 1)
+                    loose += range(at, at + size)
+                else:
+                    value = mem[at]
+                    if name == 'NN':
+                        value |= mem[at + 1] << 8
+                    elif name == 'DISP':
+                        value -= (value & 0x80) << 1
+                    value = f'({value})' if value < 0 else f'0x{value:X}'
+                body = _OPERAND_RE[name].sub(value, body)
+            body = _OPERAND_RE['pc'].sub(f'0x{addr:04X}', body)
+            addr += n
+            bodies.append((body, addr, t))
+            if ends_block(body):
+                break
+        if not bodies:
+            # Port I/O, or an instruction running past the top of memory
+            step = self._step_handlers()[mem[start]]
+            block = (lambda cpu, mem: step(cpu, mem) or 1, 1)
+            end = start + cpu.length_at(start)
+        else:
+            block = (self._build(start, bodies), len(bodies))
+            end = addr
+        self.blocks[start] = block
+        self.ends[start] = min(end, SIZE)
+        if loose:
+            self.loose[start] = loose = frozenset(loose)
+        code = self.code
+        for k in range(start, self.ends[start]):
+            if k not in loose:
+                code[k] += 1
+        self.compiled += 1
+        return block
+
+    def _build(self, start, bodies):
+        """Generate the function for [(body, next address, T-states)]."""
+        indent = lambda text: '\n'.join('    ' + line for line in text.splitlines())  # noqa: E731
+        lines = [f'def block_{start:04X}(cpu, mem):']
+        lines += [f'    {r} = cpu.{r.lower()}' for r in
+                  registers_used('\n'.join(body for body, _, _ in bodies))]
+        written = []
+        cycles = 0
+        for k, (body, end, t) in enumerate(bodies, 1):
+            cycles += t
+            written += [r for r in registers_written(body) if r not in written]
+            if 'PC' in body:
+                lines.append(f'    PC = 0x{end & 0xFFFF:04X}')
+            if body:
+                lines.append(indent(expand_macros(body, self.macros)))
+            if k == len(bodies):
+                break
+            if branches(body):
+                lines.append(f'    if PC != 0x{end & 0xFFFF:04X}:')
+                lines += self._exit(written, 'PC', cycles, k, '        ')
+            if writes_into(body, start, bodies[-1][1]):
+                lines.append(f'    if BLOCKS[0x{start:04X}] is None:')
+                lines += self._exit(written, f'0x{end & 0xFFFF:04X}', cycles, k, '        ')
+        last = bodies[-1]
+        pc = 'PC' if 'PC' in last[0] else f'0x{last[1] & 0xFFFF:04X}'
+        lines += self._exit(written, pc, cycles, len(bodies), '    ')
+        namespace = dict(self.globals)
+        exec(compile('\n'.join(lines) + '\n', f'<emu80 block {start:04X}>', 'exec'), namespace)
+        return namespace[f'block_{start:04X}']
+
+    def _exit(self, written, pc, cycles, count, pad):
+        lines = [f'{pad}cpu.{r.lower()} = {r}' for r in written]
+        if self.timed:
+            lines.append(f'{pad}cpu.cycles += {cycles}')
+        return lines + [f'{pad}cpu.pc = {pc}', f'{pad}return {count}']
+
+    def run(self, limit=None):
+        """Run the CPU until HLT or limit instructions; see CPU.run()."""
+        cpu = self.cpu
+        if cpu.mem is not self.mem:
+            self.flush()
+        mem = self.mem
+        blocks = self.blocks
+        compile_block = self.compile
+        n = 0
+        try:
+            if limit is None:
+                while not cpu.halted:
+                    block = blocks[cpu.pc] or compile_block(cpu.pc)
+                    n += block[0](cpu, mem)
+            else:
+                while not cpu.halted and n < limit:
+                    block = blocks[cpu.pc] or compile_block(cpu.pc)
+                    if n + block[1] > limit:
+                        self._step_handlers()[mem[cpu.pc]](cpu, mem)
+                        n += 1
+                    else:
+                        n += block[0](cpu, mem)
+        finally:
+            cpu.executed = n
+        return n
@@ -0,0 +1,149 @@
+"""
+machine.py - Common run loop, console queue and breakpoints of the machines
+
+A machine owns a CPU, a console input queue and an output buffer.  Its
+run() loop lets the CPU execute at full speed and only regains control
+when the CPU halts: on a HLT at a trap address (a Python service routine,
+see cpm.py) or at a breakpoint.  Breakpoints replace the opcode at their
+address with HLT; after the callback runs, the original instruction is
+executed in place and the HLT put back, so a breakpoint costs nothing
+until it is hit.
+"""
+
+from .cpu import CPU
+
+
+HLT = 0x76
+
+# Reasons run() returns
+STOP_EXIT = 'exit'          # the program returned to the operating system
+STOP_INPUT = 'input'        # console input needed but the queue is empty
+STOP_LIMIT = 'limit'        # instruction limit reached
+STOP_HALT = 'halt'          # HLT outside the trap area
+STOP_BREAK = 'break'        # a breakpoint callback asked to stop
+
+
+class InputNeeded(Exception):
+    """Raised by a console routine when the input queue is empty."""
+
+
+class Machine:
+    """CPU plus console queues, traps and breakpoints."""
+
+    def __init__(self, cpu=None, typeahead=False):
+        self.cpu = cpu or CPU()
+        self.mem = self.cpu.mem
+        self.input = bytearray()
+        self.output = bytearray()
+        # When False, console status reports no key pressed while a program
+        # runs, so scripted input is only consumed by explicit reads
+        self.typeahead = typeahead
+        self.instructions = 0
+        self.traps = {}
+        self.breakpoints = {}
+
+    # Console
+
+    def feed(self, text):
+        """Queue console input; newlines are sent as carriage returns."""
+        if isinstance(text, str):
+            text = text.encode('latin-1')
+        self.input += text.replace(b'\r\n', b'\r').replace(b'\n', b'\r')
+
+    def output_text(self):
+        """Return console output as text with CR LF turned into newlines."""
+        return self.output.replace(b'\r\n', b'\n').decode('latin-1')
+
+    def _getc(self):
+        if not self.input:
+            raise InputNeeded
+        c = self.input[0]
+        del self.input[0]
+        return c
+
+    def _putc(self, c):
+        self.output.append(c & 0x7F)
+
+    # Breakpoints
+
+    def add_breakpoint(self, addr, callback):
+        """Call callback(machine) before the instruction at addr executes.
+
+        A true return value stops run() with that value as the reason.
+        """
+        if addr not in self.breakpoints:
+            self.breakpoints[addr] = (self.mem[addr], callback)
+            self.mem[addr] = HLT
+            self.cpu.invalidate(addr)
+        else:
+            self.breakpoints[addr] = (self.breakpoints[addr][0], callback)
+
+    def remove_breakpoint(self, addr):
+        opcode, _ = self.breakpoints.pop(addr)
+        self.mem[addr] = opcode
+        self.cpu.invalidate(addr)
+
+    def _step_over(self, addr):
+        """Execute the instruction a breakpoint at addr displaced."""
+        cpu = self.cpu
+        opcode = self.breakpoints[addr][0]
+        self.mem[addr] = opcode
+        cpu.pc = addr
+        try:
+            cpu.step()
+        finally:
+            if addr in self.breakpoints:
+                self.mem[addr] = HLT
+        self.instructions += 1
+
+    # Running
+
+    def trap(self, addr):
+        """Handle a HLT at addr; returns a stop reason, or None to go on.
+
+        The default treats every HLT as the end of the run.
+        """
+        return STOP_HALT
+
+    def run(self, limit=None):
+        """Run until a stop condition or limit instructions in total.
+
+        Returns one of the STOP_* reasons.  After STOP_INPUT, feed() more
+        input and call run() again to continue.
+        """
+        cpu = self.cpu
+        while True:
+            if limit is not None and self.instructions >= limit:
+                return STOP_LIMIT
+            budget = None if limit is None else limit - self.instructions
+            try:
+                cpu.run(budget)
+            except InputNeeded:
+                return STOP_INPUT
+            finally:
+                self.instructions += cpu.executed
+            if not cpu.halted:
+                continue
+            addr = (cpu.pc - 1) & 0xFFFF
+            cpu.halted = False
+            if addr in self.breakpoints:
+                cpu.pc = addr
+                self.instructions -= 1          # the HLT did not really run
+                if cpu.cycles >= cpu.CYCLES[HLT]:   # only a timed CPU counts it
+                    cpu.cycles -= cpu.CYCLES[HLT]
+                stop = self.breakpoints[addr][1](self)
+                try:
+                    self._step_over(addr)
+                except InputNeeded:
+                    return STOP_INPUT
+                if stop:
+                    return stop
+                continue
+            try:
+                stop = self.trap(addr)
+            except InputNeeded:
+                cpu.pc = addr                   # retry the call on resume
+                return STOP_INPUT
+            if stop:
+                cpu.halted = stop == STOP_HALT
+                return stop
@@ -0,0 +1,337 @@
+"""
+profile.py - Per-routine T-state profile with call graph
+
+A Profiler gives a machine its own handler set, compiled from the CPU
+templates with the timing prologue extended to add each instruction's
+T-states and count to per-address tables, and with the CALLED/RETURNED
+hooks keeping a shadow call stack.  A RET closes the innermost frame
+whose return address it pops, wherever the routine moved that address
+on the stack (PUSHF returns from beneath the value it pushed), together
+with any frames above it that were abandoned; a RET that matches no
+frame, such as a PUSH/RET jump, is ignored.  A CALL closes the frames
+whose return address lies at or below its own, which the interpreter
+dropped when it reset SP.
+
+After the run the per-address tables are folded onto the labels of the
+.sym file: each label gets the self cycles of the addresses from it up
+to the next label and the number of calls made to it.  Its inclusive
+cycles are those spent in its own code or while a CALL into it or out
+of it is open, each counted once however deep the recursion: code
+entered by a jump or by falling through counts towards the frame it
+runs in, and inclusive is never less than self.  Without a .sym file every observed
+CALL target becomes a routine.  Everything above the image (the CP/M
+stand-in) is reported as <system>.
+
+With --z80 the image runs on the Z80 core and is timed in Z80 T-states,
+so mbasicz builds with Z80-only code can be profiled and compared with
+5.21 routine by routine.
+
+Usage:
+    python3 -m emu80.profile <image> --input FILE [--sym FILE] [--src DIR]
+                             [--altair] [--z80] [--top N] [--graph]
+                             [--json FILE] [--limit N] [--dir DIR]
+
+    python3 -m emu80.profile mbasic_521/out/mbasic_go.com --input bench.txt --graph
+    python3 -m emu80.profile mbasicz/out/mbasicz.com --input bench.txt --z80
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+from bisect import bisect_right, insort
+
+from .cpu import CPU, TIMED_MACROS, TIMED_PROLOGUE
+from .z80 import Z80
+from .cpm import CPM
+from .altair import Altair
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'mbasic_521', 'utils'))
+from symtab import SymbolTable, load_symbols       # noqa: E402
+
+
+SIZE = 0x10000
+SYSTEM = '<system>'
+
+PROFILE_MACROS = dict(TIMED_MACROS,
+                      EXTRA=lambda n: f'cpu.cycles += {n}; CYCLES_AT[pc] += {n}',
+                      CALLED=lambda target, sp: f'PROFILE_CALL(cpu, pc, {target}, {sp})',
+                      RETURNED=lambda pc, sp: f'PROFILE_RET(cpu, {pc})')
+PROFILE_PROLOGUE = TIMED_PROLOGUE + '\nCYCLES_AT[pc] += {cycles}\nCOUNT_AT[pc] += 1'
+
+
+class Profiler:
+    """Cycle and call accounting for the machine attached to it.
+
+    syms gives the routine boundaries, so that cycles a routine spends
+    in its own code while one of its frames is open are not counted
+    twice; without it the CALL targets seen so far are used.  Addresses from image_end up form one routine.
+    """
+
+    def __init__(self, syms=None, image_end=SIZE):
+        self.cycles_at = [0] * SIZE
+        self.count_at = [0] * SIZE
+        self.stack = []                 # [target, call site, sp, start cycles, return, routines]
+        self.calls = {}                 # (call site, target) -> count
+        self.edge_cycles = {}           # (call site, target) -> inclusive cycles
+        self.framed = {}                # routine start -> cycles in frames into or out of it, outside it
+        self.holding = {}               # routine start -> [frames, start cycles, own cycles, end]
+        self.learn = syms is None or not len(syms)
+        self.starts = [] if self.learn else sorted(a for a in syms.addrs if a < image_end)
+        self.image_end = image_end
+        self.bounds = {}                # address -> (start, end) of its routine
+        self.cpu = None
+        self.env = {'CYCLES_AT': self.cycles_at, 'COUNT_AT': self.count_at,
+                    'PROFILE_CALL': self._call, 'PROFILE_RET': self._ret}
+
+    def attach(self, machine):
+        machine.cpu.handlers = machine.cpu.compile_handlers(PROFILE_MACROS, self.env,
+                                                            prologue=PROFILE_PROLOGUE)
+        self.cpu = machine.cpu
+        return machine
+
+    def _routine(self, addr):
+        """Return the (start, end) of the routine holding addr."""
+        bounds = self.bounds.get(addr)
+        if bounds is None:
+            starts = self.starts
+            i = bisect_right(starts, addr) - 1
+            if addr >= self.image_end:
+                bounds = self.image_end, SIZE
+            elif i < 0:
+                bounds = addr, addr + 1
+            else:
+                bounds = starts[i], starts[i + 1] if i + 1 < len(starts) else self.image_end
+            self.bounds[addr] = bounds
+        return bounds
+
+    def _close(self, frame, now):
+        target, site, _, start, _, routines = frame
+        key = (site, target)
+        self.edge_cycles[key] = self.edge_cycles.get(key, 0) + now - start
+        for routine in routines:
+            hold = self.holding[routine]
+            hold[0] -= 1
+            if hold[0] == 0:
+                # The routine's own cycles meanwhile are already its self time
+                del self.holding[routine]
+                own = sum(self.cycles_at[routine:hold[3]]) - hold[2]
+                self.framed[routine] = self.framed.get(routine, 0) + now - hold[1] - own
+
+    def _hold(self, routine, end, now):
+        hold = self.holding.get(routine)
+        if hold is None:
+            self.holding[routine] = [1, now, sum(self.cycles_at[routine:end]), end]
+        else:
+            hold[0] += 1
+
+    def _call(self, cpu, site, target, sp):
+        stack = self.stack
+        # Frames whose return address lies at or below the new one are dead
+        while stack and stack[-1][2] <= sp:
+            self._close(stack.pop(), cpu.cycles)
+        if self.learn and target < self.image_end:
+            i = bisect_right(self.starts, target)
+            if not i or self.starts[i - 1] != target:
+                insort(self.starts, target)
+                self.bounds.clear()
+        callee, callee_end = self._routine(target)
+        caller, caller_end = self._routine(site)
+        self._hold(callee, callee_end, cpu.cycles)
+        if caller == callee:
+            routines = (callee,)
+        else:
+            self._hold(caller, caller_end, cpu.cycles)
+            routines = (callee, caller)
+        stack.append([target, site, sp, cpu.cycles, site + cpu.length_at(site), routines])
+        key = (site, target)
+        self.calls[key] = self.calls.get(key, 0) + 1
+
+    def _ret(self, cpu, address):
+        stack = self.stack
+        for depth in range(len(stack) - 1, -1, -1):
+            if stack[depth][4] == address:
+                while len(stack) > depth:
+                    self._close(stack.pop(), cpu.cycles)
+                return
+
+    def finish(self):
+        """Close the frames still open at the end of the run."""
+        now = self.cpu.cycles if self.cpu else 0
+        while self.stack:
+            self._close(self.stack.pop(), now)
+
+
+class Report:
+    """A profile folded onto routine labels."""
+
+    def __init__(self, profiler, syms=None, image_end=SIZE):
+        profiler.finish()
+        if syms is None or not len(syms):
+            targets = {target for _, target in profiler.calls}
+            syms = SymbolTable([(t, f'sub_{t:04X}') for t in targets])
+        self.syms = syms
+        self.image_end = image_end
+        self.total = sum(profiler.cycles_at)
+        self.instructions = sum(profiler.count_at)
+
+        self.routines = {}
+        for addr in range(SIZE):
+            cycles = profiler.cycles_at[addr]
+            if cycles:
+                r = self._routine(self.routines, self.name(addr))
+                r['self'] += cycles
+                r['instructions'] += profiler.count_at[addr]
+        self.edges = {}
+        for (site, target), count in profiler.calls.items():
+            caller, callee = self.name(site), self.name(target)
+            edge = self.edges.setdefault((caller, callee), {'calls': 0, 'cycles': 0})
+            edge['calls'] += count
+            edge['cycles'] += profiler.edge_cycles.get((site, target), 0)
+            self._routine(self.routines, callee)['calls'] += count
+        for r in self.routines.values():
+            r['inclusive'] = r['self']
+        for start, cycles in profiler.framed.items():
+            self._routine(self.routines, self.name(start))['inclusive'] += cycles
+
+    @staticmethod
+    def _routine(routines, name):
+        r = routines.get(name)
+        if r is None:
+            r = routines[name] = {'self': 0, 'inclusive': 0, 'calls': 0, 'instructions': 0,
+                                  'module': None}
+        return r
+
+    def name(self, addr):
+        if addr >= self.image_end:
+            return SYSTEM
+        hit = self.syms.lookup(addr)
+        if hit is None:
+            return f'{addr:04X}'
+        if hit[2]:
+            self._routine(self.routines, hit[0])['module'] = hit[2]
+        return hit[0]
+
+    def flat(self):
+        """Routines sorted by self cycles, largest first."""
+        return sorted(self.routines.items(), key=lambda kv: -kv[1]['self'])
+
+    def callers(self, name):
+        return sorted(((c, e) for (c, t), e in self.edges.items() if t == name),
+                      key=lambda ce: -ce[1]['cycles'])
+
+    def callees(self, name):
+        return sorted(((t, e) for (c, t), e in self.edges.items() if c == name),
+                      key=lambda te: -te[1]['cycles'])
+
+    def to_dict(self):
+        return {'total_cycles': self.total, 'instructions': self.instructions,
+                'routines': dict(self.routines),
+                'edges': [{'caller': c, 'callee': t, **e} for (c, t), e in self.edges.items()]}
+
+
+def _percent(part, whole):
+    return 100.0 * part / whole if whole else 0.0
+
+
+def print_flat(report, top=30, out=sys.stdout):
+    total = report.total
+    print(f"Total: {total} T-states, {report.instructions} instructions", file=out)
+    print(file=out)
+    print(f"{'self %':>7} {'cumul %':>7} {'self':>12} {'inclusive':>12} {'calls':>9} "
+          f"{'instrs':>10}  routine", file=out)
+    cumulative = 0
+    for name, r in report.flat()[:top]:
+        cumulative += r['self']
+        module = f"  ({r['module']})" if r['module'] else ''
+        print(f"{_percent(r['self'], total):6.2f}% {_percent(cumulative, total):6.2f}% "
+              f"{r['self']:12d} {r['inclusive']:12d} {r['calls']:9d} "
+              f"{r['instructions']:10d}  {name}{module}", file=out)
+
+
+def print_graph(report, top=30, out=sys.stdout):
+    total = report.total
+    ranked = sorted(report.routines.items(), key=lambda kv: -kv[1]['inclusive'])
+    print(file=out)
+    print("Call graph (callers above, callees below each routine; cycles inclusive)", file=out)
+    for name, r in ranked[:top]:
+        print('-' * 72, file=out)
+        for caller, e in report.callers(name)[:8]:
+            print(f"{'':18}{e['cycles']:12d} {e['calls']:9d}      {caller}", file=out)
+        inclusive = r['inclusive']
+        print(f"{_percent(inclusive, total):6.2f}% {'':10}{inclusive:12d} {r['calls']:9d}  "
+              f"{name}  (self {r['self']})", file=out)
+        for callee, e in report.callees(name)[:8]:
+            print(f"{'':18}{e['cycles']:12d} {e['calls']:9d}      {callee}", file=out)
+
+
+def _default_sym(image):
+    path = os.path.splitext(image)[0] + '.sym'
+    return path if os.path.exists(path) else None
+
+
+def profile_run(image, script, altair=False, limit=None, directory=None, z80=False,
+                syms=None):
+    """Run image on script under a Profiler; return (machine, stop, profiler).
+
+    syms should be the table the profile will be reported against.
+    """
+    end = len(image) if altair else 0x100 + len(image)
+    profiler = Profiler(syms, end)
+    cpu = Z80(timed=True) if z80 else CPU(timed=True)
+    with tempfile.TemporaryDirectory(prefix='profile_') as tmp:
+        if altair:
+            machine = Altair(image, cpu=cpu)
+        else:
+            if directory:
+                shutil.copytree(directory, tmp, dirs_exist_ok=True)
+            machine = CPM(image, directory=tmp, cpu=cpu)
+        profiler.attach(machine)
+        machine.feed(script)
+        stop = machine.run(limit)
+    return machine, stop, profiler
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python3 -m emu80.profile',
+                                     description='Profile T-states per routine')
+    parser.add_argument('image', help='Image to run (.COM, or a bare image with --altair)')
+    parser.add_argument('--input', required=True, help='File with console input')
+    parser.add_argument('--sym', help='Symbol file (default: image with .sym if present)')
+    parser.add_argument('--src', help='Source directory, to show the module of each routine')
+    parser.add_argument('--altair', action='store_true', help='Run as an Altair image loaded at 0')
+    parser.add_argument('--z80', action='store_true', help='Run and time on the Z80 core')
+    parser.add_argument('--top', type=int, default=30, help='Routines to show (default: 30)')
+    parser.add_argument('--graph', action='store_true', help='Also print the call graph')
+    parser.add_argument('--json', help='Write the full profile as JSON to this file')
+    parser.add_argument('--limit', type=int, help='Stop after this many instructions')
+    parser.add_argument('--dir', help='Directory copied to drive A: of a CP/M run')
+    args = parser.parse_args()
+
+    with open(args.image, 'rb') as f:
+        image = f.read()
+    with open(args.input, 'rb') as f:
+        script = f.read()
+    sym = args.sym or _default_sym(args.image)
+    syms = load_symbols(sym, args.src, min_addr=0 if args.altair else 0x100) if sym else None
+
+    machine, stop, profiler = profile_run(image, script, args.altair, args.limit, args.dir,
+                                           args.z80, syms)
+    end = len(image) if args.altair else 0x100 + len(image)
+    report = Report(profiler, syms, end)
+
+    print(f"Stopped with '{stop}' after {machine.instructions} instructions")
+    print_flat(report, args.top)
+    if args.graph:
+        print_graph(report, args.top)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report.to_dict(), f, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
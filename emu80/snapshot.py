@@ -0,0 +1,224 @@
+"""
+snapshot.py - Save a machine after start-up and restore it for each test
+
+A snapshot file is the 64K of RAM exactly as the CPU sees it, followed
+by a trailer: MAGIC, the length of a JSON record and the record itself
+(registers, interrupt and halt state, cycle and instruction counts, the
+CPU type, the machine type and its own state such as the CP/M DMA address or the
+Altair sense switches, and any console input still queued).  Breakpoints
+are not saved; their HLTs are replaced by the original opcodes in the
+image.  CP/M host files are not part of the snapshot either: the
+restored machine uses whatever directory it is given.
+
+Because the RAM comes first, restore() maps it straight into the new
+CPU as a private copy-on-write mapping: all the runs restored from one
+snapshot share its pages until they write to them, and start-up costs
+nothing but the mmap.  Take the snapshot once the interpreter has
+answered its start-up questions (MEMORY SIZE, TERMINAL WIDTH, the
+functions to keep) and sits waiting for a command, then restore it for
+every test script instead of booting again.
+
+Usage:
+    python3 -m emu80.snapshot take <image> [--answers TEXT] [--altair] [--z80]
+                                   [-o FILE] [--limit N] [--dir DIR]
+    python3 -m emu80.snapshot run <snapshot> --input FILE [--dir DIR] [--limit N]
+                                  [--jit]
+    python3 -m emu80.snapshot info <snapshot>
+
+    python3 -m emu80.snapshot take 4k8k/8k/8kbas.bin --altair \\
+        --answers '32000\\n72\\nY\\nY\\nY\\n' -o 8k.snap
+
+    from emu80.snapshot import restore
+    machine = restore('8k.snap')
+    machine.feed('PRINT 2+2\\n')
+    machine.run()
+"""
+
+import sys
+import json
+import mmap
+import struct
+import argparse
+import tempfile
+
+from .cpu import CPU
+from .z80 import Z80
+from .cpm import CPM
+from .altair import Altair
+from .machine import STOP_INPUT
+from .trace import _encoded
+
+
+MAGIC = b'EMU80SNP'
+VERSION = 1
+SIZE = 0x10000
+
+# CPU and machine classes that can be restored, and the attributes saved for each
+CPUS = {'CPU': CPU, 'Z80': Z80}
+MACHINES = {'CPM': CPM, 'Altair': Altair}
+STATE = {'CPM': ('dma', 'exit_code'), 'Altair': ('switches',)}
+
+
+def save(machine, path):
+    """Write machine's RAM, registers and state to path."""
+    cpu = machine.cpu
+    kind = type(machine).__name__
+    if kind not in MACHINES:
+        raise ValueError(f"cannot snapshot a {kind}")
+    ram = bytearray(cpu.mem)
+    for addr, (opcode, _) in machine.breakpoints.items():
+        ram[addr] = opcode
+    record = {'version': VERSION, 'machine': kind, 'cpu': type(cpu).__name__,
+              'registers': cpu.registers(), 'inte': cpu.inte, 'halted': cpu.halted,
+              'cycles': cpu.cycles, 'instructions': machine.instructions,
+              'typeahead': machine.typeahead,
+              'input': machine.input.decode('latin-1'),
+              'state': {name: getattr(machine, name) for name in STATE[kind]}}
+    trailer = json.dumps(record, sort_keys=True).encode('ascii')
+    with open(path, 'wb') as f:
+        f.write(ram)
+        f.write(MAGIC + struct.pack('<I', len(trailer)) + trailer)
+
+
+def read_record(path):
+    """Return the JSON record of a snapshot file."""
+    with open(path, 'rb') as f:
+        f.seek(SIZE)
+        head = f.read(len(MAGIC) + 4)
+        if len(head) != len(MAGIC) + 4 or head[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path}: not a snapshot file")
+        length, = struct.unpack('<I', head[len(MAGIC):])
+        record = json.loads(f.read(length))
+    if record['version'] != VERSION:
+        raise ValueError(f"{path}: snapshot version {record['version']}, expected {VERSION}")
+    return record
+
+
+def restore(path, cpu=None, directory='.', timed=False, shared=True, jit=False):
+    """Return a new machine in the state saved in path.
+
+    With shared set the RAM is a copy-on-write mapping of the file, so
+    writes stay private to this machine; otherwise it is read into a
+    bytearray.  A given cpu keeps its handlers but gets the saved memory,
+    registers and cycle count, and must be of the saved type (the 8080
+    CPU or the Z80).  jit gives a new CPU a block cache (see jit.py).
+    """
+    record = read_record(path)
+    kind = record.get('cpu', 'CPU')
+    if cpu is None:
+        cpu = CPUS[kind](timed=timed, jit=jit)
+    elif type(cpu).__name__ != kind:
+        raise ValueError(f"{path}: snapshot of a {kind}, not a {type(cpu).__name__}")
+    with open(path, 'rb') as f:
+        if shared:
+            mem = mmap.mmap(f.fileno(), SIZE, access=mmap.ACCESS_COPY)
+        else:
+            mem = bytearray(f.read(SIZE))
+
+    kind = record['machine']
+    if kind == 'CPM':
+        machine = CPM(b'', directory=directory, cpu=cpu, typeahead=record['typeahead'])
+    else:
+        machine = Altair(b'', cpu=cpu, typeahead=record['typeahead'])
+    cpu.mem = machine.mem = mem
+    for name, value in record['registers'].items():
+        setattr(cpu, name, value)
+    cpu.inte = record['inte']
+    cpu.halted = record['halted']
+    cpu.cycles = record['cycles']
+    machine.instructions = record['instructions']
+    machine.input = bytearray(record['input'].encode('latin-1'))
+    for name, value in record['state'].items():
+        setattr(machine, name, value)
+    return machine
+
+
+def take(image, answers='', altair=False, path='emu80.snap', limit=None, directory=None,
+         z80=False):
+    """Boot image, answer its start-up questions and save a snapshot.
+
+    Returns (stop reason, machine); the reason is STOP_INPUT when the
+    interpreter reached its command prompt, and only then is the
+    snapshot written.  With z80 set the image runs on the Z80 core.
+    """
+    cpu = Z80() if z80 else None
+    with tempfile.TemporaryDirectory(prefix='snapshot_') as tmp:
+        if altair:
+            machine = Altair(image, cpu=cpu)
+        else:
+            machine = CPM(image, directory=directory or tmp, cpu=cpu)
+        machine.feed(answers)
+        stop = machine.run(limit)
+        if stop == STOP_INPUT:
+            save(machine, path)
+    return stop, machine
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python3 -m emu80.snapshot',
+                                     description='Save and restore machines after start-up')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('take', help='Boot an image to its prompt and save a snapshot')
+    p.add_argument('image', help='Image to run (.COM, or a bare image with --altair)')
+    p.add_argument('--answers', default='',
+                   help='Console input up to the prompt, \\n for newline')
+    p.add_argument('--altair', action='store_true', help='Run as an Altair image loaded at 0')
+    p.add_argument('--z80', action='store_true', help='Run on the Z80 core')
+    p.add_argument('-o', '--output', default='emu80.snap', help='Snapshot file (default: emu80.snap)')
+    p.add_argument('--limit', type=int, help='Stop after this many instructions')
+    p.add_argument('--dir', help='Directory used as drive A: while booting')
+
+    p = sub.add_parser('run', help='Restore a snapshot and run a script on it')
+    p.add_argument('snapshot', help='Snapshot file')
+    p.add_argument('--input', required=True, help='File with console input')
+    p.add_argument('--dir', default='.', help='Directory used as drive A: (default: .)')
+    p.add_argument('--limit', type=int, help='Stop after this many more instructions')
+    p.add_argument('--jit', action='store_true', help='Run compiled basic blocks')
+
+    p = sub.add_parser('info', help='Show the saved registers and state')
+    p.add_argument('snapshot', help='Snapshot file')
+
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        record = read_record(args.snapshot)
+        regs = record['registers']
+        print(f"{record['machine']} after {record['instructions']} instructions, "
+              f"{record['cycles']} T-states")
+        print(f"  {record.get('cpu', 'CPU')}: " +
+              ' '.join(f"{name.upper()}={regs[name]:04X}" if name in ('sp', 'pc', 'ix', 'iy')
+                              else f"{name.upper()}={regs[name]:02X}" for name in regs))
+        for name, value in record['state'].items():
+            print(f"  {name} = {value}")
+        if record['input']:
+            print(f"  {len(record['input'])} characters of input queued")
+        return 0
+
+    if args.command == 'take':
+        with open(args.image, 'rb') as f:
+            image = f.read()
+        stop, machine = take(image, _encoded(args.answers), args.altair, args.output,
+                             args.limit, args.dir, args.z80)
+        sys.stdout.write(machine.output_text())
+        if stop != STOP_INPUT:
+            print(f"\n[stopped: {stop} at PC={machine.cpu.pc:04X}; no snapshot written]",
+                  file=sys.stderr)
+            return 1
+        print(f"\n[{args.output}: PC={machine.cpu.pc:04X} after {machine.instructions} "
+              f"instructions]", file=sys.stderr)
+        return 0
+
+    machine = restore(args.snapshot, directory=args.dir, jit=args.jit)
+    with open(args.input, 'rb') as f:
+        machine.feed(f.read())
+    limit = None if args.limit is None else machine.instructions + args.limit
+    stop = machine.run(limit)
+    sys.stdout.write(machine.output_text())
+    sys.stdout.flush()
+    print(f"\n[stopped: {stop} at PC={machine.cpu.pc:04X}]", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+test_jit.py - The block cache must count exactly as the handler loop does
+
+Each case runs an interpreter twice on the same BASIC program, once on
+the handler loop and once on compiled blocks, and compares instruction
+and T-state counts, registers, memory and console output, both at the
+end of the run and when stopped part way by an instruction limit.
+
+Usage:
+    python3 -m unittest emu80.test_jit       (from the repository root)
+"""
+
+import os
+import tempfile
+import unittest
+
+from .cpu import CPU
+from .z80 import Z80
+from .cpm import CPM
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMAGES = {'5.21': ('mbasic_521/com/mbasic.com', CPU),
+          'z80': ('mbasicz/out/mbasicz.com', Z80)}
+
+# Loops, GOSUB, floating point (the self-patching divide in mbasicz),
+# strings and garbage collection, then an error and a direct statement
+PROGRAM = '''10 DEFINT I:DIM A(20)
+20 FOR I=1 TO 20:A(I)=I*I:NEXT
+30 FOR I=1 TO 60:X=X+SQR(I)/(I+1):GOSUB 100:NEXT
+40 PRINT X;A(20);LEN(S$)
+50 PRINT 1/0
+60 END
+100 S$=S$+CHR$(65+I MOD 26):IF LEN(S$)>40 THEN S$=MID$(S$,20)
+110 RETURN
+RUN
+PRINT 2^10,EXP(1)
+SYSTEM
+'''
+
+
+def run(image, cpu_class, jit, limit=None):
+    """Run PROGRAM on image; returns everything the two modes must agree on."""
+    with open(os.path.join(ROOT, image), 'rb') as f:
+        data = f.read()
+    with tempfile.TemporaryDirectory(prefix='jit_') as tmp:
+        cpu = cpu_class(timed=True, jit=jit)
+        machine = CPM(data, directory=tmp, cpu=cpu)
+        machine.feed(PROGRAM)
+        stop = machine.run(limit)
+    return {'stop': stop, 'instructions': machine.instructions, 'cycles': cpu.cycles,
+            'registers': cpu.registers(), 'memory': bytes(cpu.mem),
+            'output': bytes(machine.output)}
+
+
+class JitCountTest(unittest.TestCase):
+
+    def check(self, name, limit=None):
+        image, cpu_class = IMAGES[name]
+        if not os.path.exists(os.path.join(ROOT, image)):
+            self.skipTest(f'{image} is not built')
+        loop = run(image, cpu_class, False, limit)
+        blocks = run(image, cpu_class, True, limit)
+        for key in loop:
+            self.assertEqual(loop[key], blocks[key], f'{name}: {key} differs')
+        return loop
+
+    def test_8080_whole_run(self):
+        result = self.check('5.21')
+        self.assertEqual(result['stop'], 'exit')
+        self.assertIn(b'Division by zero', result['output'])
+
+    def test_z80_whole_run(self):
+        self.assertEqual(self.check('z80')['stop'], 'exit')
+
+    def test_stopped_by_a_limit(self):
+        # Limits that fall inside blocks, so the last ones are stepped
+        for limit in (100_003, 345_677):
+            self.assertEqual(self.check('5.21', limit)['instructions'], limit)
+            self.assertEqual(self.check('z80', limit)['instructions'], limit)
+
+
+if __name__ == '__main__':
+    unittest.main()
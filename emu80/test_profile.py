@@ -0,0 +1,67 @@
+"""
+test_profile.py - Tests for the routine accounting in profile.py
+
+Usage:
+    python3 -m unittest emu80.test_profile       (from the repository root)
+"""
+
+import unittest
+
+from .cpu import CPU
+from .cpm import CPM
+from .machine import STOP_EXIT
+from .profile import Profiler, Report, SymbolTable
+
+# START calls A, which calls C and then jumps into B; B returns from A's
+# frame, and START calls out of the image to the BDOS before it exits.
+IMAGE = bytes.fromhex(
+    'cd1001'            # 0100 START: CALL A
+    '0e0b'              # 0103        MVI  C,11
+    'cd0500'            # 0105        CALL 5
+    'c30000'            # 0108        JMP  0
+    '0000000000'        # 010B
+    '00'                # 0110 A:     NOP
+    'cd2001'            # 0111        CALL C
+    'c31801'            # 0114        JMP  B
+    '00'                # 0117
+    '000000'            # 0118 B:     NOP; NOP; NOP
+    'c9'                # 011B        RET
+    '00000000'          # 011C
+    '00'                # 0120 C:     NOP
+    'c9')               # 0121        RET
+
+SYMS = [(0x100, 'START'), (0x110, 'A'), (0x118, 'B'), (0x120, 'C')]
+
+
+def profile(syms):
+    machine = CPM(IMAGE, cpu=CPU(timed=True))
+    profiler = Profiler(syms, 0x100 + len(IMAGE))
+    profiler.attach(machine)
+    stop = machine.run(1000)
+    return stop, Report(profiler, syms, 0x100 + len(IMAGE))
+
+
+class ReportTest(unittest.TestCase):
+
+    def test_inclusive_covers_frames_into_and_out_of_a_routine(self):
+        stop, report = profile(SymbolTable(SYMS))
+        self.assertEqual(stop, STOP_EXIT)
+        r = report.routines
+        # B is only jumped to: its time is its own, and it belongs to A's frame
+        self.assertEqual(r['B']['calls'], 0)
+        self.assertEqual(r['B']['inclusive'], r['B']['self'])
+        self.assertEqual(r['A']['inclusive'], r['A']['self'] + r['B']['self'] + r['C']['self'])
+        self.assertEqual(r['C']['inclusive'], r['C']['self'])
+        # START's calls cover everything but its own code
+        self.assertEqual(r['START']['inclusive'], report.total)
+
+    def test_inclusive_is_never_below_self(self):
+        for syms in (SymbolTable(SYMS), None):
+            _, report = profile(syms)
+            for name, r in report.routines.items():
+                self.assertGreaterEqual(r['inclusive'], r['self'], name)
+                self.assertLessEqual(r['inclusive'], report.total, name)
+
+
+if __name__ == '__main__':
+    unittest.main()
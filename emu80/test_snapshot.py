@@ -0,0 +1,84 @@
+"""
+test_snapshot.py - A restored snapshot must carry on exactly as the original
+
+Usage:
+    python3 -m unittest emu80.test_snapshot       (from the repository root)
+"""
+
+import os
+import tempfile
+import unittest
+
+from .cpu import CPU
+from .z80 import Z80
+from .cpm import CPM
+from .machine import STOP_INPUT
+from .snapshot import save, restore, read_record
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROGRAM = '''10 FOR I=1 TO 30:S$=S$+CHR$(64+I):X=X+1/I:NEXT
+20 PRINT S$;X
+RUN
+'''
+
+
+def state(machine):
+    cpu = machine.cpu
+    return {'registers': cpu.registers(), 'inte': cpu.inte, 'halted': cpu.halted,
+            'cycles': cpu.cycles, 'instructions': machine.instructions,
+            'memory': bytes(cpu.mem), 'input': bytes(machine.input), 'dma': machine.dma}
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory(prefix='snapshot_')
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.path = os.path.join(self.dir, 'test.snap')
+
+    def boot(self, image, cpu):
+        with open(os.path.join(ROOT, image), 'rb') as f:
+            data = f.read()
+        machine = CPM(data, directory=self.dir, cpu=cpu)
+        # Queued input that has not been read yet must survive too
+        machine.feed('PRINT 1\n')
+        self.assertEqual(machine.run(), STOP_INPUT)
+        machine.feed('PRINT 2\n')
+        return machine
+
+    def round_trip(self, image, cpu_class):
+        original = self.boot(image, cpu_class(timed=True))
+        save(original, self.path)
+        saved = state(original)
+        self.assertEqual(read_record(self.path)['cpu'], cpu_class.__name__)
+        for shared in (True, False):
+            with self.subTest(shared=shared):
+                copy = restore(self.path, directory=self.dir, timed=True, shared=shared)
+                self.assertIsInstance(copy.cpu, cpu_class)
+                self.assertEqual(state(copy), saved)
+
+        # Both go on to run the same program the same way
+        shown = len(original.output)
+        restored = restore(self.path, directory=self.dir, timed=True)
+        for machine in (original, restored):
+            machine.feed(PROGRAM)
+            self.assertEqual(machine.run(machine.instructions + 5_000_000), STOP_INPUT)
+        self.assertEqual(state(restored), state(original))
+        self.assertEqual(bytes(restored.output), bytes(original.output[shown:]))
+        self.assertIn(b'ABCDEFGHIJ', bytes(restored.output))
+
+        # Writes to a shared restore stay private to it
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(0x10000), saved['memory'])
+
+    def test_8080_round_trip(self):
+        self.round_trip('mbasic_521/com/mbasic.com', CPU)
+
+    def test_z80_round_trip(self):
+        self.round_trip('mbasicz/out/mbasicz.com', Z80)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,331 @@
+"""
+trace.py - Code/data coverage bitmaps and ud80 options from test runs
+
+A Tracer gives a machine its own handler set, compiled from the same
+templates with a prologue that records each executed instruction's start
+and length, and with RD/WR expanded to mark the bytes they touch.  Stack
+traffic (every template addressing through SP) is left out, so only real
+data use of the image is marked.  Nothing is logged per access: a run
+leaves four 64K bitmaps (instruction starts, code bytes, data read, data
+written), which are saved packed to a .trace file and ORed together
+across runs.
+
+From the merged bitmaps the ud80 options are written in the format of
+4k8k/tests/trace.txt: -d for every range read or written as data and
+never executed, and -e for every executed instruction that nothing falls
+through into (the start of each executed region, or the instruction after
+an unconditional jump or return).
+
+Usage:
+    python3 -m emu80.trace run <image> <input>... [--altair] [--trace FILE]
+                               [--prefix TEXT] [--suffix TEXT] [--new]
+                               [--options FILE] [--limit N] [--dir DIR]
+    python3 -m emu80.trace merge <out.trace> <in.trace>...
+    python3 -m emu80.trace options <trace> <image> [--origin HEX] [-o FILE]
+
+    python3 -m emu80.trace run 4k8k/8k/8kbas.bin 4k8k/tests/test_full.txt \\
+        --altair --trace 8k.trace --options 8k_trace.txt
+    python3 -m um80.ud80 8kbas.bin --org 0 $(grep -v '^#' 8k_trace.txt)
+"""
+
+import os
+import sys
+import struct
+import shutil
+import argparse
+import tempfile
+
+from .cpu import LENGTH
+from .cpm import CPM
+from .altair import Altair
+
+
+MAGIC = b'EMU80TRC'
+VERSION = 1
+SIZE = 0x10000
+MAPS = ('starts', 'code', 'read', 'written')
+
+READ = 0x01
+WRITTEN = 0x02
+
+# Instructions after which execution never falls through
+UNCONDITIONAL = {0xC3, 0xC9, 0xE9}
+
+# Every 8080 stack access is a template addressing through SP
+TRACE_MACROS = {
+    'RD': lambda addr: f'mem[{addr}]' if 'SP' in addr else f'TRACE_RD(mem, {addr})',
+    'WR': lambda addr, value: (f'mem[{addr}] = {value}' if 'SP' in addr
+                               else f'TRACE_WR(mem, {addr}, {value})'),
+}
+PROLOGUE = 'LENGTHS[pc] = {n}'
+
+
+def pack(flags):
+    """Pack a bytearray of 0/1 flags into a bitmap, bit 0 first."""
+    out = bytearray(len(flags) // 8)
+    for i in range(len(out)):
+        chunk = flags[i * 8:i * 8 + 8]
+        byte = 0
+        for bit, flag in enumerate(chunk):
+            if flag:
+                byte |= 1 << bit
+        out[i] = byte
+    return out
+
+
+def unpack(bitmap):
+    """Inverse of pack()."""
+    flags = bytearray(len(bitmap) * 8)
+    for i, byte in enumerate(bitmap):
+        if byte:
+            for bit in range(8):
+                if byte & (1 << bit):
+                    flags[i * 8 + bit] = 1
+    return flags
+
+
+class Trace:
+    """Coverage of one or more runs as 64K flag arrays."""
+
+    def __init__(self):
+        for name in MAPS:
+            setattr(self, name, bytearray(SIZE))
+        self.runs = 0
+
+    def merge(self, other):
+        for name in MAPS:
+            # Flags are 0 or 1 per byte, so one wide OR merges the whole map
+            merged = (int.from_bytes(getattr(self, name), 'little') |
+                      int.from_bytes(getattr(other, name), 'little'))
+            setattr(self, name, bytearray(merged.to_bytes(SIZE, 'little')))
+        self.runs += other.runs
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(MAGIC + struct.pack('<BI', VERSION, self.runs))
+            for name in MAPS:
+                f.write(pack(getattr(self, name)))
+
+    @classmethod
+    def load(cls, path):
+        trace = cls()
+        with open(path, 'rb') as f:
+            data = f.read()
+        header = len(MAGIC) + 5
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path}: not a trace file")
+        version, trace.runs = struct.unpack('<BI', data[len(MAGIC):header])
+        if version != VERSION:
+            raise ValueError(f"{path}: trace version {version}, expected {VERSION}")
+        size = SIZE // 8
+        for i, name in enumerate(MAPS):
+            setattr(trace, name, unpack(data[header + i * size:header + (i + 1) * size]))
+        return trace
+
+    def counts(self, start=0, end=SIZE):
+        """Return (code bytes, data-only bytes, instruction starts) in a range."""
+        code = sum(self.code[start:end])
+        data = sum(1 for a in range(start, end)
+                   if (self.read[a] or self.written[a]) and not self.code[a])
+        return code, data, sum(self.starts[start:end])
+
+
+class Tracer:
+    """Records the coverage of the machines attached to it."""
+
+    def __init__(self):
+        self.lengths = bytearray(SIZE)
+        self.access = bytearray(SIZE)
+        access = self.access
+
+        def read(mem, addr):
+            access[addr] |= READ
+            return mem[addr]
+
+        def write(mem, addr, value):
+            access[addr] |= WRITTEN
+            mem[addr] = value
+
+        self.env = {'LENGTHS': self.lengths, 'TRACE_RD': read, 'TRACE_WR': write}
+
+    def attach(self, machine):
+        machine.cpu.handlers = machine.cpu.compile_handlers(TRACE_MACROS, self.env,
+                                                            prologue=PROLOGUE)
+        return machine
+
+    def result(self):
+        """Return the coverage recorded so far as a one-run Trace."""
+        trace = Trace()
+        for addr in range(SIZE):
+            n = self.lengths[addr]
+            if n:
+                trace.starts[addr] = 1
+                for k in range(n):
+                    trace.code[(addr + k) & 0xFFFF] = 1
+            flags = self.access[addr]
+            if flags & READ:
+                trace.read[addr] = 1
+            if flags & WRITTEN:
+                trace.written[addr] = 1
+        trace.runs = 1
+        return trace
+
+
+def _ranges(flags, start, end):
+    """Yield (first, last) of each run of set flags in [start, end)."""
+    addr = start
+    while addr < end:
+        if flags[addr]:
+            first = addr
+            while addr < end and flags[addr]:
+                addr += 1
+            yield first, addr - 1
+        else:
+            addr += 1
+
+
+def entry_points(trace, image, origin):
+    """Executed instructions in the image that nothing falls through into."""
+    end = origin + len(image)
+    entries = []
+    for addr in range(origin, end):
+        if not trace.starts[addr]:
+            continue
+        reached = False
+        for back in (1, 2, 3):
+            p = addr - back
+            if p >= origin and trace.starts[p]:
+                op = image[p - origin]
+                if LENGTH[op] == back and op not in UNCONDITIONAL:
+                    reached = True
+                break
+        if not reached:
+            entries.append(addr)
+    return entries
+
+
+def options(trace, image, origin, source=None):
+    """Return the ud80 option file text for image loaded at origin."""
+    end = origin + len(image)
+    data = bytearray(SIZE)
+    for addr in range(origin, end):
+        if (trace.read[addr] or trace.written[addr]) and not trace.code[addr]:
+            data[addr] = 1
+    code, data_bytes, starts = trace.counts(origin, end)
+    entries = entry_points(trace, image, origin)
+    lines = ['# Execution trace generated by emu80.trace' + (f' from {source}' if source else ''),
+             '# Addresses executed as code vs accessed as data only',
+             f'# {trace.runs} runs: {code} code bytes ({starts} instructions), '
+             f'{data_bytes} data bytes, {len(entries)} entry points',
+             "# Use with: python3 -m um80.ud80 binary $(grep -v '^#' this_file)",
+             '']
+    lines += [f'-d {first:04X}-{last:04X}' for first, last in _ranges(data, origin, end)]
+    lines += ['', '', '# Entry points (start of executed code regions)']
+    lines += [f'-e {addr:04X}' for addr in entries]
+    return '\n'.join(lines) + '\n'
+
+
+def _default_origin(image_path, altair=False):
+    if altair:
+        return 0
+    return 0x100 if image_path.lower().endswith('.com') else 0
+
+
+def _encoded(text):
+    """Command line text with \\n escapes turned into newlines."""
+    return (text or '').encode('latin-1').decode('unicode_escape')
+
+
+def trace_runs(image, inputs, altair=False, prefix='', suffix='', limit=None, directory=None):
+    """Run image once per input file under a Tracer; yield (input, stop, Trace)."""
+    for path in inputs:
+        with open(path, 'r', errors='replace') as f:
+            script = prefix + f.read() + suffix
+        with tempfile.TemporaryDirectory(prefix='trace_') as tmp:
+            if altair:
+                machine = Altair(image)
+            else:
+                if directory:
+                    shutil.copytree(directory, tmp, dirs_exist_ok=True)
+                machine = CPM(image, directory=tmp)
+            tracer = Tracer()
+            tracer.attach(machine)
+            machine.feed(script)
+            stop = machine.run(limit)
+        yield path, stop, tracer.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python3 -m emu80.trace',
+                                     description='Code/data coverage tracing for ud80')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('run', help='Run input scripts under trace and merge their coverage')
+    p.add_argument('image', help='Image to run (.COM, or a bare image with --altair)')
+    p.add_argument('inputs', nargs='+', help='Console input files, one run each')
+    p.add_argument('--altair', action='store_true', help='Run as an Altair image loaded at 0')
+    p.add_argument('--trace', default='emu80.trace', help='Trace file to merge into (default: emu80.trace)')
+    p.add_argument('--new', action='store_true', help='Start a new trace instead of merging')
+    p.add_argument('--prefix', default='', help='Text sent before each input, \\n for newline')
+    p.add_argument('--suffix', default='', help='Text sent after each input, e.g. RUN\\n')
+    p.add_argument('--options', help='Also write the ud80 option file')
+    p.add_argument('--origin', type=lambda s: int(s, 16), help='Load address (hex) for --options')
+    p.add_argument('--limit', type=int, help='Stop each run after this many instructions')
+    p.add_argument('--dir', help='Directory copied to drive A: of each CP/M run')
+
+    p = sub.add_parser('merge', help='OR trace files together')
+    p.add_argument('output', help='Merged trace file')
+    p.add_argument('traces', nargs='+', help='Trace files to merge')
+
+    p = sub.add_parser('options', help='Write ud80 -d/-e options from a trace')
+    p.add_argument('trace', help='Trace file')
+    p.add_argument('image', help='Image the trace was taken from')
+    p.add_argument('--origin', type=lambda s: int(s, 16),
+                   help='Load address (hex; default 0100 for .COM files, else 0)')
+    p.add_argument('-o', '--output', help='Option file (default: stdout)')
+
+    args = parser.parse_args()
+
+    if args.command == 'merge':
+        merged = Trace()
+        for path in args.traces:
+            merged.merge(Trace.load(path))
+        merged.save(args.output)
+        print(f"{args.output}: {merged.runs} runs, "
+              f"{sum(merged.code)} code bytes, {sum(merged.starts)} instructions")
+        return 0
+
+    with open(args.image, 'rb') as f:
+        image = f.read()
+
+    if args.command == 'options':
+        origin = args.origin if args.origin is not None else _default_origin(args.image)
+        text = options(Trace.load(args.trace), image, origin, os.path.basename(args.trace))
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(text)
+        else:
+            sys.stdout.write(text)
+        return 0
+
+    origin = args.origin if args.origin is not None else _default_origin(args.image, args.altair)
+    end = origin + len(image)
+    trace = Trace()
+    if os.path.exists(args.trace) and not args.new:
+        trace = Trace.load(args.trace)
+    for path, stop, run in trace_runs(image, args.inputs, args.altair, _encoded(args.prefix),
+                                      _encoded(args.suffix), args.limit, args.dir):
+        code, data, _ = run.counts(origin, end)
+        trace.merge(run)
+        total, _, _ = trace.counts(origin, end)
+        print(f"{path}: stopped with '{stop}', {code} code bytes, {data} data bytes "
+              f"({total} code bytes merged)")
+    trace.save(args.trace)
+    if args.options:
+        with open(args.options, 'w') as f:
+            f.write(options(trace, image, origin, os.path.basename(args.trace)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
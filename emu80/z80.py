@@ -0,0 +1,459 @@
+"""
+z80.py - Zilog Z80 CPU core
+
+The Z80 runs 8080 programs unchanged but sets its flags its own way (P/V
+is overflow after arithmetic, N marks a subtraction, H is a true half
+carry), takes different T-states and adds JR, DJNZ, the alternate
+register set, IX/IY and the CB, ED, DD and FD prefixed instructions.
+Its templates follow cpu.py: registers A B C D E H L F SP IX IY as
+locals, N/NN operands, DISP for a signed displacement, and the same
+RD/WR/EXTRA/CALLED/RETURNED macros, so the timing, tracing and profiling
+executors work on a Z80 unchanged.
+
+Each table (unprefixed, CB, ED, DD, FD, DD CB, FD CB) is compiled into
+256 handlers.  The CB, DD, ED and FD handlers of the unprefixed table
+dispatch on the next opcode byte (DD CB d and FD CB d on the fourth), and
+every handler starts from the first prefix byte, so a prologue sees the
+whole instruction with its full length and T-states.  DD and FD tables
+are generated from the unprefixed templates that use HL, with IX or IY
+for HL, (IX+d) for (HL) and the undocumented IXH/IXL for H and L; before
+any other opcode the prefix runs as a 4 T-state no-op, as on the chip.
+LDIR and the other repeating instructions re-execute themselves, so each
+iteration counts as an instruction.  R is not advanced and interrupts
+are never raised: IM, EI, RETI and RETN only record or return.
+
+Usage:
+    from emu80.z80 import Z80
+    machine = CPM(image, cpu=Z80(timed=True))
+"""
+
+from .cpu import (CPU, SZP, REGS, CONDS, PLAIN_MACROS, TIMED_MACROS, TIMED_PROLOGUE,
+                  _HL, _PUSH_PC, _CALL, _RET, _indent, function_source)
+
+
+# The Z80 keeps N in bit 1, which the 8080 tables always set
+SZP80 = bytes(v & 0xFD for v in SZP)
+SZ = bytes(v & 0xC0 for v in SZP)
+
+# Operation of each CB rotate/shift on v: result x and carry c
+_ROTATES = [
+    'c = v >> 7\nx = ((v << 1) | c) & 0xFF',            # RLC
+    'c = v & 1\nx = (v >> 1) | (c << 7)',               # RRC
+    'c = v >> 7\nx = ((v << 1) | (F & 1)) & 0xFF',      # RL
+    'c = v & 1\nx = (v >> 1) | ((F & 1) << 7)',         # RR
+    'c = v >> 7\nx = (v << 1) & 0xFF',                  # SLA
+    'c = v & 1\nx = (v >> 1) | (v & 0x80)',             # SRA
+    'c = v >> 7\nx = ((v << 1) | 1) & 0xFF',            # SLL (undocumented)
+    'c = v & 1\nx = v >> 1',                            # SRL
+]
+
+_PAIRS = (('B', 'C'), ('D', 'E'), ('H', 'L'))
+
+
+def _alu(op, v):
+    """Z80 template for ALU operation op (0-7) with operand expression v."""
+    load = f'v = {v}\n'
+    if op in (0, 1):            # ADD, ADC
+        carry = ' + (F & 1)' if op == 1 else ''
+        return load + (f'x = A + v{carry}\n'
+                       'F = (SZ[x & 0xFF] | (x >> 8) | ((A ^ v ^ x) & 0x10) |\n'
+                       '     ((~(A ^ v) & (A ^ x) & 0x80) >> 5))\n'
+                       'A = x & 0xFF')
+    if op in (2, 3, 7):         # SUB, SBC, CP
+        borrow = ' - (F & 1)' if op == 3 else ''
+        body = (f'x = A - v{borrow}\n'
+                'F = (SZ[x & 0xFF] | ((x >> 8) & 1) | ((A ^ v ^ x) & 0x10) |\n'
+                '     (((A ^ v) & (A ^ x) & 0x80) >> 5) | 0x02)')
+        return load + body + ('' if op == 7 else '\nA = x & 0xFF')
+    if op == 4:                 # AND sets H
+        return load + 'A = A & v\nF = SZP80[A] | 0x10'
+    sym = '^' if op == 5 else '|'
+    return load + f'A = A {sym} v\nF = SZP80[A]'
+
+
+def _step(pair, delta):
+    """Statements adding delta (+1 or -1) to register pair BC, DE or HL."""
+    hi, lo = _PAIRS[pair]
+    if delta > 0:
+        return f'{lo} = ({lo} + 1) & 0xFF\nif not {lo}:\n    {hi} = ({hi} + 1) & 0xFF'
+    return f'{lo} = ({lo} - 1) & 0xFF\nif {lo} == 0xFF:\n    {hi} = ({hi} - 1) & 0xFF'
+
+
+def _main(ix=None):
+    """Templates of the unprefixed opcodes, or with ix ('IX' or 'IY') of
+    the DD/FD opcodes that use HL.
+
+    Returns {op: (body, length, operands, T-states)}.
+    """
+    t = {}
+    prefix = 1 if ix else 0
+    addr = f'({ix} + DISP) & 0xFFFF' if ix else _HL
+    hl = ix or _HL
+
+    def get(r, m=False):
+        if r == 'M':
+            return f'RD({addr})'
+        if ix and not m and r in 'HL':
+            return f'({ix} >> 8)' if r == 'H' else f'({ix} & 0xFF)'
+        return r
+
+    def put(r, v, m=False):
+        if r == 'M':
+            return f'WR({addr}, {v})'
+        if ix and not m and r in 'HL':
+            if r == 'H':
+                return f'{ix} = ({ix} & 0xFF) | (({v}) << 8)'
+            return f'{ix} = ({ix} & 0xFF00) | ({v})'
+        return f'{r} = {v}'
+
+    def set_hl(v):
+        return f'{ix} = {v}' if ix else f'w = {v}\nH = w >> 8\nL = w & 0xFF'
+
+    def pair(rp):
+        return ('((B << 8) | C)', '((D << 8) | E)', hl, 'SP')[rp]
+
+    def add(op, body, length, cycles, uses_hl=False, m=False, imm=None, ix_cycles=None):
+        if ix and not (uses_hl or m):
+            return
+        operands = {}
+        k = prefix + 1
+        if ix and m:
+            operands['DISP'] = k
+            k += 1
+        if imm:
+            operands[imm] = k
+        if ix:
+            length += prefix + (1 if m else 0)
+            cycles = ix_cycles if ix_cycles is not None else cycles + 4
+        t[op] = (body, length, operands, cycles)
+
+    add(0x00, '', 1, 4)
+    add(0x08, 'x = A\nA = cpu.a_\ncpu.a_ = x\nx = F\nF = cpu.f_\ncpu.f_ = x', 1, 4)
+    add(0x10, 'B = (B - 1) & 0xFF\nif B:\n    EXTRA(5)\n    PC = (PC + DISP) & 0xFFFF',
+        2, 8, imm='DISP')
+    add(0x18, 'PC = (PC + DISP) & 0xFFFF', 2, 12, imm='DISP')
+    for k, op in enumerate((0x20, 0x28, 0x30, 0x38)):
+        add(op, f'if {CONDS[k]}:\n    EXTRA(5)\n    PC = (PC + DISP) & 0xFFFF', 2, 7, imm='DISP')
+
+    for rp in range(4):
+        base = rp << 4
+        uses = rp == 2
+        if rp == 3:
+            load, inc, dec = 'SP = NN', 'SP = (SP + 1) & 0xFFFF', 'SP = (SP - 1) & 0xFFFF'
+        elif ix and uses:
+            load, inc, dec = f'{ix} = NN', f'{ix} = ({ix} + 1) & 0xFFFF', f'{ix} = ({ix} - 1) & 0xFFFF'
+        else:
+            hi, lo = _PAIRS[rp]
+            load, inc, dec = f'{hi} = NN >> 8\n{lo} = NN & 0xFF', _step(rp, 1), _step(rp, -1)
+        add(base + 0x01, load, 3, 10, uses, imm='NN')
+        add(base + 0x03, inc, 1, 6, uses)
+        add(base + 0x0B, dec, 1, 6, uses)
+        add(base + 0x09, (f'v = {pair(rp)}\nx = {hl} + v\n'
+                          f'F = (F & 0xC4) | (x >> 16) | ((({hl} ^ v ^ x) >> 8) & 0x10)\n'
+                          + set_hl('x & 0xFFFF')), 1, 11, True)
+
+    add(0x02, 'WR((B << 8) | C, A)', 1, 7)
+    add(0x12, 'WR((D << 8) | E, A)', 1, 7)
+    add(0x0A, 'A = RD((B << 8) | C)', 1, 7)
+    add(0x1A, 'A = RD((D << 8) | E)', 1, 7)
+    add(0x22, f'WR(NN, {get("L")})\nWR((NN + 1) & 0xFFFF, {get("H")})', 3, 16, True, imm='NN')
+    add(0x2A, f'{put("L", "RD(NN)")}\n{put("H", "RD((NN + 1) & 0xFFFF)")}', 3, 16, True,
+        imm='NN')
+    add(0x32, 'WR(NN, A)', 3, 13, imm='NN')
+    add(0x3A, 'A = RD(NN)', 3, 13, imm='NN')
+
+    for r in range(8):
+        reg = REGS[r]
+        m = reg == 'M'
+        uses = reg in ('H', 'L')
+        add((r << 3) | 0x04, (f'x = ({get(reg, m)} + 1) & 0xFF\n{put(reg, "x", m)}\n'
+                              'F = ((F & 1) | SZ[x] | (0 if x & 0x0F else 0x10) |\n'
+                              '     (0x04 if x == 0x80 else 0))'),
+            1, 11 if m else 4, uses, m, ix_cycles=23 if m else None)
+        add((r << 3) | 0x05, (f'x = ({get(reg, m)} - 1) & 0xFF\n{put(reg, "x", m)}\n'
+                              'F = ((F & 1) | SZ[x] | (0x10 if x & 0x0F == 0x0F else 0) |\n'
+                              '     (0x04 if x == 0x7F else 0) | 0x02)'),
+            1, 11 if m else 4, uses, m, ix_cycles=23 if m else None)
+        add((r << 3) | 0x06, put(reg, 'N', m), 2, 10 if m else 7, uses, m, imm='N',
+            ix_cycles=19 if m else None)
+
+    add(0x07, 'A = ((A << 1) | (A >> 7)) & 0xFF\nF = (F & 0xC4) | (A & 1)', 1, 4)
+    add(0x0F, 'F = (F & 0xC4) | (A & 1)\nA = ((A >> 1) | (A << 7)) & 0xFF', 1, 4)
+    add(0x17, 'x = (A << 1) | (F & 1)\nF = (F & 0xC4) | (x >> 8)\nA = x & 0xFF', 1, 4)
+    add(0x1F, 'x = A | ((F & 1) << 8)\nF = (F & 0xC4) | (A & 1)\nA = x >> 1', 1, 4)
+    add(0x27, ('v = 0\nx = F & 1\n'
+               'if (A & 0x0F) > 9 or F & 0x10:\n    v = 0x06\n'
+               'if A > 0x99 or x:\n    v |= 0x60\n    x = 1\n'
+               'y = (A - v if F & 0x02 else A + v) & 0xFF\n'
+               'F = SZP80[y] | x | (F & 0x02) | ((A ^ y) & 0x10)\n'
+               'A = y'), 1, 4)
+    add(0x2F, 'A ^= 0xFF\nF |= 0x12', 1, 4)
+    add(0x37, 'F = (F & 0xC4) | 1', 1, 4)
+    add(0x3F, 'F = (F & 0xC4) | ((F & 1) << 4) | ((F & 1) ^ 1)', 1, 4)
+
+    for op in range(0x40, 0x80):
+        dst, src = REGS[(op >> 3) & 7], REGS[op & 7]
+        m = 'M' in (dst, src)
+        add(op, put(dst, get(src, m), m), 1, 7 if m else 4, bool({dst, src} & {'H', 'L'}),
+            m, ix_cycles=19 if m else None)
+    add(0x76, 'cpu.halted = True', 1, 4)
+
+    for op in range(0x80, 0xC0):
+        src = REGS[op & 7]
+        m = src == 'M'
+        add(op, _alu((op >> 3) & 7, get(src, m)), 1, 7 if m else 4, src in ('H', 'L'), m,
+            ix_cycles=19 if m else None)
+
+    for cc in range(8):
+        base = 0xC0 | (cc << 3)
+        cond = CONDS[cc]
+        add(base + 0, f'if {cond}:\n' + _indent('EXTRA(6)\n' + _RET), 1, 5)
+        add(base + 2, f'if {cond}:\n    PC = NN', 3, 10, imm='NN')
+        add(base + 4, f'if {cond}:\n' + _indent('EXTRA(7)\n' + _CALL), 3, 10, imm='NN')
+        add(base + 6, _alu(cc, 'N'), 2, 7, imm='N')
+        add(base + 7, _PUSH_PC + f'\nPC = 0x{cc << 3:02X}\nCALLED(PC, SP)', 1, 11)
+
+    for rp, (hi, lo) in enumerate(_PAIRS[:2]):
+        add(0xC1 + (rp << 4), (f'{lo} = RD(SP)\n{hi} = RD((SP + 1) & 0xFFFF)\n'
+                               'SP = (SP + 2) & 0xFFFF'), 1, 10)
+        add(0xC5 + (rp << 4), (f'SP = (SP - 2) & 0xFFFF\n'
+                               f'WR(SP, {lo})\nWR((SP + 1) & 0xFFFF, {hi})'), 1, 11)
+    add(0xE1, (set_hl('RD(SP) | (RD((SP + 1) & 0xFFFF) << 8)') +
+               '\nSP = (SP + 2) & 0xFFFF'), 1, 10, True)
+    add(0xE5, (f'SP = (SP - 2) & 0xFFFF\nv = {hl}\n'
+               'WR(SP, v & 0xFF)\nWR((SP + 1) & 0xFFFF, v >> 8)'), 1, 11, True)
+    add(0xF1, 'F = RD(SP)\nA = RD((SP + 1) & 0xFFFF)\nSP = (SP + 2) & 0xFFFF', 1, 10)
+    add(0xF5, 'SP = (SP - 2) & 0xFFFF\nWR(SP, F)\nWR((SP + 1) & 0xFFFF, A)', 1, 11)
+
+    add(0xC3, 'PC = NN', 3, 10, imm='NN')
+    add(0xC9, _RET, 1, 10)
+    add(0xCD, _CALL, 3, 17, imm='NN')
+    add(0xD3, 'cpu.port_out(N, A)', 2, 11, imm='N')
+    add(0xDB, 'A = cpu.port_in(N) & 0xFF', 2, 11, imm='N')
+    add(0xD9, ''.join(f'x = {r}\n{r} = cpu.{r.lower()}_\ncpu.{r.lower()}_ = x\n'
+                      for r in 'BCDEHL').rstrip('\n'), 1, 4)
+    add(0xE3, (f'x = RD(SP) | (RD((SP + 1) & 0xFFFF) << 8)\nv = {hl}\n'
+               'WR(SP, v & 0xFF)\nWR((SP + 1) & 0xFFFF, v >> 8)\n' + set_hl('x')), 1, 19, True)
+    add(0xE9, f'PC = {hl}', 1, 4, True)
+    add(0xEB, 'x = D\nD = H\nH = x\nx = E\nE = L\nL = x', 1, 4)
+    add(0xF3, 'cpu.inte = False', 1, 4)
+    add(0xFB, 'cpu.inte = True', 1, 4)
+    add(0xF9, f'SP = {hl}', 1, 6, True)
+    return t
+
+
+def _cb(ix=None):
+    """Templates of CB xx, or with ix of DD CB d xx / FD CB d xx."""
+    t = {}
+    addr = f'({ix} + DISP) & 0xFFFF' if ix else _HL
+    for op in range(256):
+        kind, bit, r = op >> 6, (op >> 3) & 7, op & 7
+        reg = 'M' if ix else REGS[r]
+        m = reg == 'M'
+        v = f'RD({addr})' if m else reg
+        # The indexed forms also copy the result to r (undocumented)
+        copy = f'\n{REGS[r]} = x' if ix and r != 6 else ''
+        store = f'WR({addr}, x)' if m else f'{reg} = x'
+        if kind == 0:
+            body = f'v = {v}\n{_ROTATES[bit]}\n{store}\nF = SZP80[x] | c' + copy
+        elif kind == 1:
+            body = f'v = {v}\nF = (F & 1) | 0x10 | (SZP80[v & 0x{1 << bit:02X}] & 0xC4)'
+        elif kind == 2:
+            body = f'x = {v} & 0x{~(1 << bit) & 0xFF:02X}\n{store}' + copy
+        else:
+            body = f'x = {v} | 0x{1 << bit:02X}\n{store}' + copy
+        if ix:
+            t[op] = (body, 4, {'DISP': 2}, 20 if kind == 1 else 23)
+        else:
+            t[op] = (body, 2, {}, (12 if kind == 1 else 15) if m else 8)
+    return t
+
+
+def _ed():
+    """Templates of ED xx; the undefined ones are 8 T-state no-ops."""
+    t = {op: ('', 2, {}, 8) for op in range(256)}
+    nn = {'NN': 2}
+    for r in range(8):
+        reg = REGS[r]
+        t[0x40 | (r << 3)] = (('x = cpu.port_in(C) & 0xFF\n' +
+                               ('' if reg == 'M' else f'{reg} = x\n') +
+                               'F = (F & 1) | SZP80[x]'), 2, {}, 12)
+        t[0x41 | (r << 3)] = (f'cpu.port_out(C, {0 if reg == "M" else reg})', 2, {}, 12)
+    for rp in range(4):
+        pair = ('((B << 8) | C)', '((D << 8) | E)', _HL, 'SP')[rp]
+        if rp == 3:
+            store = 'SP = x & 0xFFFF'
+        else:
+            hi, lo = _PAIRS[rp]
+            store = f'{hi} = (x >> 8) & 0xFF\n{lo} = x & 0xFF'
+        t[0x42 | (rp << 4)] = ((f'v = {pair}\nw = {_HL}\nx = w - v - (F & 1)\n'
+                                'F = (((x >> 8) & 0x80) | (0 if x & 0xFFFF else 0x40) |\n'
+                                '     ((x >> 16) & 1) | (((w ^ v ^ x) >> 8) & 0x10) |\n'
+                                '     (((w ^ v) & (w ^ x) & 0x8000) >> 13) | 0x02)\n'
+                                'H = (x >> 8) & 0xFF\nL = x & 0xFF'), 2, {}, 15)
+        t[0x4A | (rp << 4)] = ((f'v = {pair}\nw = {_HL}\nx = w + v + (F & 1)\n'
+                                'F = (((x >> 8) & 0x80) | (0 if x & 0xFFFF else 0x40) |\n'
+                                '     (x >> 16) | (((w ^ v ^ x) >> 8) & 0x10) |\n'
+                                '     ((~(w ^ v) & (w ^ x) & 0x8000) >> 13))\n'
+                                'H = (x >> 8) & 0xFF\nL = x & 0xFF'), 2, {}, 15)
+        t[0x43 | (rp << 4)] = (f'v = {pair}\nWR(NN, v & 0xFF)\nWR((NN + 1) & 0xFFFF, v >> 8)',
+                               4, nn, 20)
+        t[0x4B | (rp << 4)] = ('x = RD(NN) | (RD((NN + 1) & 0xFFFF) << 8)\n' + store,
+                               4, nn, 20)
+    for op in range(0x44, 0x80, 8):
+        t[op] = (('v = A\nx = -v\n'
+                  'F = (SZ[x & 0xFF] | ((x >> 8) & 1) | ((v ^ x) & 0x10) |\n'
+                  '     (0x04 if v == 0x80 else 0) | 0x02)\n'
+                  'A = x & 0xFF'), 2, {}, 8)
+        t[op + 1] = (_RET, 2, {}, 14)                   # RETN, and RETI at 4D
+    for op, mode in ((0x46, 0), (0x4E, 0), (0x56, 1), (0x5E, 2),
+                     (0x66, 0), (0x6E, 0), (0x76, 1), (0x7E, 2)):
+        t[op] = (f'cpu.im = {mode}', 2, {}, 8)
+    t[0x47] = ('cpu.i = A', 2, {}, 9)
+    t[0x4F] = ('cpu.r = A', 2, {}, 9)
+    t[0x57] = ('A = cpu.i\nF = (F & 1) | SZ[A] | (0x04 if cpu.inte else 0)', 2, {}, 9)
+    t[0x5F] = ('A = cpu.r\nF = (F & 1) | SZ[A] | (0x04 if cpu.inte else 0)', 2, {}, 9)
+    t[0x67] = (f'v = RD({_HL})\nWR({_HL}, ((A << 4) | (v >> 4)) & 0xFF)\n'
+               'A = (A & 0xF0) | (v & 0x0F)\nF = (F & 1) | SZP80[A]', 2, {}, 18)
+    t[0x6F] = (f'v = RD({_HL})\nWR({_HL}, ((v << 4) | (A & 0x0F)) & 0xFF)\n'
+               'A = (A & 0xF0) | (v >> 4)\nF = (F & 1) | SZP80[A]', 2, {}, 18)
+
+    again = '\nif {}:\n    EXTRA(5)\n    PC = pc'
+    for base, delta in ((0xA0, 1), (0xA8, -1)):
+        ld = (f'WR((D << 8) | E, RD({_HL}))\n{_step(2, delta)}\n{_step(1, delta)}\n'
+              f'{_step(0, -1)}\nF = (F & 0xC1) | (0x04 if B | C else 0)')
+        cp = (f'v = RD({_HL})\nx = A - v\n{_step(2, delta)}\n{_step(0, -1)}\n'
+              'F = ((F & 1) | SZ[x & 0xFF] | ((A ^ v ^ x) & 0x10) |\n'
+              '     (0x04 if B | C else 0) | 0x02)')
+        io_flags = '\nF = (F & 0xBD) | (0 if B else 0x40) | 0x02'
+        inp = (f'WR({_HL}, cpu.port_in(C) & 0xFF)\n{_step(2, delta)}\n'
+               'B = (B - 1) & 0xFF' + io_flags)
+        out = (f'B = (B - 1) & 0xFF\ncpu.port_out(C, RD({_HL}))\n{_step(2, delta)}'
+               + io_flags)
+        t[base] = (ld, 2, {}, 16)
+        t[base + 1] = (cp, 2, {}, 16)
+        t[base + 2] = (inp, 2, {}, 16)
+        t[base + 3] = (out, 2, {}, 16)
+        t[base + 0x10] = (ld + again.format('B | C'), 2, {}, 16)
+        t[base + 0x11] = (cp + again.format('B | C and x & 0xFF'), 2, {}, 16)
+        t[base + 0x12] = (inp + again.format('B'), 2, {}, 16)
+        t[base + 0x13] = (out + again.format('B'), 2, {}, 16)
+    return t
+
+
+def _index(ix):
+    """DD or FD table: HL instructions on ix, everything else a no-op prefix."""
+    t = {op: ('', 1, {}, 4) for op in range(256)}
+    t.update(_main(ix))
+    return t
+
+
+def _tables():
+    """Return {table: [entry] * 256}.
+
+    An entry is (body, length, operands, T-states), or ('->', table,
+    offset) for a prefix that dispatches on the byte at pc + offset.
+    """
+    main = _main()
+    for op, table in ((0xCB, 'CB'), (0xDD, 'DD'), (0xED, 'ED'), (0xFD, 'FD')):
+        main[op] = ('->', table, 1)
+    tables = {'MAIN': main, 'CB': _cb(), 'ED': _ed(), 'DD': _index('IX'), 'FD': _index('IY'),
+              'DDCB': _cb('IX'), 'FDCB': _cb('IY')}
+    tables['DD'][0xCB] = ('->', 'DDCB', 3)
+    tables['FD'][0xCB] = ('->', 'FDCB', 3)
+    return {name: [t[op] for op in range(256)] for name, t in tables.items()}
+
+
+TABLES = _tables()
+
+# First byte of the instructions in each table, passed to prologues as {op}
+_FIRST = {'CB': 0xCB, 'ED': 0xED, 'DD': 0xDD, 'FD': 0xFD, 'DDCB': 0xDD, 'FDCB': 0xFD}
+
+# T-states of the unprefixed opcodes (prefixes 0; conditional forms untaken)
+CYCLES = bytes(0 if e[0] == '->' else e[3] for e in TABLES['MAIN'])
+
+
+def instruction_entry(mem, addr):
+    """Return the (body, length, operands, T-states) table entry of the
+    instruction at addr, prefixes included in its length."""
+    entry = TABLES['MAIN'][mem[addr]]
+    while entry[0] == '->':
+        entry = TABLES[entry[1]][mem[(addr + entry[2]) & 0xFFFF]]
+    return entry
+
+
+def build_z80_handlers(macros=PLAIN_MACROS, env=None, prologue=None):
+    """Compile every Z80 table and return the unprefixed handlers.
+
+    macros, env and prologue are as for cpu.build_handlers(); the prefix
+    tables are globals of the handlers.
+    """
+    namespace = {'SZP80': SZP80, 'SZ': SZ}
+    if env:
+        namespace.update(env)
+    src = []
+    for table, entries in TABLES.items():
+        for op, entry in enumerate(entries):
+            name = f'{table}_{op:02X}'
+            if entry[0] == '->':
+                _, target, offset = entry
+                src.append(f'def {name}(cpu, mem):\n'
+                           f'    {target}[mem[(cpu.pc + {offset}) & 0xFFFF]](cpu, mem)\n')
+            else:
+                body, n, operands, cycles = entry
+                src.append(function_source(name, body, n, operands, macros, prologue,
+                                           cycles, _FIRST.get(table, op)))
+    exec(compile('\n'.join(src), '<emu80 z80 handlers>', 'exec'), namespace)
+    for table in TABLES:
+        namespace[table] = [namespace[f'{table}_{op:02X}'] for op in range(256)]
+    return namespace['MAIN']
+
+
+_compiled = {}
+
+
+def _handlers(timed):
+    """The plain or timed handler set, compiled on first use."""
+    if timed not in _compiled:
+        _compiled[timed] = (build_z80_handlers(TIMED_MACROS, prologue=TIMED_PROLOGUE)
+                            if timed else build_z80_handlers())
+    return _compiled[timed]
+
+
+class Z80(CPU):
+    """A CPU running the Z80 instruction set, with T-states when timed."""
+
+    __slots__ = ('ix', 'iy', 'i', 'r', 'im', 'a_', 'f_', 'b_', 'c_', 'd_', 'e_', 'h_', 'l_')
+
+    CYCLES = CYCLES
+    GLOBALS = {'SZP80': SZP80, 'SZ': SZ}
+
+    def __init__(self, mem=None, timed=False, jit=False):
+        super().__init__(mem)
+        self.handlers = _handlers(timed)
+        self.ix = self.iy = 0
+        self.i = self.r = self.im = 0
+        self.a_ = self.f_ = self.b_ = self.c_ = self.d_ = self.e_ = self.h_ = self.l_ = 0
+        self.f = 0
+        if jit:
+            from .jit import BlockCache
+            self.blocks = BlockCache(self, timed)
+
+    compile_handlers = staticmethod(build_z80_handlers)
+
+    def length_at(self, addr):
+        return instruction_entry(self.mem, addr)[1]
+
+    def template_at(self, addr):
+        return instruction_entry(self.mem, addr)
+
+    def registers(self):
+        regs = super().registers()
+        for name in ('ix', 'iy', 'i', 'r', 'im', 'a_', 'f_', 'b_', 'c_', 'd_', 'e_', 'h_', 'l_'):
+            regs[name] = getattr(self, name)
+        return regs
+
+    def __repr__(self):
+        return (f"Z80(A={self.a:02X} F={self.f:02X} BC={self.b:02X}{self.c:02X} "
+                f"DE={self.d:02X}{self.e:02X} HL={self.h:02X}{self.l:02X} "
+                f"IX={self.ix:04X} IY={self.iy:04X} SP={self.sp:04X} PC={self.pc:04X})")
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+build.py - Incremental build of mbasic from sources
+
+Each module's source and the files it INCLUDEs are hashed, and the hashes
+of the last successful assembly are kept in out/build_state.json.  Only
+modules whose hash changed (or whose .rel is missing) are reassembled,
+independent modules in parallel.  The state also records a hash of the
+.rel files of the last successful link, so everything is relinked in
+link order whenever they differ from it (or the output is missing, or
+the last link failed), and the result is compared with com/mbasic.com.
+
+Usage:
+    python3 build.py [--force] [--jobs N] [--no-compare] [--ref com/mbasic.com]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'utils'))
+
+from codediff import compare_full        # noqa: E402
+
+
+# Link order
+MODULES = ['bintrp', 'f4', 'biptrg', 'biedit', 'biprtu', 'bio', 'bimisc',
+           'bistrs', 'binlin', 'fiveo', 'dskcom', 'dcpm', 'fivdsk', 'init']
+
+SRC_DIR = 'mbasic_src'
+OUT_DIR = 'out'
+OUTPUT = 'out/mbasic_go.com'
+STATE_FILE = 'out/build_state.json'
+
+ASSEMBLE = [sys.executable, '-m', 'um80.um80']
+LINK = [sys.executable, '-m', 'um80.ul80']
+
+INCLUDE_RE = re.compile(r'^\s*(?:[A-Za-z.$?@_][A-Za-z0-9.$?@_]*:+)?\s*'
+                        r'(?:\$?include|maclib)\s+([^\s;]+)', re.I)
+
+
+def source_hash(path, seen=None):
+    """Hash a source file together with every file it includes."""
+    seen = set() if seen is None else seen
+    seen.add(os.path.abspath(path))
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        data = f.read()
+    h.update(data)
+    for line in data.decode('latin-1').splitlines():
+        m = INCLUDE_RE.match(line)
+        if not m:
+            continue
+        name = m.group(1)
+        inc = os.path.join(os.path.dirname(path), name)
+        if not os.path.exists(inc) and not os.path.splitext(name)[1]:
+            inc += '.mac'
+        if os.path.abspath(inc) in seen or not os.path.exists(inc):
+            h.update(name.encode())
+            continue
+        h.update(source_hash(inc, seen).encode())
+    return h.hexdigest()
+
+
+def load_state():
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state):
+    with open(STATE_FILE, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+
+
+def rel_hash():
+    """Hash the .rel files in link order, or None if any is missing."""
+    h = hashlib.sha256()
+    for module in MODULES:
+        try:
+            with open(f'{OUT_DIR}/{module}.rel', 'rb') as f:
+                h.update(hashlib.sha256(f.read()).digest())
+        except OSError:
+            return None
+    return h.hexdigest()
+
+
+def assemble(module):
+    """Assemble one module; returns (module, ok, output, seconds)."""
+    start = time.time()
+    result = subprocess.run(ASSEMBLE + [f'{SRC_DIR}/{module}.mac', '-o', f'{OUT_DIR}/{module}.rel'],
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    return module, result.returncode == 0, result.stdout, time.time() - start
+
+
+def link():
+    rels = [f'{OUT_DIR}/{m}.rel' for m in MODULES]
+    result = subprocess.run(LINK + ['-o', OUTPUT, '-s'] + rels,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    return result.returncode == 0, result.stdout
+
+
+def compare(ref_path):
+    """Compare the build with the reference; returns True when identical."""
+    with open(ref_path, 'rb') as f:
+        ref = f.read()
+    with open(OUTPUT, 'rb') as f:
+        our = f.read()
+    if ref == our:
+        print(f"Binary matches reference {ref_path}")
+        return True
+    report = compare_full(ref, our)
+    c = report['counts']
+    print(f"Binary differs from reference {ref_path} "
+          f"({len(our)} vs {len(ref)} bytes): {c['opcode']} opcode, {c['immediate']} immediate, "
+          f"{c['address']} address, {c['data']} data differences")
+    print("Run utils/codediff.py for details")
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incrementally build mbasic from sources')
+    parser.add_argument('--force', '-f', action='store_true', help='Reassemble every module')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='Parallel assemblies (default: number of CPUs)')
+    parser.add_argument('--no-compare', action='store_true', help='Do not compare with the reference')
+    parser.add_argument('--ref', default='com/mbasic.com', help='Reference binary to compare with')
+    args = parser.parse_args()
+
+    os.chdir(HERE)
+    os.makedirs(OUT_DIR, exist_ok=True)
+    start = time.time()
+
+    state = {} if args.force else load_state()
+    hashes = {m: source_hash(f'{SRC_DIR}/{m}.mac') for m in MODULES}
+    stale = [m for m in MODULES
+             if state.get(m) != hashes[m] or not os.path.exists(f'{OUT_DIR}/{m}.rel')]
+
+    failed = []
+    if stale:
+        print(f"Assembling {len(stale)} of {len(MODULES)} modules: {' '.join(stale)}")
+        with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+            for module, ok, output, secs in pool.map(assemble, stale):
+                output = '\n'.join(line for line in output.splitlines() if line.strip())
+                print(f"  {module}.mac ({secs:.1f}s){'' if ok else ' FAILED'}")
+                if output:
+                    print(output)
+                if ok:
+                    state[module] = hashes[module]
+                else:
+                    state.pop(module, None)
+                    failed.append(module)
+        save_state(state)
+    else:
+        print("All modules up to date")
+
+    if failed:
+        print(f"Assembly failed: {' '.join(failed)}")
+        return 1
+
+    rels = rel_hash()
+    if state.get('linked') != rels or not os.path.exists(OUTPUT):
+        print("Linking...")
+        ok, output = link()
+        if output.strip():
+            print(output.rstrip())
+        if ok:
+            state['linked'] = rels
+        else:
+            state.pop('linked', None)
+        save_state(state)
+        if not ok:
+            print("Link failed")
+            return 1
+
+    print(f"Done: {OUTPUT} ({time.time() - start:.1f}s)")
+    if not args.no_compare and os.path.exists(args.ref):
+        return 0 if compare(args.ref) else 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
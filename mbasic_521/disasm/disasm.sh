@@ -5,6 +5,10 @@
 cd "$(dirname "$0")/.."
 export PYTHONPATH=/home/wohl/um80_and_friends
 
+# ud80 runs through the content cache: when com/mbasic.com and the options
+# below are unchanged, disasm/mbasic.mac is restored instead of regenerated.
+# MBASIC_NO_CACHE=1 forces a fresh run.
+python3 utils/cache.py exec --input com/mbasic.com --output disasm/mbasic.mac -- \
 python3 -m um80.ud80 com/mbasic.com \
     -o disasm/mbasic.mac \
     \
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+test_build.py - Tests for the incremental rebuild decisions in build.py
+
+The assembler and linker are replaced by small scripts that copy their
+inputs and log each run, so the tests see exactly which steps a build
+performs without needing um80.
+
+Usage:
+    python3 -m unittest test_build       (from mbasic_521)
+"""
+
+import io
+import os
+import sys
+import tempfile
+import unittest
+import contextlib
+from unittest import mock
+
+import build
+
+FAKE_ASSEMBLE = '''
+import sys, shutil
+log, src, _, rel = sys.argv[1:]
+open(log, 'a').write('assemble ' + src.split('/')[-1] + '\\n')
+shutil.copy(src, rel)
+'''
+
+FAKE_LINK = '''
+import os, sys
+log, fail, _, out, _ = sys.argv[1:6]
+open(log, 'a').write('link\\n')
+if os.path.exists(fail):
+    sys.exit('link failed')
+with open(out, 'wb') as f:
+    for rel in sys.argv[6:]:
+        f.write(open(rel, 'rb').read())
+'''
+
+
+class IncrementalBuildTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory(prefix='build_')
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        os.mkdir(os.path.join(self.dir, build.SRC_DIR))
+        for module in build.MODULES:
+            self.edit(module, f'; {module}\n')
+        self.log = os.path.join(self.dir, 'tools.log')
+        self.fail = os.path.join(self.dir, 'fail_link')
+        cwd = os.getcwd()
+        self.addCleanup(os.chdir, cwd)
+        for patch in (mock.patch.object(build, 'HERE', self.dir),
+                      mock.patch.object(build, 'ASSEMBLE', [sys.executable, '-c', FAKE_ASSEMBLE, self.log]),
+                      mock.patch.object(build, 'LINK', [sys.executable, '-c', FAKE_LINK, self.log, self.fail])):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def edit(self, module, text):
+        with open(os.path.join(self.dir, build.SRC_DIR, f'{module}.mac'), 'w') as f:
+            f.write(text)
+
+    def build(self):
+        """Run build.py; returns (exit status, tool runs)."""
+        try:
+            os.remove(self.log)
+        except OSError:
+            pass
+        with mock.patch.object(sys, 'argv', ['build.py', '--no-compare', '--jobs', '2']), \
+                contextlib.redirect_stdout(io.StringIO()):
+            status = build.main()
+        try:
+            with open(self.log) as f:
+                return status, sorted(f.read().split('\n')[:-1])
+        except OSError:
+            return status, []
+
+    def test_unchanged_tree_does_no_work(self):
+        status, runs = self.build()
+        self.assertEqual(status, 0)
+        self.assertEqual(len(runs), len(build.MODULES) + 1)
+        self.assertEqual(self.build(), (0, []))
+
+    def test_edit_reassembles_one_module_and_relinks(self):
+        self.build()
+        self.edit('bio', '; bio, edited\n')
+        self.assertEqual(self.build(), (0, ['assemble bio.mac', 'link']))
+        with open(os.path.join(self.dir, build.OUTPUT), 'rb') as f:
+            self.assertIn(b'edited', f.read())
+
+    def test_failed_link_forces_relink(self):
+        open(self.fail, 'w').close()
+        status, runs = self.build()
+        self.assertEqual(status, 1)
+        self.assertIn('link', runs)
+        self.assertEqual(self.build(), (1, ['link']))
+        os.remove(self.fail)
+        self.assertEqual(self.build(), (0, ['link']))
+        self.assertEqual(self.build(), (0, []))
+
+    def test_missing_output_relinks(self):
+        self.build()
+        os.remove(os.path.join(self.dir, build.OUTPUT))
+        self.assertEqual(self.build(), (0, ['link']))
+
+
+if __name__ == '__main__':
+    unittest.main()
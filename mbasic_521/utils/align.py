@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+align.py - Relocation-aware alignment of a build against its reference
+
+Both images are first masked with i8080.mask_operands so that relocated
+16-bit addresses compare equal.  K-byte substrings that occur exactly once
+in each masked image are used as anchors; the longest chain of anchors in
+the same order in both images (longest increasing subsequence) gives the
+matched blocks, which are extended byte by byte.  The short gaps left
+between blocks are aligned with a banded edit-distance pass in which
+opening an insertion or deletion costs more than changing bytes, so every
+insertion, deletion and change is located exactly in near-linear time.
+Address tables are not decoded as code, so their words are masked after
+a first alignment where they differ by the drift at their target, and
+the images are aligned again.
+
+Usage:
+    from align import align_images
+    alignment = align_images(ref, our)
+    for tag, a1, a2, b1, b2 in alignment.edits():
+        ...
+    our_off = alignment.map_offset(ref_off)
+"""
+
+from bisect import bisect_left, bisect_right
+
+from i8080 import mask_operands
+
+
+# Gaps with more DP cells than this are reported as one change
+MAX_GAP_CELLS = 2000000
+
+# Extra diagonals either side of the band needed to join the gap corners
+BAND_SLACK = 8
+
+# Blocks shorter than this at another drift than both neighbours are dropped
+MAX_EXCURSION = 32
+
+# Cost of opening a run of insertions or deletions, on top of 1 per byte;
+# above 1, so that changed bytes are not taken for an insertion and a
+# deletion
+GAP_OPEN = 3
+
+
+def _unique_kmers(s, k):
+    """Map each k-byte substring occurring exactly once in s to its offset."""
+    seen = {}
+    dup = set()
+    for i in range(len(s) - k + 1):
+        km = s[i:i + k]
+        if km in seen:
+            dup.add(km)
+        else:
+            seen[km] = i
+    for km in dup:
+        del seen[km]
+    return seen
+
+
+def _chain(anchors):
+    """Return the longest subsequence of anchors increasing in both offsets.
+
+    anchors must be sorted by reference offset.
+    """
+    tails = []          # our offset ending the best chain of each length
+    tail_idx = []
+    prev = [-1] * len(anchors)
+    for i, (_, b) in enumerate(anchors):
+        j = bisect_left(tails, b)
+        if j == len(tails):
+            tails.append(b)
+            tail_idx.append(i)
+        else:
+            tails[j] = b
+            tail_idx[j] = i
+        prev[i] = tail_idx[j - 1] if j else -1
+    chain = []
+    i = tail_idx[-1] if tail_idx else -1
+    while i >= 0:
+        chain.append(anchors[i])
+        i = prev[i]
+    chain.reverse()
+    return chain
+
+
+def _blocks(chain, k):
+    """Merge chained anchors into non-overlapping (a, b, length) blocks."""
+    blocks = []
+    for a, b in chain:
+        if blocks:
+            pa, pb, plen = blocks[-1]
+            if b - a == pb - pa and a <= pa + plen:
+                blocks[-1] = (pa, pb, max(plen, a + k - pa))
+                continue
+            # Trim the start of a block overlapping the previous one
+            skip = max(pa + plen - a, pb + plen - b, 0)
+            if skip >= k:
+                continue
+            a, b, length = a + skip, b + skip, k - skip
+        else:
+            length = k
+        blocks.append((a, b, length))
+    return blocks
+
+
+def _drop_excursions(blocks):
+    """Drop short blocks off the diagonal of the blocks either side.
+
+    Data decoded as code is masked where it happens to look like an
+    operand, which can make a few bytes match at another drift.  A real
+    insertion undone by a deletion within MAX_EXCURSION bytes is much
+    rarer than that, so such a block is taken as chance.
+    """
+    out = []
+    for i, (a, b, length) in enumerate(blocks):
+        if out and i + 1 < len(blocks) and length < MAX_EXCURSION:
+            pa, pb, _ = out[-1]
+            na, nb, _ = blocks[i + 1]
+            if pb - pa == nb - na != b - a:
+                continue
+        out.append((a, b, length))
+    return out
+
+
+def _extend(blocks, sa, sb):
+    """Grow each block over equal bytes up to its neighbours."""
+    out = []
+    for i, (a, b, length) in enumerate(blocks):
+        lo_a, lo_b = (out[-1][0] + out[-1][2], out[-1][1] + out[-1][2]) if out else (0, 0)
+        while a > lo_a and b > lo_b and sa[a - 1] == sb[b - 1]:
+            a -= 1
+            b -= 1
+            length += 1
+        if i + 1 < len(blocks):
+            hi_a, hi_b = blocks[i + 1][0], blocks[i + 1][1]
+        else:
+            hi_a, hi_b = len(sa), len(sb)
+        while a + length < hi_a and b + length < hi_b and sa[a + length] == sb[b + length]:
+            length += 1
+        out.append((a, b, length))
+    return out
+
+
+def _align_gap(sa, a1, a2, sb, b1, b2):
+    """Align sa[a1:a2] with sb[b1:b2]; return difflib-style opcodes.
+
+    A change costs 1 per byte and a run of insertions or deletions
+    GAP_OPEN plus 1 per byte, so changed bytes are never explained as a
+    deletion and an insertion of the same length (affine gaps, Gotoh).
+    """
+    n, m = a2 - a1, b2 - b1
+    if n == 0 and m == 0:
+        return []
+    if n == 0:
+        return [('insert', a1, a1, b1, b2)]
+    if m == 0:
+        return [('delete', a1, a2, b1, b1)]
+
+    # Diagonal d = j - i is kept within [dlo, dhi]
+    dlo = min(0, m - n) - BAND_SLACK
+    dhi = max(0, m - n) + BAND_SLACK
+    width = dhi - dlo + 1
+    if (n + 1) * width > MAX_GAP_CELLS:
+        return [('replace', a1, a2, b1, b2)]
+
+    inf = (n + m + 1) * (GAP_OPEN + 1)
+    x = sa[a1:a2]
+    y = sb[b1:b2]
+    # For x[:i] against y[:i + d], cost[s][i][d - dlo] is the best cost of
+    # an alignment ending in state s (0 diagonal, 1 deletion of x[i-1],
+    # 2 insertion of y[j-1]) and back[s][i][d - dlo] the state before it
+    cost = ([], [], [])
+    back = ([], [], [])
+    for i in range(n + 1):
+        rows = ([inf] * width, [inf] * width, [inf] * width)
+        links = (bytearray(width), bytearray(width), bytearray(width))
+        for di in range(width):
+            j = i + dlo + di
+            if j < 0 or j > m:
+                continue
+            if i == 0:
+                if j == 0:
+                    rows[0][di] = 0
+                else:
+                    rows[2][di] = GAP_OPEN + j
+                    links[2][di] = 2 if j > 1 else 0
+                continue
+            if j > 0:
+                c = x[i - 1] != y[j - 1]
+                prev = [cost[s][i - 1][di] for s in range(3)]
+                s = min(range(3), key=prev.__getitem__)
+                rows[0][di] = prev[s] + c
+                links[0][di] = s
+            if di + 1 < width:
+                up = [cost[s][i - 1][di + 1] + (0 if s == 1 else GAP_OPEN) for s in range(3)]
+                s = min((1, 0, 2), key=up.__getitem__)
+                rows[1][di] = up[s] + 1
+                links[1][di] = s
+            if di > 0 and j > 0:
+                left = [rows[s][di - 1] + (0 if s == 2 else GAP_OPEN) for s in range(3)]
+                s = min((2, 0, 1), key=left.__getitem__)
+                rows[2][di] = left[s] + 1
+                links[2][di] = s
+        for s in range(3):
+            cost[s].append(rows[s])
+            back[s].append(links[s])
+
+    # Trace back into per-byte steps, then merge runs
+    steps = []
+    i, j = n, m
+    di = m - n - dlo
+    how = min(range(3), key=lambda s: cost[s][n][di])
+    while i > 0 or j > 0:
+        di = j - i - dlo
+        prev = back[how][i][di]
+        if how == 0:
+            steps.append('equal' if x[i - 1] == y[j - 1] else 'replace')
+            i -= 1
+            j -= 1
+        elif how == 1:
+            steps.append('delete')
+            i -= 1
+        else:
+            steps.append('insert')
+            j -= 1
+        how = prev
+    steps.reverse()
+
+    ops = []
+    i, j = a1, b1
+    for tag in steps:
+        di = 0 if tag == 'insert' else 1
+        dj = 0 if tag == 'delete' else 1
+        if tag != 'equal' and ops and ops[-1][0] != 'equal':
+            # Adjacent non-equal steps form one change
+            t, oa1, _, ob1, _ = ops[-1]
+            t = t if t == tag else 'replace'
+            ops[-1] = (t, oa1, i + di, ob1, j + dj)
+        elif ops and ops[-1][0] == tag:
+            t, oa1, _, ob1, _ = ops[-1]
+            ops[-1] = (t, oa1, i + di, ob1, j + dj)
+        else:
+            ops.append((tag, i, i + di, j, j + dj))
+        i += di
+        j += dj
+    return ops
+
+
+class Alignment:
+    """Opcodes covering both images, as (tag, a1, a2, b1, b2).
+
+    tag is 'equal', 'replace', 'delete' (bytes only in the reference) or
+    'insert' (bytes only in our build), with half-open ranges in each.
+    """
+
+    def __init__(self, ops):
+        self.ops = ops
+        self._starts = [op[1] for op in ops]
+
+    def edits(self):
+        """Return the non-equal opcodes."""
+        return [op for op in self.ops if op[0] != 'equal']
+
+    def map_offset(self, a):
+        """Return our offset matching reference offset a, or -1."""
+        i = bisect_right(self._starts, a) - 1
+        while i >= 0 and self.ops[i][1] == self.ops[i][2]:
+            i -= 1          # skip insertions, which cover no reference bytes
+        if i < 0:
+            return -1
+        tag, a1, a2, b1, b2 = self.ops[i]
+        if a >= a2:
+            return -1
+        if tag == 'equal' or (tag == 'replace' and a2 - a1 == b2 - b1):
+            return b1 + (a - a1)
+        return -1
+
+    def drift_at(self, a):
+        """Return our offset minus reference offset at reference offset a."""
+        i = bisect_right(self._starts, a) - 1
+        if i < 0:
+            return 0
+        tag, a1, a2, b1, b2 = self.ops[i]
+        return b1 - a1 if a < a2 else b2 - a2
+
+
+def _align(sa, sb, k):
+    """Align two masked images; returns the opcodes over the whole of both."""
+    sa, sb = bytes(sa), bytes(sb)
+    ka = _unique_kmers(sa, k)
+    kb = _unique_kmers(sb, k)
+    anchors = sorted((a, kb[km]) for km, a in ka.items() if km in kb)
+    blocks = _extend(_drop_excursions(_blocks(_chain(anchors), k)), sa, sb)
+
+    ops = []
+    pa = pb = 0
+    for a, b, length in blocks + [(len(sa), len(sb), 0)]:
+        ops.extend(_align_gap(sa, pa, a, sb, pb, b))
+        if length:
+            if ops and ops[-1][0] == 'equal' and ops[-1][2] == a and ops[-1][4] == b:
+                ops[-1] = ('equal', ops[-1][1], a + length, ops[-1][3], b + length)
+            else:
+                ops.append(('equal', a, a + length, b, b + length))
+        pa, pb = a + length, b + length
+    return ops
+
+
+def mask_moved_words(ref, our, sa, sb, alignment, origin=0x100):
+    """Mask the 16-bit words that differ only by where their target moved.
+
+    Address tables are data, which mask_operands does not decode, so a
+    table entry pointing past an insertion shows as a change.  Within
+    each same-length change, a word whose value in our build is the
+    address of the reference word's target, moved by the drift the
+    alignment gives at that target, is zeroed in both masked images.
+    Returns the number of words masked.
+    """
+    masked = 0
+    for tag, a1, a2, b1, b2 in alignment.ops:
+        if tag != 'replace' or a2 - a1 != b2 - b1:
+            continue
+        a = max(a1 - 1, 0)
+        while a < a2 and a + 1 < len(ref):
+            b = a + b1 - a1
+            if b + 1 >= len(our) or alignment.map_offset(a) != b or \
+                    alignment.map_offset(a + 1) != b + 1:
+                a += 1
+                continue
+            ref_word = ref[a] | (ref[a + 1] << 8)
+            our_word = our[b] | (our[b + 1] << 8)
+            target = ref_word - origin
+            if ref_word != our_word and 0 <= target <= len(ref) and \
+                    our_word == ref_word + alignment.drift_at(target):
+                sa[a] = sa[a + 1] = 0
+                sb[b] = sb[b + 1] = 0
+                masked += 1
+                a += 2
+            else:
+                a += 1
+    return masked
+
+
+def align_images(ref, our, k=12, ref_start=0, our_start=0, origin=0x100):
+    """Align two images; returns an Alignment over the whole of both.
+
+    Operands of decoded code are masked first.  Words in address tables
+    that moved with their targets (see mask_moved_words) are masked
+    from the first alignment, and the images aligned again.
+    """
+    sa = bytearray(mask_operands(ref, ref_start))
+    sb = bytearray(mask_operands(our, our_start))
+    alignment = Alignment(_align(sa, sb, k))
+    if mask_moved_words(ref, our, sa, sb, alignment, origin):
+        alignment = Alignment(_align(sa, sb, k))
+    return alignment
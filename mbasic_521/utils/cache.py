@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+cache.py - Persistent content-addressed cache for the compare tools
+
+Results are stored under utils/.cache keyed by the SHA-256 of every input
+(binary contents, not file names), the options that affect them and the
+source of the code that computes them, including the utils modules that
+code imports, so a result is reused for as long as its inputs and that
+code are byte-identical.  The reference image never changes, so its
+decoded instruction stream is built once and then loaded.  Entries are
+evicted least recently used first once the cache grows past MAX_BYTES.
+
+The exec subcommand caches the output files and console output of an
+external command, keyed by its arguments, its input files and the tool
+itself (the executable, and for python -m the package's source files);
+disasm.sh runs ud80 through it.
+
+Usage:
+    python3 cache.py stats
+    python3 cache.py clear
+    python3 cache.py exec --input com/mbasic.com --output disasm/mbasic.mac -- cmd args...
+
+    from cache import cached_decode, memoize
+    stream = cached_decode(ref, 0x0B50)
+    ops = memoize('diff', diff_code, ref, our)
+
+Set MBASIC_NO_CACHE=1 to bypass the cache.
+"""
+
+import os
+import sys
+import time
+import types
+import shutil
+import pickle
+import hashlib
+import argparse
+import subprocess
+import importlib.util
+
+import i8080
+import align
+from i8080 import InstructionStream, decode
+from align import Alignment, align_images
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(HERE, '.cache')
+
+# Total size kept on disk before least recently used entries are evicted
+MAX_BYTES = 64 * 1024 * 1024
+
+# Bumped whenever the layout of a cached value changes
+VERSION = 1
+
+_sources = {}
+
+
+def _file_digest(path):
+    """SHA-256 of a file, memoized for the life of the process; None if unreadable."""
+    if path not in _sources:
+        try:
+            with open(path, 'rb') as f:
+                _sources[path] = hashlib.sha256(f.read()).digest()
+        except (OSError, TypeError):
+            _sources[path] = None
+    return _sources[path]
+
+
+def _local_imports(module):
+    """Return module and every utils module it imports, directly or not."""
+    seen = {}
+    todo = [module]
+    while todo:
+        module = todo.pop()
+        path = getattr(module, '__file__', None)
+        if path is None or path in seen:
+            continue
+        seen[path] = module
+        for value in vars(module).values():
+            if not isinstance(value, types.ModuleType):
+                value = sys.modules.get(getattr(value, '__module__', None) or '')
+            path = getattr(value, '__file__', None)
+            if path and os.path.dirname(os.path.abspath(path)) == HERE:
+                todo.append(value)
+    return [seen[path] for path in sorted(seen)]
+
+
+def source_hash(*code):
+    """Hash the source files of modules, or of the modules defining functions.
+
+    The utils modules they import are hashed too, so editing a helper
+    changes the hash of everything built on it.  A function whose source
+    file cannot be read is hashed by its bytecode and constants instead.
+    """
+    h = hashlib.sha256()
+    for item in code:
+        module = item if isinstance(item, types.ModuleType) else sys.modules.get(item.__module__)
+        digests = [_file_digest(m.__file__) for m in _local_imports(module)] if module else []
+        if not digests or None in digests:
+            digests.append(hashlib.sha256(item.__code__.co_code + repr(item.__code__.co_consts).encode()).digest())
+        for digest in digests:
+            h.update(digest or b'')
+    return h.hexdigest()
+
+
+def tool_hash(cmd):
+    """Hash the program cmd runs: its executable and, for python -m, the package source."""
+    h = hashlib.sha256()
+    exe = shutil.which(cmd[0])
+    if exe:
+        h.update(_file_digest(os.path.realpath(exe)) or b'')
+    else:
+        h.update(cmd[0].encode())
+    if os.path.basename(cmd[0]).startswith('python') and '-m' in cmd[1:-1]:
+        name = cmd[cmd.index('-m', 1) + 1].split('.')[0]
+        spec = importlib.util.find_spec(name)
+        if spec is not None:
+            dirs = list(spec.submodule_search_locations or [])
+            files = [spec.origin] if not dirs and spec.origin else []
+            for top in dirs:
+                for dirpath, dirnames, filenames in os.walk(top):
+                    dirnames[:] = sorted(d for d in dirnames if d != '__pycache__')
+                    files += [os.path.join(dirpath, f) for f in sorted(filenames) if f.endswith('.py')]
+            for path in files:
+                h.update(path.encode())
+                h.update(_file_digest(path) or b'')
+        else:
+            h.update(name.encode())
+    return h.hexdigest()
+
+
+def cache_key(*parts):
+    """Hash the inputs and options that determine a result."""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode()
+        elif not isinstance(part, (bytes, bytearray, memoryview)):
+            part = repr(part).encode()
+        h.update(hashlib.sha256(part).digest())
+    return h.hexdigest()
+
+
+class Cache:
+    """A directory of pickled values named <kind>-<key>.pkl."""
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = not os.environ.get('MBASIC_NO_CACHE')
+
+    def path(self, kind, key):
+        return os.path.join(self.directory, f'{kind}-{key[:32]}.pkl')
+
+    def get(self, kind, key):
+        """Return the cached value, or None.  A hit marks the entry as used."""
+        if not self.enabled:
+            return None
+        path = self.path(kind, key)
+        try:
+            with open(path, 'rb') as f:
+                version, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            return None
+        if version != VERSION:
+            return None
+        now = time.time()
+        os.utime(path, (now, now))
+        return value
+
+    def put(self, kind, key, value):
+        """Store a value, then evict old entries if over the size limit."""
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(kind, key)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump((VERSION, value), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.evict()
+
+    def entries(self):
+        """Return [(mtime, size, path)] for every entry, oldest first."""
+        out = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return out
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            out.append((st.st_mtime, st.st_size, path))
+        out.sort()
+        return out
+
+    def evict(self):
+        """Remove least recently used entries until under max_bytes."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+
+
+_default = Cache()
+
+
+def memoize(kind, func, *args, cache=None):
+    """Return func(*args), cached under the hash of kind and args.
+
+    bytes arguments are hashed by content, others by repr(), so args
+    must fully determine the result.  The source of func's module and of
+    the utils modules it imports is part of the key, so editing any of
+    them drops the cached results.
+    """
+    cache = cache or _default
+    key = cache_key(kind, func.__module__, func.__qualname__, source_hash(func), *args)
+    value = cache.get(kind, key)
+    if value is None:
+        value = func(*args)
+        cache.put(kind, key, value)
+    return value
+
+
+def cached_decode(data, start=0, end=None, origin=0x100, cache=None):
+    """i8080.decode() with the decoded arrays cached by image content."""
+    cache = cache or _default
+    key = cache_key('decode', source_hash(i8080), data, start, end, origin)
+    arrays = cache.get('decode', key)
+    if arrays is None:
+        stream = decode(data, start, end, origin)
+        cache.put('decode', key, tuple(a.tobytes() for a in
+                                       (stream.offset, stream.opcode, stream.length, stream.operand)))
+        return stream
+    stream = InstructionStream(data, origin)
+    for a, raw in zip((stream.offset, stream.opcode, stream.length, stream.operand), arrays):
+        a.frombytes(raw)
+    return stream
+
+
+def cached_alignment(ref, our, k=12, origin=0x100, cache=None):
+    """align.align_images() with the alignment cached by content."""
+    cache = cache or _default
+    key = cache_key('align', source_hash(align, i8080), ref, our, k, origin)
+    ops = cache.get('align', key)
+    if ops is None:
+        alignment = align_images(ref, our, k, origin=origin)
+        cache.put('align', key, alignment.ops)
+        return alignment
+    return Alignment(ops)
+
+
+def run_cached(cmd, inputs, outputs, cache=None):
+    """Run cmd unless a run with the same tool, arguments and inputs is cached.
+
+    Returns the exit status.  Console output and output files are restored
+    from the cache on a hit; failed runs are not cached.
+    """
+    cache = cache or _default
+    parts = ['exec', tool_hash(cmd), *cmd]
+    for path in inputs:
+        with open(path, 'rb') as f:
+            parts += [path, f.read()]
+    parts += outputs
+    key = cache_key(*parts)
+    hit = cache.get('exec', key)
+    if hit is not None:
+        console, files = hit
+        for path, content in files.items():
+            with open(path, 'wb') as f:
+                f.write(content)
+        sys.stdout.buffer.write(console)
+        sys.stdout.flush()
+        return 0
+
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    sys.stdout.buffer.write(result.stdout)
+    sys.stdout.flush()
+    if result.returncode == 0:
+        files = {}
+        for path in outputs:
+            with open(path, 'rb') as f:
+                files[path] = f.read()
+        cache.put('exec', key, (result.stdout, files))
+    return result.returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the compare tool cache')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('stats', help='Show cache size and entries per kind')
+    sub.add_parser('clear', help='Remove every cache entry')
+    ex = sub.add_parser('exec', help='Run a command, caching its outputs')
+    ex.add_argument('--input', action='append', default=[], help='Input file (repeatable)')
+    ex.add_argument('--output', action='append', default=[], help='Output file (repeatable)')
+    ex.add_argument('cmd', nargs=argparse.REMAINDER, help='Command after --')
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        entries = _default.entries()
+        kinds = {}
+        for _, size, path in entries:
+            kind = os.path.basename(path).split('-')[0]
+            count, total = kinds.get(kind, (0, 0))
+            kinds[kind] = (count + 1, total + size)
+        print(f"{_default.directory}: {len(entries)} entries, "
+              f"{sum(s for _, s, _ in entries)} of {MAX_BYTES} bytes")
+        for kind, (count, total) in sorted(kinds.items()):
+            print(f"  {kind:14} {count:5d} {total:10d}")
+        return 0
+    if args.command == 'clear':
+        _default.clear()
+        return 0
+
+    cmd = args.cmd[1:] if args.cmd[:1] == ['--'] else args.cmd
+    if not cmd:
+        parser.error('exec needs a command after --')
+    return run_cached(cmd, args.input, args.output)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
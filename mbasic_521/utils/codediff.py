@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+codediff.py - Full-image classified comparison of two builds
+
+Instead of stopping at the first difference, the whole image is compared
+in one pass and every mismatch is classified:
+
+    data       differing bytes in the table area before the code start
+    opcode     instructions differ; the walk resynchronizes afterwards
+    immediate  same opcode, different 8-bit operand
+    address    same opcode, different 16-bit operand (usually relocation)
+
+After an opcode mismatch both instruction streams are searched for the
+nearest point where the next few opcodes agree again, so one pass finds
+all the independent differences.
+
+Given our .sym file (and the source directory for module names) every
+mismatch is attributed to its enclosing label and module, and the report
+is grouped per routine with the modules with most differences first.
+
+Usage:
+    python3 codediff.py [ref_com] [our_com] [--start HEX] [--json FILE]
+                        [--sym out/mbasic_go.sym] [--src mbasic_src]
+
+    from codediff import compare_full, attribute
+    report = compare_full(ref, our, start=0x0B50)
+    attribute(report, load_symbols('out/mbasic_go.sym', 'mbasic_src'))
+"""
+
+import sys
+import json
+import argparse
+from collections import Counter
+
+from i8080 import OPERAND, OPERAND_BYTE, OPERAND_WORD, format_instruction
+from compare_binaries import diff_mask, diff_spans
+from symtab import load_symbols
+from cache import cached_decode
+
+
+# FNDFOR (0x0C50 memory = 0x0B50 file) is where real code begins; the
+# beginning of the file is JMP + data tables + error messages
+CODE_START = 0x0B50
+
+
+def _resync(rs, i, os_, j, window, run):
+    """Find the smallest skip (di, dj) after which run opcodes agree."""
+    r_ops, o_ops = rs.opcode, os_.opcode
+    r_end, o_end = len(r_ops), len(o_ops)
+    for total in range(1, 2 * window + 1):
+        for di in range(max(0, total - window), min(total, window) + 1):
+            dj = total - di
+            a, b = i + di, j + dj
+            if a + run > r_end or b + run > o_end:
+                continue
+            if r_ops[a:a + run] == o_ops[b:b + run]:
+                return di, dj
+    return None
+
+
+KINDS = ('data', 'opcode', 'immediate', 'address')
+
+
+def compare_full(ref, our, start=CODE_START, window=64, run=4, origin=0x100):
+    """Compare two images completely; returns a report dict.
+
+    report['mismatches'] is a list of dicts with kind, ref and our
+    addresses and the differing values or instructions.
+    """
+    mismatches = []
+
+    # Table area: plain byte comparison
+    mask = diff_mask(ref[:start], our[:start])
+    for off, length, equal in diff_spans(mask):
+        if not equal:
+            mismatches.append({
+                'kind': 'data',
+                'ref': off + origin, 'our': off + origin, 'length': length,
+                'ref_bytes': ref[off:off + length].hex(),
+                'our_bytes': our[off:off + length].hex(),
+            })
+
+    rs = cached_decode(ref, start, origin=origin)
+    os_ = cached_decode(our, start, origin=origin)
+    i = j = 0
+    unsynced = None
+    while i < len(rs) and j < len(os_):
+        r_op, o_op = rs.opcode[i], os_.opcode[j]
+        r_off, o_off = rs.offset[i], os_.offset[j]
+        if r_op != o_op:
+            skip = _resync(rs, i, os_, j, window, run)
+            di, dj = skip if skip else (1, 1)
+            r_end = rs.offset[i + di] if i + di < len(rs) else rs.end()
+            o_end = os_.offset[j + dj] if j + dj < len(os_) else os_.end()
+            mismatches.append({
+                'kind': 'opcode',
+                'ref': r_off + origin, 'our': o_off + origin,
+                'ref_length': r_end - r_off, 'our_length': o_end - o_off,
+                'ref_inst': [format_instruction(rs.opcode[k], rs.operand[k])
+                             for k in range(i, min(i + max(di, 1), len(rs)))],
+                'our_inst': [format_instruction(os_.opcode[k], os_.operand[k])
+                             for k in range(j, min(j + max(dj, 1), len(os_)))],
+            })
+            if skip is None:
+                unsynced = (r_off + origin, o_off + origin)
+                break
+            i += di
+            j += dj
+            continue
+
+        kind = OPERAND[r_op]
+        r_val, o_val = rs.operand[i], os_.operand[j]
+        if r_val != o_val and kind != 0:
+            rec = {
+                'kind': 'immediate' if kind == OPERAND_BYTE else 'address',
+                'ref': r_off + origin, 'our': o_off + origin,
+                'inst': format_instruction(r_op, r_val),
+                'ref_value': r_val, 'our_value': o_val,
+            }
+            if kind == OPERAND_WORD:
+                rec['delta'] = o_val - r_val
+            mismatches.append(rec)
+        i += 1
+        j += 1
+
+    counts = Counter(m['kind'] for m in mismatches)
+    return {
+        'ref_size': len(ref),
+        'our_size': len(our),
+        'start': start + origin,
+        'instructions': [len(rs), len(os_)],
+        'counts': {k: counts.get(k, 0) for k in KINDS},
+        'unsynced': unsynced,
+        'mismatches': mismatches,
+    }
+
+
+def attribute(report, syms):
+    """Attribute each mismatch of a report to a label and module.
+
+    Adds 'label', 'routine' and 'module' to every mismatch (looked up by
+    our address), and 'routines' and 'modules' summaries to the report.
+    """
+    routines = {}
+    modules = {}
+    for m in report['mismatches']:
+        hit = syms.lookup(m['our'])
+        if hit is None:
+            name, base, module = None, 0, None
+        else:
+            name, base, module = hit
+        m['label'] = syms.describe(m['our'])
+        m['routine'] = name
+        m['module'] = module
+        r = routines.get(base)
+        if r is None:
+            r = routines[base] = {'routine': name, 'module': module, 'address': base,
+                                  'counts': dict.fromkeys(KINDS, 0)}
+        r['counts'][m['kind']] += 1
+        counts = modules.setdefault(module or '?', dict.fromkeys(KINDS, 0))
+        counts[m['kind']] += 1
+    report['routines'] = [routines[a] for a in sorted(routines)]
+    report['modules'] = dict(sorted(modules.items(), key=lambda kv: -sum(kv[1].values())))
+    return report
+
+
+def _describe(m, show_addresses):
+    """Return the text line for one mismatch, or None to skip it."""
+    kind = m['kind']
+    where = f"ref 0x{m['ref']:04X} our 0x{m['our']:04X}"
+    if 'label' in m:
+        where += f" {m['label']:12}"
+    if kind == 'data':
+        return f"DATA      {where}: {m['length']} bytes {m['ref_bytes'][:24]} vs {m['our_bytes'][:24]}"
+    if kind == 'opcode':
+        return f"OPCODE    {where}: {'; '.join(m['ref_inst'])}  ->  {'; '.join(m['our_inst'])}"
+    if kind == 'immediate':
+        return f"IMMEDIATE {where}: {m['inst']} -> {m['our_value']:02X}h"
+    if show_addresses:
+        return f"ADDRESS   {where}: {m['inst']} -> {m['our_value']:04X}h ({m['delta']:+d})"
+    return None
+
+
+def print_report(report, show_addresses=False, out=sys.stdout):
+    """Print a report from compare_full() as text.
+
+    If attribute() has been run, mismatches are listed per routine and a
+    per-module summary follows.
+    """
+    c = report['counts']
+    print(f"Reference: {report['ref_size']} bytes, ours: {report['our_size']} bytes", file=out)
+    print(f"Code compared from 0x{report['start']:04X}: "
+          f"{report['instructions'][0]} ref / {report['instructions'][1]} our instructions", file=out)
+    print(f"Mismatches: {c['opcode']} opcode, {c['immediate']} immediate, "
+          f"{c['address']} address, {c['data']} data", file=out)
+    print(file=out)
+    routine = False
+    for m in report['mismatches']:
+        line = _describe(m, show_addresses)
+        if line is None:
+            continue
+        if 'routine' in m and m['routine'] != routine:
+            routine = m['routine']
+            print(f"{routine or '?'} ({m['module'] or '?'})", file=out)
+        print(('  ' if 'routine' in m else '') + line, file=out)
+
+    if 'modules' in report:
+        print(file=out)
+        print("Module     Opcode  Immed  Address  Data", file=out)
+        for module, mc in report['modules'].items():
+            print(f"{module:10} {mc['opcode']:6d} {mc['immediate']:6d} {mc['address']:8d} {mc['data']:5d}",
+                  file=out)
+    if report['unsynced']:
+        r, o = report['unsynced']
+        print(f"\nCould not resynchronize after ref 0x{r:04X} our 0x{o:04X}", file=out)
+
+
+def write_json(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Classify every difference between two builds')
+    parser.add_argument('ref_com', nargs='?', default='com/mbasic.com', help='Reference .com file')
+    parser.add_argument('our_com', nargs='?', default='out/mbasic_go.com', help='Our built .com file')
+    parser.add_argument('--start', type=lambda s: int(s, 16), default=CODE_START,
+                        help='File offset where code starts, hex (default: 0B50)')
+    parser.add_argument('--addresses', action='store_true', help='Also list address operand differences')
+    parser.add_argument('--json', help='Write the full report as JSON to this file')
+    parser.add_argument('--sym', help='Our symbol table, to attribute differences to routines')
+    parser.add_argument('--src', help='Source directory, to attribute routines to modules')
+    args = parser.parse_args()
+
+    with open(args.ref_com, 'rb') as f:
+        ref = f.read()
+    with open(args.our_com, 'rb') as f:
+        our = f.read()
+
+    report = compare_full(ref, our, args.start)
+    if args.sym:
+        attribute(report, load_symbols(args.sym, args.src))
+    print_report(report, args.addresses)
+    if args.json:
+        write_json(report, args.json)
+
+
+if __name__ == '__main__':
+    main()
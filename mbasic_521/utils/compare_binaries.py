@@ -2,28 +2,79 @@
 """
 compare_binaries.py - Compare two binary files and show statistics
 
+The comparison is done on whole images: the two files are XORed as big
+integers to get a difference mask, and the mask is run-length encoded
+into spans of equal and differing bytes with a regex scan, so no Python
+code runs per byte.
+
 Usage:
-    python3 compare_binaries.py <file1> <file2>
+    python3 compare_binaries.py <file1> <file2> [--spans] [--regions SIZE]
 """
 
+import re
 import sys
 import argparse
 
 
+# Runs of equal (zero) and differing (nonzero) bytes in a difference mask
+SPAN_RE = re.compile(rb'\x00+|[^\x00]+')
+
+
 def load_binary(path):
     with open(path, 'rb') as f:
         return f.read()
 
 
+def diff_mask(data1, data2):
+    """Return a mask over the common length, nonzero where the bytes differ."""
+    n = min(len(data1), len(data2))
+    x = int.from_bytes(data1[:n], 'little') ^ int.from_bytes(data2[:n], 'little')
+    return x.to_bytes(n, 'little')
+
+
+def diff_spans(mask):
+    """Run-length encode a difference mask.
+
+    Returns a list of (start, length, equal) tuples covering the mask.
+    """
+    return [(m.start(), m.end() - m.start(), mask[m.start()] == 0)
+            for m in SPAN_RE.finditer(mask)]
+
+
+def longest_match(spans):
+    """Return (start, length) of the longest equal span, or (0, 0)."""
+    best = (0, 0)
+    for start, length, equal in spans:
+        if equal and length > best[1]:
+            best = (start, length)
+    return best
+
+
+def region_stats(mask, size):
+    """Return [(start, length, differing bytes)] for each size-byte region."""
+    stats = []
+    for start in range(0, len(mask), size):
+        chunk = mask[start:start + size]
+        stats.append((start, len(chunk), len(chunk) - chunk.count(0)))
+    return stats
+
+
 def main():
     parser = argparse.ArgumentParser(description='Compare two binary files')
     parser.add_argument('file1', help='First binary file')
     parser.add_argument('file2', help='Second binary file')
     parser.add_argument('--show-diffs', type=int, default=0, help='Show first N differences')
+    parser.add_argument('--spans', action='store_true',
+                        help='List the spans of differing bytes')
+    parser.add_argument('--regions', type=lambda s: int(s, 0), default=0,
+                        help='Show differing-byte counts per region of SIZE bytes')
+    parser.add_argument('--origin', type=lambda s: int(s, 16), default=0x100,
+                        help='Load address of file offset 0, hex (default: 100)')
     args = parser.parse_args()
 
     data1 = load_binary(args.file1)
     data2 = load_binary(args.file2)
+    org = args.origin
 
     print(f"File 1: {args.file1} - {len(data1)} bytes")
     print(f"File 2: {args.file2} - {len(data2)} bytes")
@@ -31,48 +82,48 @@ def main():
     if len(data1) != len(data2):
         print(f"Size difference: {len(data1) - len(data2)} bytes")
 
-    # Count differences
-    min_len = min(len(data1), len(data2))
-    diffs = []
-    for i in range(min_len):
-        if data1[i] != data2[i]:
-            diffs.append(i)
+    mask = diff_mask(data1, data2)
+    spans = diff_spans(mask)
+    min_len = len(mask)
+    diff_count = min_len - mask.count(0)
+    print(f"Differing bytes: {diff_count} ({100*diff_count/max(min_len, 1):.1f}%)"
+          f" in {sum(1 for s in spans if not s[2])} spans")
+
+    if args.show_diffs and diff_count:
+        print(f"\nFirst {min(args.show_diffs, diff_count)} differences:")
+        shown = 0
+        for start, length, equal in spans:
+            if equal:
+                continue
+            for off in range(start, min(start + length, start + args.show_diffs - shown)):
+                print(f"  0x{off + org:04X}: {data1[off]:02x} vs {data2[off]:02x}")
+            shown += min(length, args.show_diffs - shown)
+            if shown >= args.show_diffs:
+                break
 
-    diff_count = len(diffs)
-    print(f"Differing bytes: {diff_count} ({100*diff_count/min_len:.1f}%)")
+    # Find first difference
+    if diff_count:
+        first_diff = next(s[0] for s in spans if not s[2])
+        print(f"\nFirst difference at offset 0x{first_diff:04X} (addr 0x{first_diff+org:04X})")
 
-    if args.show_diffs and diffs:
-        print(f"\nFirst {min(args.show_diffs, len(diffs))} differences:")
-        for i, off in enumerate(diffs[:args.show_diffs]):
-            addr = off + 0x100
-            print(f"  0x{addr:04X}: {data1[off]:02x} vs {data2[off]:02x}")
+    max_run_start, max_run = longest_match(spans)
+    print(f"Longest identical run: {max_run} bytes at 0x{max_run_start+org:04X}")
 
-    # Find first difference
-    if diffs:
-        first_diff = diffs[0]
-        print(f"\nFirst difference at offset 0x{first_diff:04X} (addr 0x{first_diff+0x100:04X})")
-
-    # Find longest matching run
-    max_run = 0
-    max_run_start = 0
-    run_start = 0
-    run_len = 0
-    for i in range(min_len):
-        if data1[i] == data2[i]:
-            if run_len == 0:
-                run_start = i
-            run_len += 1
-        else:
-            if run_len > max_run:
-                max_run = run_len
-                max_run_start = run_start
-            run_len = 0
-    if run_len > max_run:
-        max_run = run_len
-        max_run_start = run_start
-
-    print(f"Longest identical run: {max_run} bytes at 0x{max_run_start+0x100:04X}")
+    if args.spans:
+        print("\nDiffering spans:")
+        print("  Start   End     Bytes")
+        for start, length, equal in spans:
+            if not equal:
+                print(f"  0x{start+org:04X}  0x{start+length-1+org:04X}  {length:5d}")
+
+    if args.regions:
+        print(f"\nDifferences per 0x{args.regions:X}-byte region:")
+        for start, length, count in region_stats(mask, args.regions):
+            bar = '#' * ((40 * count + length - 1) // length) if count else ''
+            print(f"  0x{start+org:04X}  {count:5d}/{length:<5d} {bar}")
+
+    return 1 if diff_count or len(data1) != len(data2) else 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -1,46 +1,8 @@
 #!/usr/bin/env python3
 """Compare code sections by disassembling and ignoring address operands."""
 
-# 8080 instruction info: (length, has_addr_operand)
-INST_INFO = {
-    0x00: (1, False), 0x01: (3, True), 0x02: (1, False), 0x03: (1, False),
-    0x04: (1, False), 0x05: (1, False), 0x06: (2, False), 0x07: (1, False),
-    0x08: (1, False), 0x09: (1, False), 0x0A: (1, False), 0x0B: (1, False),
-    0x0C: (1, False), 0x0D: (1, False), 0x0E: (2, False), 0x0F: (1, False),
-    0x10: (1, False), 0x11: (3, True), 0x12: (1, False), 0x13: (1, False),
-    0x14: (1, False), 0x15: (1, False), 0x16: (2, False), 0x17: (1, False),
-    0x18: (1, False), 0x19: (1, False), 0x1A: (1, False), 0x1B: (1, False),
-    0x1C: (1, False), 0x1D: (1, False), 0x1E: (2, False), 0x1F: (1, False),
-    0x20: (1, False), 0x21: (3, True), 0x22: (3, True), 0x23: (1, False),
-    0x24: (1, False), 0x25: (1, False), 0x26: (2, False), 0x27: (1, False),
-    0x28: (1, False), 0x29: (1, False), 0x2A: (3, True), 0x2B: (1, False),
-    0x2C: (1, False), 0x2D: (1, False), 0x2E: (2, False), 0x2F: (1, False),
-    0x30: (1, False), 0x31: (3, True), 0x32: (3, True), 0x33: (1, False),
-    0x34: (1, False), 0x35: (1, False), 0x36: (2, False), 0x37: (1, False),
-    0x38: (1, False), 0x39: (1, False), 0x3A: (3, True), 0x3B: (1, False),
-    0x3C: (1, False), 0x3D: (1, False), 0x3E: (2, False), 0x3F: (1, False),
-    # MOV instructions 0x40-0x7F
-    **{i: (1, False) for i in range(0x40, 0x80)},
-    # ALU instructions 0x80-0xBF
-    **{i: (1, False) for i in range(0x80, 0xC0)},
-    # Control instructions 0xC0-0xFF
-    0xC0: (1, False), 0xC1: (1, False), 0xC2: (3, True), 0xC3: (3, True),
-    0xC4: (3, True), 0xC5: (1, False), 0xC6: (2, False), 0xC7: (1, False),
-    0xC8: (1, False), 0xC9: (1, False), 0xCA: (3, True), 0xCB: (2, False),
-    0xCC: (3, True), 0xCD: (3, True), 0xCE: (2, False), 0xCF: (1, False),
-    0xD0: (1, False), 0xD1: (1, False), 0xD2: (3, True), 0xD3: (2, False),
-    0xD4: (3, True), 0xD5: (1, False), 0xD6: (2, False), 0xD7: (1, False),
-    0xD8: (1, False), 0xD9: (1, False), 0xDA: (3, True), 0xDB: (2, False),
-    0xDC: (3, True), 0xDD: (3, True), 0xDE: (2, False), 0xDF: (1, False),
-    0xE0: (1, False), 0xE1: (1, False), 0xE2: (3, True), 0xE3: (1, False),
-    0xE4: (3, True), 0xE5: (1, False), 0xE6: (2, False), 0xE7: (1, False),
-    0xE8: (1, False), 0xE9: (1, False), 0xEA: (3, True), 0xEB: (1, False),
-    0xEC: (3, True), 0xED: (2, False), 0xEE: (2, False), 0xEF: (1, False),
-    0xF0: (1, False), 0xF1: (1, False), 0xF2: (3, True), 0xF3: (1, False),
-    0xF4: (3, True), 0xF5: (1, False), 0xF6: (2, False), 0xF7: (1, False),
-    0xF8: (1, False), 0xF9: (1, False), 0xFA: (3, True), 0xFB: (1, False),
-    0xFC: (3, True), 0xFD: (2, False), 0xFE: (2, False), 0xFF: (1, False),
-}
+from cache import cached_decode
+from i8080 import LENGTH, OPERAND, OPERAND_BYTE
 
 ref = open('/home/wohl/mbasic2025/com/mbasic.com', 'rb').read()
 our = open('/home/wohl/mbasic2025/out/mbasic_go.com', 'rb').read()
@@ -54,13 +16,16 @@ print()
 # This is where actual code begins after data tables
 START = 0x0B50
 
-ref_pos = START
-our_pos = START
-inst_num = 0
+# Both builds are walked on the reference instruction stream; after an
+# opcode difference we assume the same length and carry on
+stream = cached_decode(ref, START, len(ref) - 3)
 diffs_found = []
 
-while ref_pos < len(ref) - 3 and our_pos < len(our) - 3:
-    r_op = ref[ref_pos]
+for inst_num in range(len(stream)):
+    ref_pos = our_pos = stream.offset[inst_num]
+    if our_pos >= len(our) - 3:
+        break
+    r_op = stream.opcode[inst_num]
     o_op = our[our_pos]
 
     # Check if opcodes match
@@ -75,18 +40,10 @@ while ref_pos < len(ref) - 3 and our_pos < len(our) - 3:
         })
         if len(diffs_found) >= 5:
             break
-        # Try to continue - assume same length
-        inst_len = INST_INFO.get(r_op, (1, False))[0]
-        ref_pos += inst_len
-        our_pos += inst_len
-        inst_num += 1
         continue
 
-    # Opcodes match - get instruction info
-    inst_len, has_addr = INST_INFO.get(r_op, (1, False))
-
     # Check immediate operand for 2-byte instructions
-    if inst_len == 2:
+    if OPERAND[r_op] == OPERAND_BYTE:
         if ref[ref_pos+1] != our[our_pos+1]:
             diffs_found.append({
                 'type': 'immediate',
@@ -102,10 +59,9 @@ while ref_pos < len(ref) - 3 and our_pos < len(our) - 3:
 
     # For 3-byte with address, we skip the address bytes (they'll differ due to relocation)
     # But we should check if they're NOT addresses (e.g., data embedded in code)
-
-    ref_pos += inst_len
-    our_pos += inst_len
-    inst_num += 1
+else:
+    inst_num = len(stream)
+    ref_pos = our_pos = stream.end()
 
 print(f"Scanned {inst_num} instructions from 0x{START:04X}")
 print(f"Ref position: 0x{ref_pos:04X}, Our position: 0x{our_pos:04X}")
@@ -136,9 +92,8 @@ ref_pos = START
 our_pos = START
 last_offset = 0
 
-for _ in range(inst_num):
-    r_op = ref[ref_pos]
-    inst_len = INST_INFO.get(r_op, (1, False))[0]
+for i in range(inst_num):
+    inst_len = LENGTH[ref[ref_pos]]
     ref_pos += inst_len
     our_pos += inst_len
 
@@ -1,68 +1,92 @@
 #!/usr/bin/env python3
-"""Find where code sizes diverge by tracking offset through file."""
+"""
+find_diverge.py - Find every point where the build drifts from the reference
 
-ref = open('/home/wohl/mbasic2025/com/mbasic.com', 'rb').read()
-our = open('/home/wohl/mbasic2025/out/mbasic_go.com', 'rb').read()
+Aligns the two images with align.py (relocation-masked, anchor based) and
+lists each insertion or deletion with the drift it leaves behind, so all
+drift points come out of a single pass instead of a window scan.
 
-print(f"Reference: {len(ref)} bytes")
-print(f"Ours: {len(our)} bytes")
-print()
+Usage:
+    python3 find_diverge.py [ref_com] [our_com] [--sym out/mbasic_go.sym]
+                            [--src mbasic_src] [--changes]
+"""
 
-# Track position alignment through the file
-# Use a sliding window to find where our position drifts from reference
+import argparse
+from collections import defaultdict
 
-last_drift = 0
-scan_step = 256  # Check every 256 bytes
-window = 16      # Match window size
+from cache import cached_alignment
+from symtab import load_symbols
 
-print("Scanning for where files drift apart...")
-print("File offset | Ref addr | Our addr | Drift")
-print("-" * 50)
 
-for ref_pos in range(0, len(ref) - window, scan_step):
-    # Get a pattern from reference
-    pattern = ref[ref_pos:ref_pos+window]
+def main():
+    parser = argparse.ArgumentParser(description='Find where the build drifts from the reference')
+    parser.add_argument('ref_com', nargs='?', default='com/mbasic.com', help='Reference .com file')
+    parser.add_argument('our_com', nargs='?', default='out/mbasic_go.com', help='Our built .com file')
+    parser.add_argument('--sym', help='Our symbol table, to name the routine at each edit')
+    parser.add_argument('--src', help='Source directory, to attribute edits to modules')
+    parser.add_argument('--k', type=int, default=12, help='Anchor length in bytes (default: 12)')
+    parser.add_argument('--changes', action='store_true',
+                        help='Also list same-length changes (no drift)')
+    parser.add_argument('--origin', type=lambda s: int(s, 16), default=0x100,
+                        help='Load address of file offset 0, hex (default: 100)')
+    args = parser.parse_args()
 
-    # Search for it in our file within a reasonable range
-    search_start = max(0, ref_pos - 100)
-    search_end = min(len(our), ref_pos + 100)
+    with open(args.ref_com, 'rb') as f:
+        ref = f.read()
+    with open(args.our_com, 'rb') as f:
+        our = f.read()
+    org = args.origin
+    syms = load_symbols(args.sym, args.src) if args.sym else None
 
-    our_pos = our.find(pattern, search_start, search_end)
+    print(f"Reference: {len(ref)} bytes")
+    print(f"Ours: {len(our)} bytes")
+    print()
 
-    if our_pos >= 0:
-        drift = ref_pos - our_pos
-        if drift != last_drift:
-            print(f"0x{ref_pos:04X}     | 0x{ref_pos+0x100:04X}  | 0x{our_pos+0x100:04X}  | {drift:+d}")
-            last_drift = drift
-    else:
-        # Pattern not found - files might be too different here
-        print(f"0x{ref_pos:04X}     | Pattern not found in our file")
+    alignment = cached_alignment(ref, our, args.k, org)
+    edits = alignment.edits()
 
-print()
-print("Detailed scan around transition points...")
+    print("Ref addr | Our addr | Edit                | Drift | Location")
+    print("-" * 72)
+    per_module = defaultdict(lambda: [0, 0, 0])     # inserted, deleted, changed
+    same_len = 0
+    for tag, a1, a2, b1, b2 in edits:
+        alen, blen = a2 - a1, b2 - b1
+        where = ''
+        module = None
+        if syms:
+            where = syms.describe(b1 + org)
+            module = syms.module_of(b1 + org)
+            if module:
+                where += f" ({module})"
+        if alen == blen:
+            same_len += 1
+            per_module[module][2] += alen
+            if not args.changes:
+                continue
+            desc = f"change {alen}"
+        elif tag == 'insert':
+            desc = f"insert {blen}"
+        elif tag == 'delete':
+            desc = f"delete {alen}"
+        else:
+            desc = f"replace {alen}->{blen}"
+        if blen > alen:
+            per_module[module][0] += blen - alen
+        elif alen > blen:
+            per_module[module][1] += alen - blen
+        drift = b2 - a2
+        print(f"0x{a1+org:04X}   | 0x{b1+org:04X}   | {desc:19} | {drift:+5d} | {where}")
 
-# Fine-grained scan to find exact transition
-# Start from where Overflow is (both at same position) and work forward
-start = 0x0400  # Just after Overflow
-for ref_pos in range(start, min(len(ref), len(our)), 16):
-    pattern = ref[ref_pos:ref_pos+8]
+    print()
+    print(f"{len(edits) - same_len} drift points, {same_len} same-length changes")
+    print(f"Final drift: {len(our) - len(ref):+d} bytes")
 
-    # Try to find at same position first
-    if our[ref_pos:ref_pos+8] == pattern:
-        continue  # Still aligned
+    if syms and args.src:
+        print()
+        print("Module     Inserted  Deleted  Changed   Net")
+        for module, (ins, dels, chg) in per_module.items():
+            print(f"{module or '?':10} {ins:8d} {dels:8d} {chg:8d} {ins - dels:+5d}")
 
-    # Try to find nearby
-    our_pos = our.find(pattern, max(0, ref_pos-64), min(len(our), ref_pos+64))
-    if our_pos >= 0:
-        drift = ref_pos - our_pos
-        if drift != 0:
-            print(f"First drift at ref 0x{ref_pos:04X}: our pattern at 0x{our_pos:04X}, drift={drift}")
 
-            # Show context
-            print(f"  Ref bytes: {' '.join(f'{ref[j]:02X}' for j in range(ref_pos-8, ref_pos+16))}")
-            print(f"  Our bytes: {' '.join(f'{our[j]:02X}' for j in range(our_pos-8, our_pos+16))}")
-            break
-    else:
-        print(f"Pattern at ref 0x{ref_pos:04X} not found nearby in our file")
-        print(f"  Ref pattern: {' '.join(f'{ref[j]:02X}' for j in range(ref_pos, ref_pos+8))}")
-        break
+if __name__ == '__main__':
+    main()
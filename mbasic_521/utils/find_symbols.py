@@ -3,15 +3,21 @@
 find_symbols.py - Find symbol patterns from one binary in another
 
 This tool searches for byte patterns from a built .com file in a reference binary
-to determine where routines appear in the reference.
+to determine where routines appear in the reference.  The reference is indexed
+once (refindex.py) and every symbol is scored against all positions with the
+16-bit operands of its pattern treated as wildcards, so relocated CALL/JMP
+targets do not lower the score.
 
 Usage:
-    python3 find_symbols.py <our_com> <ref_com> <our_sym> [--min-match N]
+    python3 find_symbols.py <our_com> <ref_com> <our_sym> [--min-match N] [--no-mask]
 """
 
 import sys
 import argparse
 
+from refindex import RefIndex, symbol_pattern
+from symtab import parse_sym_file
+
 
 def load_binary(path):
     """Load a binary file."""
@@ -21,36 +27,7 @@ def load_binary(path):
 
 def load_symbols(path):
     """Load symbol table (name -> address)."""
-    syms = {}
-    with open(path, 'r') as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) == 2:
-                try:
-                    syms[parts[0]] = int(parts[1], 16)
-                except ValueError:
-                    pass
-    return syms
-
-
-def find_pattern(pattern, data, min_match=8):
-    """Find best match for pattern in data.
-
-    Returns (position, score) or (None, 0) if no good match.
-    """
-    pattern_len = len(pattern)
-    best_pos = None
-    best_score = 0
-
-    for pos in range(len(data) - pattern_len):
-        matches = sum(1 for i in range(pattern_len) if data[pos + i] == pattern[i])
-        if matches > best_score:
-            best_score = matches
-            best_pos = pos
-
-    if best_score >= min_match:
-        return best_pos, best_score
-    return None, best_score
+    return {name: addr for addr, name in parse_sym_file(path)}
 
 
 def main():
@@ -61,6 +38,8 @@ def main():
     parser.add_argument('--min-match', type=int, default=8, help='Minimum matching bytes (default: 8)')
     parser.add_argument('--pattern-len', type=int, default=12, help='Pattern length (default: 12)')
     parser.add_argument('--symbols', nargs='*', help='Specific symbols to search (default: all)')
+    parser.add_argument('--no-mask', action='store_true',
+                        help='Score address operands too (default: treat them as matching)')
     args = parser.parse_args()
 
     # Load files
@@ -78,14 +57,14 @@ def main():
         syms = {k: v for k, v in syms.items() if k in args.symbols}
 
     # Find each symbol in reference
+    index = RefIndex(ref)
     results = []
     for name, our_addr in sorted(syms.items(), key=lambda x: x[1]):
-        our_off = our_addr - 0x100
-        if our_off < 0 or our_off + args.pattern_len > len(ours):
+        pattern, wildcards = symbol_pattern(ours, our_addr - 0x100, args.pattern_len,
+                                            not args.no_mask)
+        if pattern is None:
             continue
-
-        pattern = ours[our_off:our_off + args.pattern_len]
-        ref_pos, score = find_pattern(pattern, ref, args.min_match)
+        ref_pos, score = index.best_match(pattern, wildcards, args.min_match)
 
         if ref_pos is not None:
             ref_addr = ref_pos + 0x100
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+i8080.py - Table-driven 8080 instruction decoder shared by the compare tools
+
+The length, operand-kind and mnemonic of every opcode are precomputed into
+256-entry tables once at import time.  decode() walks an image in a single
+pass and returns an InstructionStream: parallel arrays of offset, opcode,
+length and operand, so the compare scripts work on one decoded form instead
+of re-walking the bytes with their own dict lookups.
+
+Usage:
+    python3 i8080.py <file> [--start HEX] [--count N] [--origin HEX]
+
+    from i8080 import decode, mask_operands
+    stream = decode(data, start=0x0B50)
+    masked = mask_operands(data)
+"""
+
+import sys
+import argparse
+from array import array
+from bisect import bisect_right
+
+
+# Operand kinds
+OPERAND_NONE = 0        # opcode only
+OPERAND_BYTE = 1        # 8-bit immediate or port number
+OPERAND_WORD = 2        # 16-bit address or immediate (relocatable)
+
+REGS = ['B', 'C', 'D', 'E', 'H', 'L', 'M', 'A']
+PAIRS = ['B', 'D', 'H', 'SP']
+ALU_OPS = ['ADD', 'ADC', 'SUB', 'SBB', 'ANA', 'XRA', 'ORA', 'CMP']
+ALU_IMM = ['ADI', 'ACI', 'SUI', 'SBI', 'ANI', 'XRI', 'ORI', 'CPI']
+CONDS = ['NZ', 'Z', 'NC', 'C', 'PO', 'PE', 'P', 'M']
+
+
+def _build_tables():
+    """Build the length, operand-kind and mnemonic tables."""
+    mnem = [None] * 256
+    kind = [OPERAND_NONE] * 256
+
+    # 0x00-0x3F: register pair, increment/decrement and rotate group
+    for rp in range(4):
+        base = rp << 4
+        mnem[base + 0x01] = f"LXI {PAIRS[rp]},"
+        kind[base + 0x01] = OPERAND_WORD
+        mnem[base + 0x03] = f"INX {PAIRS[rp]}"
+        mnem[base + 0x09] = f"DAD {PAIRS[rp]}"
+        mnem[base + 0x0B] = f"DCX {PAIRS[rp]}"
+    mnem[0x02], mnem[0x12] = "STAX B", "STAX D"
+    mnem[0x0A], mnem[0x1A] = "LDAX B", "LDAX D"
+    for op, name in ((0x22, "SHLD"), (0x2A, "LHLD"), (0x32, "STA"), (0x3A, "LDA")):
+        mnem[op] = name
+        kind[op] = OPERAND_WORD
+    for r in range(8):
+        mnem[(r << 3) | 0x04] = f"INR {REGS[r]}"
+        mnem[(r << 3) | 0x05] = f"DCR {REGS[r]}"
+        mnem[(r << 3) | 0x06] = f"MVI {REGS[r]},"
+        kind[(r << 3) | 0x06] = OPERAND_BYTE
+    for op, name in zip(range(0x07, 0x40, 8),
+                        ("RLC", "RRC", "RAL", "RAR", "DAA", "CMA", "STC", "CMC")):
+        mnem[op] = name
+    mnem[0x00] = "NOP"
+    for op in range(0x08, 0x40, 8):
+        mnem[op] = "NOP*"           # undocumented NOP aliases
+
+    # 0x40-0x7F: MOV, with HLT in place of MOV M,M
+    for op in range(0x40, 0x80):
+        mnem[op] = f"MOV {REGS[(op >> 3) & 7]},{REGS[op & 7]}"
+    mnem[0x76] = "HLT"
+
+    # 0x80-0xBF: ALU with register
+    for op in range(0x80, 0xC0):
+        mnem[op] = f"{ALU_OPS[(op >> 3) & 7]} {REGS[op & 7]}"
+
+    # 0xC0-0xFF: control, stack and immediate ALU group
+    for cc in range(8):
+        base = 0xC0 | (cc << 3)
+        mnem[base + 0] = f"R{CONDS[cc]}"
+        mnem[base + 2] = f"J{CONDS[cc]}"
+        mnem[base + 4] = f"C{CONDS[cc]}"
+        kind[base + 2] = kind[base + 4] = OPERAND_WORD
+        mnem[base + 6] = ALU_IMM[cc]
+        kind[base + 6] = OPERAND_BYTE
+        mnem[base + 7] = f"RST {cc}"
+    for rp, name in enumerate(("B", "D", "H", "PSW")):
+        mnem[0xC1 + (rp << 4)] = f"POP {name}"
+        mnem[0xC5 + (rp << 4)] = f"PUSH {name}"
+    mnem[0xC3], mnem[0xCD], mnem[0xC9] = "JMP", "CALL", "RET"
+    kind[0xC3] = kind[0xCD] = OPERAND_WORD
+    mnem[0xD3], mnem[0xDB] = "OUT", "IN"
+    kind[0xD3] = kind[0xDB] = OPERAND_BYTE
+    mnem[0xE3], mnem[0xE9], mnem[0xEB] = "XTHL", "PCHL", "XCHG"
+    mnem[0xF3], mnem[0xF9], mnem[0xFB] = "DI", "SPHL", "EI"
+
+    # Undocumented aliases: CB=JMP, D9=RET, DD/ED/FD=CALL
+    mnem[0xCB], kind[0xCB] = "JMP*", OPERAND_WORD
+    mnem[0xD9] = "RET*"
+    for op in (0xDD, 0xED, 0xFD):
+        mnem[op], kind[op] = "CALL*", OPERAND_WORD
+
+    length = bytes(1 + k for k in kind)
+    return length, bytes(kind), tuple(mnem)
+
+
+# LENGTH[op] is the instruction length, OPERAND[op] its operand kind and
+# MNEMONIC[op] the mnemonic text (operand appended by format_instruction)
+LENGTH, OPERAND, MNEMONIC = _build_tables()
+
+
+class InstructionStream:
+    """A decoded run of instructions held in parallel arrays.
+
+    offset[i], opcode[i], length[i] and operand[i] describe instruction i.
+    operand is -1 for instructions without one.  Offsets are file offsets;
+    origin is added only when formatting addresses.
+    """
+
+    __slots__ = ('data', 'origin', 'offset', 'opcode', 'length', 'operand')
+
+    def __init__(self, data, origin=0x100):
+        self.data = data
+        self.origin = origin
+        self.offset = array('I')
+        self.opcode = array('B')
+        self.length = array('B')
+        self.operand = array('i')
+
+    def __len__(self):
+        return len(self.offset)
+
+    def index_at(self, offset):
+        """Return the index of the instruction covering offset, or -1."""
+        i = bisect_right(self.offset, offset) - 1
+        if i >= 0 and offset < self.offset[i] + self.length[i]:
+            return i
+        return -1
+
+    def end(self):
+        """Return the file offset just past the last decoded instruction."""
+        if not self.offset:
+            return 0
+        return self.offset[-1] + self.length[-1]
+
+    def format(self, i):
+        """Return (address, hex bytes, instruction text) for instruction i."""
+        off = self.offset[i]
+        n = self.length[i]
+        hex_bytes = ' '.join(f'{b:02X}' for b in self.data[off:off + n])
+        return off + self.origin, hex_bytes, format_instruction(self.opcode[i], self.operand[i])
+
+
+def format_instruction(opcode, operand):
+    """Format an opcode and its operand (-1 for none) as assembler text."""
+    mnem = MNEMONIC[opcode]
+    kind = OPERAND[opcode]
+    if kind == OPERAND_NONE or operand < 0:
+        return mnem
+    sep = '' if mnem.endswith(',') else ' '
+    if kind == OPERAND_BYTE:
+        return f"{mnem}{sep}{operand:02X}h"
+    return f"{mnem}{sep}{operand:04X}h"
+
+
+def decode(data, start=0, end=None, origin=0x100):
+    """Decode data[start:end] into an InstructionStream in one linear pass.
+
+    A final instruction whose operand runs past end is kept with the
+    bytes that are present and an operand of -1.
+    """
+    if end is None or end > len(data):
+        end = len(data)
+    stream = InstructionStream(data, origin)
+    offsets = []
+    opcodes = []
+    lengths = []
+    operands = []
+    length_table = LENGTH
+    pos = start
+    while pos < end:
+        op = data[pos]
+        n = length_table[op]
+        offsets.append(pos)
+        opcodes.append(op)
+        if n == 1:
+            operands.append(-1)
+        elif pos + n > end:
+            n = end - pos
+            operands.append(-1)
+        elif n == 2:
+            operands.append(data[pos + 1])
+        else:
+            operands.append(data[pos + 1] | (data[pos + 2] << 8))
+        lengths.append(n)
+        pos += n
+    stream.offset.extend(offsets)
+    stream.opcode.frombytes(bytes(opcodes))
+    stream.length.frombytes(bytes(lengths))
+    stream.operand.extend(operands)
+    return stream
+
+
+def mask_operands(data, start=0, stream=None):
+    """Return a copy of data with every 16-bit operand replaced by 0000.
+
+    Addresses move whenever code is inserted or removed, so comparing
+    masked images finds the same code regardless of relocation.
+    """
+    if stream is None:
+        stream = decode(data, start)
+    masked = bytearray(data)
+    kinds = OPERAND
+    offsets = stream.offset
+    lengths = stream.length
+    for i, op in enumerate(stream.opcode):
+        if kinds[op] == OPERAND_WORD and lengths[i] == 3:
+            off = offsets[i]
+            masked[off + 1] = masked[off + 2] = 0
+    return bytes(masked)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Decode an 8080 image')
+    parser.add_argument('file', help='Binary file to decode')
+    parser.add_argument('--start', type=lambda s: int(s, 16), default=0,
+                        help='File offset to start at, hex (default: 0)')
+    parser.add_argument('--count', type=int, default=0,
+                        help='Number of instructions to list (default: all)')
+    parser.add_argument('--origin', type=lambda s: int(s, 16), default=0x100,
+                        help='Load address of file offset 0, hex (default: 100)')
+    args = parser.parse_args()
+
+    with open(args.file, 'rb') as f:
+        data = f.read()
+
+    stream = decode(data, args.start, origin=args.origin)
+    count = len(stream) if args.count <= 0 else min(args.count, len(stream))
+    for i in range(count):
+        addr, hex_bytes, inst = stream.format(i)
+        print(f"{addr:04X}: {hex_bytes:12s}  {inst}")
+    if count == len(stream):
+        print(f"; {len(stream)} instructions, 0x{args.start:04X}-0x{stream.end():04X}",
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,14 +3,36 @@
 map_routine_order.py - Map routine order in a binary by finding patterns
 
 This tool takes a list of routine patterns from one binary and finds their
-order in another binary.
+order in another binary.  All modules' symbols are located in one batch
+against a single reference index (refindex.py), the results are cached
+under the hashes of both binaries, and the module order found in the
+reference is printed as a proposed link order.  A pattern found at
+several places is taken at the one nearest its address in our binary.
+An order is scored by the number of symbols that fall outside the
+longest run of them already in that order, so one misplaced symbol
+counts once.
 
 Usage:
     python3 map_routine_order.py <our_com> <ref_com> <our_sym> [--module MODULE]
+                                 [--order bintrp,f4,...] [--no-cache]
 """
 
 import sys
+import json
 import argparse
+from bisect import bisect_right
+
+import i8080
+import refindex
+import symtab
+from refindex import RefIndex, symbol_pattern
+from symtab import parse_sym_file
+from cache import Cache, cache_key, source_hash
+
+
+# Current link order, from build.sh
+LINK_ORDER = ['bintrp', 'f4', 'biptrg', 'biedit', 'biprtu', 'bio', 'bimisc',
+              'bistrs', 'binlin', 'fiveo', 'dskcom', 'dcpm', 'fivdsk', 'init']
 
 
 def load_binary(path):
@@ -19,33 +41,7 @@ def load_binary(path):
 
 
 def load_symbols(path):
-    syms = {}
-    with open(path, 'r') as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) == 2:
-                try:
-                    syms[parts[0]] = int(parts[1], 16)
-                except ValueError:
-                    pass
-    return syms
-
-
-def find_pattern(pattern, data, min_match=6):
-    """Find best match for pattern in data."""
-    pattern_len = len(pattern)
-    best_pos = None
-    best_score = 0
-
-    for pos in range(len(data) - pattern_len):
-        matches = sum(1 for i in range(pattern_len) if data[pos + i] == pattern[i])
-        if matches > best_score:
-            best_score = matches
-            best_pos = pos
-
-    if best_score >= min_match:
-        return best_pos, best_score
-    return None, best_score
+    return {name: addr for addr, name in parse_sym_file(path)}
 
 
 # Module definitions - which symbols belong to which module
@@ -65,12 +61,83 @@ MODULE_SYMBOLS = {
            'FOUTO', 'SQR', 'EXP', 'RND', 'COS', 'SIN', 'TAN', 'ATN'],
     'fiveo': ['WHILE', 'WEND', 'CALLS', 'CHAIN', 'COMMON', 'WRITE'],
     'dskcom': ['SAVE', 'LOAD', 'MERGE', 'CLOSE', 'FIELD', 'RSET', 'LSET'],
-    'fivdsk': ['VARECS', 'PUT', 'GET', 'EOF', 'LOC', 'LOF'],
-    'dcpm': ['NAME', 'OPEN', 'SYSTEM', 'RESET', 'KILL', 'FILES'],
+    'fivdsk': ['VARECS', 'PUT', 'GET'],
+    'dcpm': ['NAME', 'OPEN', 'SYSTEM', 'RESET', 'KILL', 'FILES', 'EOF', 'LOC', 'LOF'],
     'init': ['INIT', 'INITSA', 'DSKDAT'],
 }
 
 
+def locate_modules(ours, ref, syms, modules, pattern_len, min_match=6):
+    """Locate every module's symbols in ref using one shared index.
+
+    Returns {module: [(ref_addr, name, our_addr, score), ...]} sorted by
+    reference address.
+    """
+    index = RefIndex(ref)
+    found = {}
+    for module in modules:
+        hits = []
+        for name in MODULE_SYMBOLS.get(module, []):
+            if name not in syms:
+                continue
+            our_addr = syms[name]
+            pattern, wildcards = symbol_pattern(ours, our_addr - 0x100, pattern_len)
+            if pattern is None:
+                continue
+            ref_pos, score = index.best_match(pattern, wildcards, min_match,
+                                              near=our_addr - 0x100)
+
+            if ref_pos is not None:
+                hits.append((ref_pos + 0x100, name, our_addr, score))
+        hits.sort()
+        found[module] = hits
+    return found
+
+
+def cached_locate(ours, ref, sym_path, modules, pattern_len, use_cache=True):
+    """locate_modules() with results cached under the binaries' hashes."""
+    with open(sym_path, 'rb') as f:
+        sym_data = f.read()
+    key = cache_key(source_hash(locate_modules, refindex, symtab, i8080), ours, ref, sym_data,
+                    json.dumps([modules, pattern_len, MODULE_SYMBOLS]))
+    cache = Cache()
+    found = cache.get('routine_order', key) if use_cache else None
+    if found is None:
+        found = locate_modules(ours, ref, load_symbols(sym_path), modules, pattern_len)
+        if use_cache:
+            cache.put('routine_order', key, found)
+    return found
+
+
+def propose_order(found):
+    """Order modules by the median reference address of their symbols."""
+    placed = []
+    for module, hits in found.items():
+        if hits:
+            placed.append((hits[len(hits) // 2][0], module))
+    return [module for _, module in sorted(placed)]
+
+
+def order_violations(found, order):
+    """Count the symbols out of a link order in the reference.
+
+    The symbols are taken in reference address order; those outside the
+    longest run whose modules never go back in the link order are out of
+    order.
+    """
+    rank = {module: i for i, module in enumerate(order)}
+    seq = sorted((ref_addr, rank[module]) for module, hits in found.items()
+                 if module in rank for ref_addr, *_ in hits)
+    tails = []          # lowest last rank of a run of each length
+    for _, r in seq:
+        i = bisect_right(tails, r)
+        if i == len(tails):
+            tails.append(r)
+        else:
+            tails[i] = r
+    return len(seq) - len(tails)
+
+
 def main():
     parser = argparse.ArgumentParser(description='Map routine order in reference binary')
     parser.add_argument('our_com', help='Our built .com file')
@@ -78,43 +145,39 @@ def main():
     parser.add_argument('our_sym', help='Our symbol table file')
     parser.add_argument('--module', help='Specific module to analyze')
     parser.add_argument('--pattern-len', type=int, default=10, help='Pattern length')
+    parser.add_argument('--order', help='Comma-separated link order to score against the reference')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the result cache')
     args = parser.parse_args()
 
     ours = load_binary(args.our_com)
     ref = load_binary(args.ref_com)
-    syms = load_symbols(args.our_sym)
+    modules = [args.module] if args.module else list(MODULE_SYMBOLS)
+
+    found = cached_locate(ours, ref, args.our_sym, modules, args.pattern_len,
+                          not args.no_cache)
+
+    for module in modules:
+        print(f"Routine order in reference (module: {module}):")
+        print("-" * 60)
+        for ref_addr, name, our_addr, score in found[module]:
+            diff = ref_addr - our_addr
+            print(f"  0x{ref_addr:04X}: {name:12} (our: 0x{our_addr:04X}, diff={diff:+5d})")
+        print()
 
-    # Determine which symbols to search
     if args.module:
-        search_syms = MODULE_SYMBOLS.get(args.module, [])
-    else:
-        search_syms = list(syms.keys())
-
-    # Find each symbol in reference
-    found = []
-    for name in search_syms:
-        if name not in syms:
-            continue
-        our_addr = syms[name]
-        our_off = our_addr - 0x100
-        if our_off < 0 or our_off + args.pattern_len > len(ours):
-            continue
-
-        pattern = ours[our_off:our_off + args.pattern_len]
-        ref_pos, score = find_pattern(pattern, ref)
-
-        if ref_pos is not None:
-            ref_addr = ref_pos + 0x100
-            found.append((ref_addr, name, our_addr, score))
-
-    # Sort by reference address
-    found.sort()
-
-    print(f"Routine order in reference (module: {args.module or 'all'}):")
-    print("-" * 60)
-    for ref_addr, name, our_addr, score in found:
-        diff = ref_addr - our_addr
-        print(f"  0x{ref_addr:04X}: {name:12} (our: 0x{our_addr:04X}, diff={diff:+5d})")
+        return
+
+    proposed = propose_order(found)
+    print("Proposed link order (by median reference address):")
+    print("  " + " -> ".join(proposed))
+    print(f"  {order_violations(found, proposed)} symbols out of order")
+    print(f"Current link order: {order_violations(found, LINK_ORDER)} symbols out of order")
+    if args.order:
+        order = [m.strip() for m in args.order.split(',') if m.strip()]
+        unknown = [m for m in order if m not in MODULE_SYMBOLS]
+        if unknown:
+            print(f"Unknown modules: {', '.join(unknown)}")
+        print(f"Given order: {order_violations(found, order)} symbols out of order")
 
 
 if __name__ == '__main__':
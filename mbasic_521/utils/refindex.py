@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+refindex.py - Precomputed match index over a reference image
+
+For every byte value the index holds a "match plane": the reference image
+translated to 1 where it holds that value and 0 elsewhere, stored as one
+big integer.  Scoring a pattern against every position of the reference
+is then one shift-and-add of a plane per pattern byte, done on whole
+images in C, and the best position is a max()/find() over the resulting
+count bytes.  The planes are built once and shared by every query.
+
+Pattern bytes can be marked as wildcards; they count towards the score
+reported but not towards min_match, which only concrete bytes can reach
+(all of them, in a pattern with fewer than min_match).
+Symbol patterns use this for the 16-bit operands of CALL/JMP/LXI etc. so
+that relocated addresses do not lower the score.  A pattern with fewer
+than MIN_CONCRETE concrete bytes other than zero (an address table, or
+a stretch of zero-filled data) matches nowhere, since it would match
+almost anywhere.
+
+Usage:
+    from refindex import RefIndex, symbol_pattern
+    index = RefIndex(ref)
+    pattern, wildcards = symbol_pattern(ours, offset, 12)
+    pos, score = index.best_match(pattern, wildcards)
+"""
+
+import re
+
+from i8080 import decode, OPERAND, OPERAND_WORD
+
+
+# _SELECT[v] translates byte v to 1 and every other byte to 0
+_SELECT = [bytes(1 if i == v else 0 for i in range(256)) for v in range(256)]
+
+_HIT_RE = re.compile(b'\x01')
+
+# Fewest non-wildcard, non-zero bytes a pattern needs to be searched for
+MIN_CONCRETE = 4
+
+
+def operand_wildcards(pattern):
+    """Return a bytes mask, 1 at the 16-bit operand bytes of pattern.
+
+    pattern is decoded as code from its first byte, so it should start
+    on an instruction boundary (a label).
+    """
+    mask = bytearray(len(pattern))
+    stream = decode(pattern)
+    for i, op in enumerate(stream.opcode):
+        if OPERAND[op] == OPERAND_WORD:
+            off = stream.offset[i]
+            for j in range(off + 1, off + stream.length[i]):
+                mask[j] = 1
+    return bytes(mask)
+
+
+def symbol_pattern(image, offset, length, mask=True):
+    """Return (pattern, wildcards) for length bytes of image at offset.
+
+    Returns (None, None) when the pattern would start before the image
+    or run past its end.  wildcards is None when mask is false.
+    """
+    if offset < 0 or offset + length > len(image):
+        return None, None
+    pattern = image[offset:offset + length]
+    return pattern, operand_wildcards(pattern) if mask else None
+
+
+def concrete_bytes(pattern, wildcards=None):
+    """Count the pattern bytes that are neither wildcards nor zero."""
+    return sum(1 for i, b in enumerate(pattern) if b and not (wildcards and wildcards[i]))
+
+
+class RefIndex:
+    """Match planes over one reference image, built on first use per byte."""
+
+    def __init__(self, data):
+        self.data = bytes(data)
+        self._planes = [None] * 256
+
+    def plane(self, value):
+        """Return the match plane for a byte value as a little-endian int."""
+        p = self._planes[value]
+        if p is None:
+            p = int.from_bytes(self.data.translate(_SELECT[value]), 'little')
+            self._planes[value] = p
+        return p
+
+    def scores(self, pattern, wildcards=None):
+        """Return bytes with the match count of pattern at each position.
+
+        Only positions where the whole pattern fits are included.
+        Wildcard positions are not counted; add their number for a score.
+        """
+        n = len(self.data) - len(pattern) + 1
+        if n <= 0 or len(pattern) > 255:
+            return b''
+        total = 0
+        for i, b in enumerate(pattern):
+            if wildcards and wildcards[i]:
+                continue
+            total += self.plane(b) >> (8 * i)
+        return total.to_bytes(len(self.data), 'little')[:n]
+
+    @staticmethod
+    def _need(pattern, wildcards, min_match):
+        """Concrete bytes that must match: min_match, or all there are."""
+        return min(min_match, len(pattern) - (sum(wildcards) if wildcards else 0))
+
+    def best_match(self, pattern, wildcards=None, min_match=0, near=None):
+        """Find the best-scoring position of pattern in the reference.
+
+        Returns (position, score), with position None when fewer than
+        min_match concrete bytes match (or not all of them, if there are
+        fewer) or the pattern has too few concrete bytes.  Ties go to the
+        position nearest near, or without it to the lowest position.
+        """
+        if concrete_bytes(pattern, wildcards) < MIN_CONCRETE:
+            return None, 0
+        counts = self.scores(pattern, wildcards)
+        if not counts:
+            return None, 0
+        best = max(counts)
+        score = best + (sum(wildcards) if wildcards else 0)
+        if best < self._need(pattern, wildcards, min_match):
+            return None, score
+        if near is None:
+            return counts.find(bytes((best,))), score
+        ties = [m.start() for m in re.finditer(re.escape(bytes((best,))), counts)]
+        return min(ties, key=lambda pos: abs(pos - near)), score
+
+    def matches(self, pattern, wildcards=None, min_match=0):
+        """Return [(position, score)] for every position where min_match or
+        more concrete bytes match."""
+        if concrete_bytes(pattern, wildcards) < MIN_CONCRETE:
+            return []
+        counts = self.scores(pattern, wildcards)
+        extra = sum(wildcards) if wildcards else 0
+        need = self._need(pattern, wildcards, min_match)
+        hits = counts.translate(bytes(1 if c >= need else 0 for c in range(256)))
+        return [(m.start(), counts[m.start()] + extra) for m in _HIT_RE.finditer(hits)]
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+symtab.py - Symbol table lookups for a linked build
+
+Loads a LINK-80 style .sym file into parallel sorted arrays so any address
+can be attributed to its enclosing label with a bisect, and maps labels to
+the source module that defines them by scanning the .mac files.
+
+Usage:
+    python3 symtab.py <sym_file> <hex_addr>... [--src DIR]
+
+    from symtab import load_symbols
+    syms = load_symbols('out/mbasic_go.sym', src_dir='mbasic_src')
+    name, base, module = syms.lookup(0x0CC9)
+"""
+
+import os
+import re
+import argparse
+from array import array
+from bisect import bisect_right
+
+
+# Names the linker truncates to; the .sym file holds the first six characters
+SYM_LEN = 6
+
+LABEL_RE = re.compile(r'^([A-Za-z.$?@_][A-Za-z0-9.$?@_]*)::?')
+PUBLIC_RE = re.compile(r'^\s*(?:[A-Za-z.$?@_][A-Za-z0-9.$?@_]*:+)?\s*public\s+([^;]*)', re.I)
+
+
+def _is_hex(s):
+    return 0 < len(s) <= 4 and all(c in '0123456789ABCDEFabcdef' for c in s)
+
+
+def parse_sym_file(path):
+    """Return a list of (address, name) pairs from a .sym file.
+
+    Accepts both 'ADDR NAME' (ul80) and 'NAME ADDR' lines.
+    """
+    pairs = []
+    with open(path, 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) != 2:
+                continue
+            if _is_hex(parts[0]):
+                pairs.append((int(parts[0], 16), parts[1]))
+            elif _is_hex(parts[1]):
+                pairs.append((int(parts[1], 16), parts[0]))
+    return pairs
+
+
+def scan_modules(src_dir):
+    """Map truncated upper-case label names to the module defining them."""
+    modules = {}
+    for fname in sorted(os.listdir(src_dir)):
+        if not fname.lower().endswith('.mac'):
+            continue
+        module = os.path.splitext(fname)[0].lower()
+        with open(os.path.join(src_dir, fname), 'r', errors='ignore') as f:
+            for line in f:
+                m = PUBLIC_RE.match(line)
+                if m:
+                    for name in m.group(1).split(','):
+                        name = name.strip()
+                        if name:
+                            modules.setdefault(name.upper()[:SYM_LEN], module)
+                    continue
+                m = LABEL_RE.match(line)
+                if m:
+                    modules.setdefault(m.group(1).upper()[:SYM_LEN], module)
+    return modules
+
+
+class SymbolTable:
+    """Sorted address array with parallel name and module lists."""
+
+    def __init__(self, pairs, modules=None):
+        pairs = sorted((addr, name) for addr, name in pairs
+                       if not name.startswith('__'))
+        self.addrs = array('I', (addr for addr, _ in pairs))
+        self.names = [name for _, name in pairs]
+        self.by_name = {name: addr for addr, name in pairs}
+        self.modules = [None] * len(pairs)
+        if modules:
+            # Labels whose module is unknown inherit the previous one, since
+            # each module is linked as one contiguous block
+            current = None
+            for i, name in enumerate(self.names):
+                current = modules.get(name.upper()[:SYM_LEN], current)
+                self.modules[i] = current
+
+    def __len__(self):
+        return len(self.addrs)
+
+    def lookup(self, addr):
+        """Return (name, label address, module) enclosing addr, or None."""
+        i = bisect_right(self.addrs, addr) - 1
+        if i < 0:
+            return None
+        return self.names[i], self.addrs[i], self.modules[i]
+
+    def describe(self, addr):
+        """Return 'LABEL+off' text for addr."""
+        hit = self.lookup(addr)
+        if hit is None:
+            return f"{addr:04X}"
+        name, base, _ = hit
+        return name if addr == base else f"{name}+{addr - base}"
+
+    def module_of(self, addr):
+        hit = self.lookup(addr)
+        return hit[2] if hit else None
+
+
+def load_symbols(path, src_dir=None, min_addr=0x100):
+    """Load a .sym file, dropping constants below min_addr."""
+    pairs = [(a, n) for a, n in parse_sym_file(path) if a >= min_addr]
+    modules = scan_modules(src_dir) if src_dir else None
+    return SymbolTable(pairs, modules)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Look up addresses in a symbol file')
+    parser.add_argument('sym', help='Symbol file (.sym)')
+    parser.add_argument('addrs', nargs='+', help='Addresses to look up (hex)')
+    parser.add_argument('--src', help='Source directory for module names')
+    args = parser.parse_args()
+
+    syms = load_symbols(args.sym, args.src)
+    for text in args.addrs:
+        addr = int(text, 16)
+        module = syms.module_of(addr) or '?'
+        print(f"0x{addr:04X}  {syms.describe(addr):20}  {module}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+test_align.py - Tests for the relocation-aware alignment in align.py
+
+The main case rebuilds 5.21 from mbasic_src with one NOP added at
+FMULT5 in f4.mac: everything after it moves up a byte, including the
+targets of the dispatch tables in bintrp, and the alignment must show
+that single insertion and nothing else that drifts.
+
+Usage:
+    python3 -m unittest test_align       (from mbasic_521/utils)
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import importlib.util
+import subprocess
+
+from align import align_images
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+# Link order, as in build.py
+MODULES = ['bintrp', 'f4', 'biptrg', 'biedit', 'biprtu', 'bio', 'bimisc',
+           'bistrs', 'binlin', 'fiveo', 'dskcom', 'dcpm', 'fivdsk', 'init']
+
+
+def build_521(tmp, edit=None):
+    """Build 5.21 from a copy of mbasic_src in tmp; returns the image.
+
+    edit(module, text) may return changed source for a module.  The
+    symbol table is left in tmp/mbasic.sym.
+    """
+    src = os.path.join(tmp, 'mbasic_src')
+    shutil.copytree(os.path.join(ROOT, 'mbasic_src'), src)
+    rels = []
+    for module in MODULES:
+        path = os.path.join(src, f'{module}.mac')
+        if edit:
+            with open(path, encoding='latin-1') as f:
+                text = f.read()
+            changed = edit(module, text)
+            if changed is not None:
+                with open(path, 'w', encoding='latin-1') as f:
+                    f.write(changed)
+        rel = os.path.join(tmp, f'{module}.rel')
+        subprocess.run([sys.executable, '-m', 'um80.um80', path, '-o', rel],
+                       check=True, stdout=subprocess.DEVNULL)
+        rels.append(rel)
+    out = os.path.join(tmp, 'mbasic.com')
+    subprocess.run([sys.executable, '-m', 'um80.ul80', '-o', out, '-s'] + rels,
+                   check=True, stdout=subprocess.DEVNULL)
+    with open(out, 'rb') as f:
+        return f.read()
+
+
+def add_nop(module, text):
+    """Put a NOP before the first instruction of fmult5."""
+    if module != 'f4':
+        return None
+    assert text.count('\nfmult5:\t') == 1
+    return text.replace('\nfmult5:\t', '\nfmult5:\tnop\n\t')
+
+
+class AlignTest(unittest.TestCase):
+
+    def test_change_is_not_an_insertion_and_deletion(self):
+        ref = bytes(range(0x40, 0x80)) * 4          # one-byte instructions
+        our = bytearray(ref)
+        our[100:104] = b'\x7f\x7e\x7d\x7c'
+        edits = align_images(ref, bytes(our)).edits()
+        self.assertEqual(edits, [('replace', 100, 104, 100, 104)])
+
+    def test_address_table_follows_its_targets(self):
+        # JMP 0110h, then a table of three addresses into code at 0110h on
+        code = bytes(range(0x40, 0x80)) * 2
+        table = [0x110, 0x118, 0x140]
+
+        def image(nop):
+            body = code[:0x20] + (b'\x00' if nop else b'') + code[0x20:]
+            words = b''.join(((t + (nop and t >= 0x130)) & 0xFFFF).to_bytes(2, 'little')
+                             for t in table)
+            return b'\xc3' + (0x110).to_bytes(2, 'little') + words + b'\x76' * 7 + body
+
+        ref, our = image(False), image(True)
+        edits = align_images(ref, our).edits()
+        self.assertEqual(edits, [('insert', 0x30, 0x30, 0x30, 0x31)])
+
+    @unittest.skipUnless(importlib.util.find_spec('um80'), 'um80 is not installed')
+    def test_single_nop_in_fmult5(self):
+        with open(os.path.join(ROOT, 'com', 'mbasic.com'), 'rb') as f:
+            ref = f.read()
+        with tempfile.TemporaryDirectory(prefix='align_') as tmp:
+            our = build_521(tmp, add_nop)
+            with open(os.path.join(tmp, 'mbasic.sym')) as f:
+                syms = f.read()
+        drifts = [op for op in align_images(ref, our).edits() if op[2] - op[1] != op[4] - op[3]]
+        fmult = int(next(line.split()[0] for line in syms.splitlines()
+                         if line.split()[1:2] == ['FMULT']), 16)
+        # The NOP, and the end of the image padded out to a whole record
+        self.assertEqual(drifts[0][0], 'insert')
+        self.assertEqual(drifts[0][3] + 0x100, fmult + 58)
+        self.assertEqual(drifts[0][4] - drifts[0][3], 1)
+        self.assertEqual(len(drifts), 2)
+        self.assertEqual(drifts[1][2], len(ref))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+test_cache.py - Tests for the cache keys in cache.py
+
+A cached result must be dropped when any code it depends on changes:
+the function's own module, a utils module it imports, or the external
+tool behind an exec entry.
+
+Usage:
+    python3 -m unittest test_cache       (from mbasic_521/utils)
+"""
+
+import os
+import sys
+import tempfile
+import importlib
+import unittest
+from unittest import mock
+
+import cache
+from cache import Cache, memoize, run_cached
+
+
+class CacheKeyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory(prefix='cache_')
+        self.dir = self.tmp.name
+        self.cache = Cache(os.path.join(self.dir, '.cache'))
+        self.cache.enabled = True
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(cache._sources.clear)
+
+    def write(self, name, text):
+        with open(os.path.join(self.dir, name), 'w') as f:
+            f.write(text)
+        cache._sources.clear()
+
+    def test_editing_an_imported_module_invalidates(self):
+        # Stand-in utils modules: user.py calls into helper.py
+        self.write('helper.py', 'def scale(x):\n    return x * 2\n')
+        self.write('user.py', 'from helper import scale\n\ndef work(x):\n    return scale(x)\n')
+        sys.path.insert(0, self.dir)
+        self.addCleanup(sys.path.remove, self.dir)
+        self.addCleanup(sys.modules.pop, 'helper', None)
+        self.addCleanup(sys.modules.pop, 'user', None)
+        old_here, cache.HERE = cache.HERE, os.path.realpath(self.dir)
+        self.addCleanup(setattr, cache, 'HERE', old_here)
+        import user
+
+        self.assertEqual(memoize('work', user.work, 5, cache=self.cache), 10)
+        self.write('user.py', 'from helper import scale\n\ndef work(x):\n    return scale(x) + 0\n')
+        importlib.reload(user)
+        self.assertEqual(len(self.cache.entries()), 1)
+        memoize('work', user.work, 5, cache=self.cache)
+        self.assertEqual(len(self.cache.entries()), 2)
+
+        self.write('helper.py', 'def scale(x):\n    return x * 3\n')
+        importlib.reload(sys.modules['helper'])
+        importlib.reload(user)
+        self.assertEqual(memoize('work', user.work, 5, cache=self.cache), 15)
+
+    def test_changing_the_tool_invalidates_exec(self):
+        # A python -m tool that counts its runs in a side file
+        package = os.path.join(self.dir, 'tool')
+        os.mkdir(package)
+        self.write('tool/__init__.py', 'VERSION = 1\n')
+        main = ('import sys, tool\n'
+                'with open(sys.argv[1], "a") as f:\n'
+                '    f.write("run")\n'
+                'with open(sys.argv[2], "w") as f:\n'
+                '    f.write(str(tool.VERSION))\n')
+        self.write('tool/__main__.py', main)
+        sys.path.insert(0, self.dir)
+        self.addCleanup(sys.path.remove, self.dir)
+        env = mock.patch.dict(os.environ, PYTHONPATH=self.dir + os.pathsep + os.environ.get('PYTHONPATH', ''))
+        env.start()
+        self.addCleanup(env.stop)
+
+        runs = os.path.join(self.dir, 'runs')
+        out = os.path.join(self.dir, 'out')
+        cmd = [sys.executable, '-m', 'tool', runs, out]
+
+        def run():
+            with open(os.devnull, 'w') as null, mock.patch.object(sys, 'stdout', null):
+                self.assertEqual(run_cached(cmd, [], [out], cache=self.cache), 0)
+            with open(runs) as f, open(out) as g:
+                return f.read().count('run'), g.read()
+
+        self.assertEqual(run(), (1, '1'))
+        self.assertEqual(run(), (1, '1'))
+        self.write('tool/__init__.py', 'VERSION = 2\n')
+        self.assertEqual(run(), (2, '2'))
+
+
+if __name__ == '__main__':
+    unittest.main()
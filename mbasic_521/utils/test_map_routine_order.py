@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+test_map_routine_order.py - Tests for the link order scoring
+
+A build mapped against the reference it matches byte for byte must put
+every symbol at its own address and find no symbol out of order.
+
+Usage:
+    python3 -m unittest test_map_routine_order       (from mbasic_521/utils)
+"""
+
+import os
+import tempfile
+import unittest
+import importlib.util
+
+from map_routine_order import LINK_ORDER, MODULE_SYMBOLS, locate_modules, order_violations
+from symtab import parse_sym_file
+from test_align import ROOT, build_521
+
+
+class OrderTest(unittest.TestCase):
+
+    def test_one_symbol_out_of_place_counts_once(self):
+        found = {'a': [(0x100, 'A1', 0, 0), (0x300, 'A2', 0, 0)],
+                 'b': [(0x200, 'B1', 0, 0), (0x400, 'B2', 0, 0), (0x500, 'B3', 0, 0)]}
+        self.assertEqual(order_violations(found, ['a', 'b']), 1)
+        self.assertEqual(order_violations(found, ['b', 'a']), 2)
+
+    @unittest.skipUnless(importlib.util.find_spec('um80'), 'um80 is not installed')
+    def test_build_against_itself(self):
+        with open(os.path.join(ROOT, 'com', 'mbasic.com'), 'rb') as f:
+            ref = f.read()
+        with tempfile.TemporaryDirectory(prefix='order_') as tmp:
+            ours = build_521(tmp)
+            syms = {name: addr for addr, name in parse_sym_file(os.path.join(tmp, 'mbasic.sym'))}
+        self.assertEqual(ours, ref)
+        found = locate_modules(ours, ref, syms, list(MODULE_SYMBOLS), 10)
+        for hits in found.values():
+            for ref_addr, name, our_addr, _ in hits:
+                self.assertEqual(ref_addr, our_addr, name)
+        self.assertEqual(order_violations(found, LINK_ORDER), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
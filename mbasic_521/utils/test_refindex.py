@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+test_refindex.py - Tests for the match planes and min_match in refindex.py
+
+Usage:
+    python3 -m unittest test_refindex       (from mbasic_521/utils)
+"""
+
+import random
+import unittest
+
+from refindex import RefIndex, MIN_CONCRETE, operand_wildcards, symbol_pattern
+
+
+def brute_counts(data, pattern, wildcards=None):
+    """Concrete bytes of pattern matching at each position, the slow way."""
+    return [sum(1 for i, b in enumerate(pattern)
+                if not (wildcards and wildcards[i]) and data[pos + i] == b)
+            for pos in range(len(data) - len(pattern) + 1)]
+
+
+class PlaneTest(unittest.TestCase):
+
+    def test_plane_marks_each_occurrence(self):
+        index = RefIndex(b'ABAC')
+        self.assertEqual(index.plane(ord('A')).to_bytes(4, 'little'), b'\x01\x00\x01\x00')
+        self.assertEqual(index.plane(ord('Z')), 0)
+
+    def test_scores_equal_a_direct_count(self):
+        rng = random.Random(5)
+        data = bytes(rng.choice(b'\x00\x01\x02\x03') for _ in range(600))
+        index = RefIndex(data)
+        for _ in range(20):
+            start = rng.randrange(len(data) - 16)
+            pattern = bytearray(data[start:start + 16])
+            pattern[rng.randrange(16)] ^= 1
+            wildcards = bytes(rng.random() < 0.25 for _ in range(16))
+            self.assertEqual(list(index.scores(bytes(pattern))), brute_counts(data, pattern))
+            self.assertEqual(list(index.scores(bytes(pattern), wildcards)),
+                             brute_counts(data, pattern, wildcards))
+
+    def test_operand_bytes_are_wildcards(self):
+        # CALL 1234h; MOV A,B; LXI H,5678h; MVI A,9
+        code = bytes.fromhex('cd3412 78 217856 3e09')
+        self.assertEqual(operand_wildcards(code), bytes([0, 1, 1, 0, 0, 1, 1, 0, 0]))
+        self.assertEqual(symbol_pattern(code, 0, 4), (code[:4], bytes([0, 1, 1, 0])))
+        self.assertEqual(symbol_pattern(code, 6, 4), (None, None))
+
+
+class MinMatchTest(unittest.TestCase):
+
+    REF = bytes(range(0x40, 0x80)) + bytes.fromhex('cd0020 78 79 7a 7b c9') + bytes(range(0x40))
+
+    def test_wildcards_do_not_count_towards_min_match(self):
+        index = RefIndex(self.REF)
+        # The same code calling a relocated address
+        pattern = bytes.fromhex('cd0030 78 79 7a 7b c9')
+        wildcards = operand_wildcards(pattern)
+        self.assertEqual(index.best_match(pattern, min_match=len(pattern)), (None, 7))
+        self.assertEqual(index.best_match(pattern, wildcards, min_match=len(pattern)), (0x40, 8))
+        self.assertEqual(index.best_match(pattern, wildcards, min_match=6), (0x40, 8))
+        self.assertEqual(index.best_match(pattern, wildcards, min_match=7), (0x40, 8))
+        self.assertEqual(index.matches(pattern, wildcards, min_match=8), [(0x40, 8)])
+
+    def test_a_short_concrete_pattern_must_match_fully(self):
+        index = RefIndex(self.REF)
+        pattern = bytes.fromhex('cd0030 78 79 7a 7b 00')
+        wildcards = operand_wildcards(pattern)
+        self.assertEqual(index.best_match(pattern, wildcards, min_match=8), (None, 7))
+        self.assertEqual(index.matches(pattern, wildcards, min_match=8), [])
+
+    def test_too_few_concrete_bytes_match_nowhere(self):
+        index = RefIndex(bytes(64) + b'\x01\x02\x03' + bytes(64))
+        pattern = bytes(10) + b'\x01\x02\x03'
+        self.assertLess(3, MIN_CONCRETE)
+        self.assertEqual(index.best_match(pattern), (None, 0))
+        self.assertEqual(index.matches(pattern), [])
+
+    def test_ties_go_to_the_nearest_position(self):
+        block = bytes.fromhex('11223344556677')
+        index = RefIndex(block + bytes(20) + block + bytes(20) + block)
+        self.assertEqual(index.best_match(block), (0, 7))
+        self.assertEqual(index.best_match(block, near=30), (27, 7))
+        self.assertEqual(index.best_match(block, near=100), (54, 7))
+
+
+if __name__ == '__main__':
+    unittest.main()
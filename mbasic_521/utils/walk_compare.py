@@ -1,56 +1,65 @@
 #!/usr/bin/env python3
-"""Walk both binaries, report first opcode/immediate difference."""
-
-INST_LEN = {
-    0x00: 1, 0x01: 3, 0x02: 1, 0x03: 1, 0x04: 1, 0x05: 1, 0x06: 2, 0x07: 1,
-    0x09: 1, 0x0A: 1, 0x0B: 1, 0x0C: 1, 0x0D: 1, 0x0E: 2, 0x0F: 1,
-    0x11: 3, 0x12: 1, 0x13: 1, 0x14: 1, 0x15: 1, 0x16: 2, 0x17: 1,
-    0x19: 1, 0x1A: 1, 0x1B: 1, 0x1C: 1, 0x1D: 1, 0x1E: 2, 0x1F: 1,
-    0x21: 3, 0x22: 3, 0x23: 1, 0x24: 1, 0x25: 1, 0x26: 2, 0x27: 1,
-    0x29: 1, 0x2A: 3, 0x2B: 1, 0x2C: 1, 0x2D: 1, 0x2E: 2, 0x2F: 1,
-    0x31: 3, 0x32: 3, 0x33: 1, 0x34: 1, 0x35: 1, 0x36: 2, 0x37: 1,
-    0x39: 1, 0x3A: 3, 0x3B: 1, 0x3C: 1, 0x3D: 1, 0x3E: 2, 0x3F: 1,
-    **{i: 1 for i in range(0x40, 0x80)},
-    **{i: 1 for i in range(0x80, 0xC0)},
-    0xC0: 1, 0xC1: 1, 0xC2: 3, 0xC3: 3, 0xC4: 3, 0xC5: 1, 0xC6: 2, 0xC7: 1,
-    0xC8: 1, 0xC9: 1, 0xCA: 3, 0xCB: 3, 0xCC: 3, 0xCD: 3, 0xCE: 2, 0xCF: 1,
-    0xD0: 1, 0xD1: 1, 0xD2: 3, 0xD3: 2, 0xD4: 3, 0xD5: 1, 0xD6: 2, 0xD7: 1,
-    0xD8: 1, 0xD9: 1, 0xDA: 3, 0xDB: 2, 0xDC: 3, 0xDD: 3, 0xDE: 2, 0xDF: 1,
-    0xE0: 1, 0xE1: 1, 0xE2: 3, 0xE3: 1, 0xE4: 3, 0xE5: 1, 0xE6: 2, 0xE7: 1,
-    0xE8: 1, 0xE9: 1, 0xEA: 3, 0xEB: 1, 0xEC: 3, 0xED: 3, 0xEE: 2, 0xEF: 1,
-    0xF0: 1, 0xF1: 1, 0xF2: 3, 0xF3: 1, 0xF4: 3, 0xF5: 1, 0xF6: 2, 0xF7: 1,
-    0xF8: 1, 0xF9: 1, 0xFA: 3, 0xFB: 1, 0xFC: 3, 0xFD: 3, 0xFE: 2, 0xFF: 1,
-}
-
-ref = open('/home/wohl/mbasic2025/com/mbasic.com', 'rb').read()
-our = open('/home/wohl/mbasic2025/out/mbasic_go.com', 'rb').read()
+"""Walk both binaries, report first opcode/immediate difference.
+
+With --full every difference in the image is classified in one pass
+(see codediff.py), optionally written as JSON with --json FILE and
+grouped per routine with --sym FILE [--src DIR].
+"""
+
+import sys
+import argparse
+
+from cache import cached_decode
+from i8080 import OPERAND, OPERAND_BYTE
+from codediff import CODE_START, compare_full, attribute, print_report, write_json
+from symtab import load_symbols
+
+parser = argparse.ArgumentParser(description='Walk both binaries comparing opcodes and immediates')
+parser.add_argument('ref_com', nargs='?', default='/home/wohl/mbasic2025/com/mbasic.com')
+parser.add_argument('our_com', nargs='?', default='/home/wohl/mbasic2025/out/mbasic_go.com')
+parser.add_argument('--full', action='store_true', help='Classify every difference, not just the first')
+parser.add_argument('--json', help='With --full, write the report as JSON to this file')
+parser.add_argument('--sym', help='With --full, our symbol table to group differences per routine')
+parser.add_argument('--src', help='With --sym, source directory for module names')
+args = parser.parse_args()
+
+ref = open(args.ref_com, 'rb').read()
+our = open(args.our_com, 'rb').read()
 
 # Start from FNDFOR (0x0C50 memory = 0x0B50 file) where real code begins
 # The beginning of the file is JMP + data tables + error messages
-START = 0x0B50
-rp = START
-op = START
-inst_num = 0
+START = CODE_START
 
-while rp < len(ref) and op < len(our):
-    r_op = ref[rp]
+if args.full:
+    report = compare_full(ref, our, START)
+    if args.sym:
+        attribute(report, load_symbols(args.sym, args.src))
+    print_report(report)
+    if args.json:
+        write_json(report, args.json)
+    sys.exit(1 if report['mismatches'] else 0)
+
+# Both builds are walked on the reference instruction stream, so ours is
+# compared at the same offsets
+stream = cached_decode(ref, START, min(len(ref), len(our)))
+
+for inst_num in range(len(stream)):
+    rp = op = stream.offset[inst_num]
+    r_op = stream.opcode[inst_num]
     o_op = our[op]
 
     if r_op != o_op:
         print(f"OPCODE diff at inst#{inst_num}: ref 0x{rp+0x100:04X}={r_op:02X}, our 0x{op+0x100:04X}={o_op:02X}")
         break
 
-    r_len = INST_LEN.get(r_op, 1)
-
     # Check immediate operand for 2-byte instructions
-    if r_len == 2 and rp + 1 < len(ref) and op + 1 < len(our):
+    if OPERAND[r_op] == OPERAND_BYTE and stream.length[inst_num] == 2:
         if ref[rp+1] != our[op+1]:
             print(f"IMMEDIATE diff at inst#{inst_num}: ref 0x{rp+0x100:04X} imm={ref[rp+1]:02X}, our 0x{op+0x100:04X} imm={our[op+1]:02X}")
             break
-
-    rp += r_len
-    op += r_len
-    inst_num += 1
+else:
+    inst_num = len(stream)
+    rp = op = stream.end()
 
 print(f"Scanned {inst_num} instructions from 0x{START+0x100:04X}")
 print(f"Ref pos: 0x{rp+0x100:04X}, Our pos: 0x{op+0x100:04X}")
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+z80.py - Table-driven Z80 instruction decoder for the Z80 builds
+
+The Z80 counterpart of i8080.py, for images such as mbasicz.com once the
+convert_jr.py/convert_djnz.py rewrites put Z80-only instructions in them.
+Every opcode of the unprefixed, CB, ED, DD, FD, DD CB and FD CB tables is
+precomputed into a (template, length, operand kind) entry at import time,
+and decode() returns the same InstructionStream as i8080.decode(), with
+opcode holding the prefixes as well (0xCB47, 0xED4B, 0xDD21, 0xDDCB46;
+the displacement of DD CB d xx is not part of it).  Mnemonics are Zilog's;
+undocumented forms end in '*', and a DD or FD before an opcode that does
+not use HL decodes on its own as NOP*.  mask_operands() zeroes 16-bit
+operands only: relative jumps and displacements do not move with the code.
+
+Usage:
+    python3 z80.py <file> [--start HEX] [--count N] [--origin HEX]
+
+    from z80 import decode, mask_operands
+    stream = decode(data, start=0x0B50)
+    masked = mask_operands(data)
+"""
+
+import sys
+import argparse
+from array import array
+
+from i8080 import InstructionStream, OPERAND_NONE, OPERAND_BYTE, OPERAND_WORD
+
+
+OPERAND_REL = 3         # signed jump displacement (JR, DJNZ)
+
+REGS = ['B', 'C', 'D', 'E', 'H', 'L', '(HL)', 'A']
+PAIRS = ['BC', 'DE', 'HL', 'SP']
+CONDS = ['NZ', 'Z', 'NC', 'C', 'PO', 'PE', 'P', 'M']
+ALU_OPS = ['ADD A,', 'ADC A,', 'SUB ', 'SBC A,', 'AND ', 'XOR ', 'OR ', 'CP ']
+ROTATES = ['RLC', 'RRC', 'RL', 'RR', 'SLA', 'SRA', 'SLL*', 'SRL']
+
+# Bytes taken by each operand field of a template
+_FIELDS = (('{d}', 1), ('{n}', 1), ('{e}', 1), ('{nn}', 2))
+
+
+def _entry(text, prefix):
+    """Return (template, length, operand kind) for text after prefix bytes."""
+    length = prefix + 1 + sum(n for field, n in _FIELDS if field in text)
+    if '{nn}' in text:
+        kind = OPERAND_WORD
+    elif '{n}' in text:
+        kind = OPERAND_BYTE
+    elif '{e}' in text:
+        kind = OPERAND_REL
+    else:
+        kind = OPERAND_NONE
+    return text, length, kind
+
+
+def _main(ix=None):
+    """Templates of the unprefixed opcodes, or with ix of the DD/FD
+    opcodes that use HL ({op: (template, length, kind)})."""
+    t = {}
+    hl = ix or 'HL'
+
+    def reg(r, m=False):
+        if r == 6:
+            return f'({ix}+{{d}})' if ix else '(HL)'
+        if ix and not m and r in (4, 5):
+            return ix + 'HL'[r - 4]
+        return REGS[r]
+
+    def add(op, text, uses_hl=False):
+        if ix and not uses_hl:
+            return
+        t[op] = _entry(text, 1 if ix else 0)
+
+    add(0x00, 'NOP')
+    add(0x08, "EX AF,AF'")
+    add(0x10, 'DJNZ {e}')
+    add(0x18, 'JR {e}')
+    for k in range(4):
+        add(0x20 + (k << 3), f'JR {CONDS[k]},{{e}}')
+    for rp in range(4):
+        pair = hl if rp == 2 else PAIRS[rp]
+        add((rp << 4) | 0x01, f'LD {pair},{{nn}}', rp == 2)
+        add((rp << 4) | 0x03, f'INC {pair}', rp == 2)
+        add((rp << 4) | 0x0B, f'DEC {pair}', rp == 2)
+        add((rp << 4) | 0x09, f'ADD {hl},{pair}', True)
+    add(0x02, 'LD (BC),A')
+    add(0x12, 'LD (DE),A')
+    add(0x0A, 'LD A,(BC)')
+    add(0x1A, 'LD A,(DE)')
+    add(0x22, f'LD ({{nn}}),{hl}', True)
+    add(0x2A, f'LD {hl},({{nn}})', True)
+    add(0x32, 'LD ({nn}),A')
+    add(0x3A, 'LD A,({nn})')
+    for r in range(8):
+        uses = r in (4, 5, 6)
+        add((r << 3) | 0x04, f'INC {reg(r)}', uses)
+        add((r << 3) | 0x05, f'DEC {reg(r)}', uses)
+        add((r << 3) | 0x06, f'LD {reg(r)},{{n}}', uses)
+    for op, name in zip(range(0x07, 0x40, 8),
+                        ('RLCA', 'RRCA', 'RLA', 'RRA', 'DAA', 'CPL', 'SCF', 'CCF')):
+        add(op, name)
+
+    for op in range(0x40, 0x80):
+        dst, src = (op >> 3) & 7, op & 7
+        m = 6 in (dst, src)
+        add(op, f'LD {reg(dst, m)},{reg(src, m)}', bool({dst, src} & {4, 5, 6}))
+    add(0x76, 'HALT')
+    for op in range(0x80, 0xC0):
+        add(op, ALU_OPS[(op >> 3) & 7] + reg(op & 7), op & 7 in (4, 5, 6))
+
+    for cc in range(8):
+        base = 0xC0 | (cc << 3)
+        add(base + 0, f'RET {CONDS[cc]}')
+        add(base + 2, f'JP {CONDS[cc]},{{nn}}')
+        add(base + 4, f'CALL {CONDS[cc]},{{nn}}')
+        add(base + 6, ALU_OPS[cc] + '{n}')
+        add(base + 7, f'RST {cc << 3:02X}h')
+    for rp, name in enumerate(('BC', 'DE', hl, 'AF')):
+        add(0xC1 + (rp << 4), f'POP {name}', rp == 2)
+        add(0xC5 + (rp << 4), f'PUSH {name}', rp == 2)
+    add(0xC3, 'JP {nn}')
+    add(0xC9, 'RET')
+    add(0xCD, 'CALL {nn}')
+    add(0xD3, 'OUT ({n}),A')
+    add(0xDB, 'IN A,({n})')
+    add(0xD9, 'EXX')
+    add(0xE3, f'EX (SP),{hl}', True)
+    add(0xE9, f'JP ({hl})', True)
+    add(0xEB, 'EX DE,HL')
+    add(0xF3, 'DI')
+    add(0xFB, 'EI')
+    add(0xF9, f'LD SP,{hl}', True)
+    return t
+
+
+def _cb(ix=None):
+    """Templates of CB xx, or with ix of DD CB d xx / FD CB d xx."""
+    t = {}
+    for op in range(256):
+        kind, bit, r = op >> 6, (op >> 3) & 7, op & 7
+        target = f'({ix}+{{d}})' if ix else REGS[r]
+        # The indexed forms other than BIT also copy the result to r
+        copy = f',{REGS[r]}' if ix and r != 6 and kind != 1 else ''
+        star = '*' if copy or (ix and kind == 1 and r != 6) else ''
+        if kind == 0:
+            name = ROTATES[bit].rstrip('*')
+            star = star or ('*' if bit == 6 else '')
+            text = f'{name}{star} {target}{copy}'
+        else:
+            name = ('BIT', 'RES', 'SET')[kind - 1]
+            text = f'{name}{star} {bit},{target}{copy}'
+        t[op] = (text, 4, OPERAND_NONE) if ix else _entry(text, 1)
+    return t
+
+
+def _ed():
+    """Templates of ED xx; the undefined ones are two-byte NOP*."""
+    t = {op: _entry('NOP*', 1) for op in range(256)}
+    for r in range(8):
+        reg = REGS[r]
+        t[0x40 | (r << 3)] = _entry('IN (C)*' if r == 6 else f'IN {reg},(C)', 1)
+        t[0x41 | (r << 3)] = _entry('OUT (C),0*' if r == 6 else f'OUT (C),{reg}', 1)
+    for rp in range(4):
+        pair = PAIRS[rp]
+        t[0x42 | (rp << 4)] = _entry(f'SBC HL,{pair}', 1)
+        t[0x4A | (rp << 4)] = _entry(f'ADC HL,{pair}', 1)
+        star = '*' if rp == 2 else ''           # ED 63/6B duplicate 22/2A
+        t[0x43 | (rp << 4)] = _entry(f'LD{star} ({{nn}}),{pair}', 1)
+        t[0x4B | (rp << 4)] = _entry(f'LD{star} {pair},({{nn}})', 1)
+    for op in range(0x44, 0x80, 8):
+        star = '' if op == 0x44 else '*'
+        t[op] = _entry('NEG' + star, 1)
+        t[op + 1] = _entry('RETN' + ('' if op == 0x44 else '*'), 1)
+    t[0x4D] = _entry('RETI', 1)
+    for op, mode in ((0x46, '0'), (0x4E, '0*'), (0x56, '1'), (0x5E, '2'),
+                     (0x66, '0*'), (0x6E, '0*'), (0x76, '1*'), (0x7E, '2*')):
+        t[op] = _entry(f'IM {mode}', 1)
+    for op, text in ((0x47, 'LD I,A'), (0x4F, 'LD R,A'), (0x57, 'LD A,I'), (0x5F, 'LD A,R'),
+                     (0x67, 'RRD'), (0x6F, 'RLD')):
+        t[op] = _entry(text, 1)
+    for row, names in ((0xA0, ('LDI', 'CPI', 'INI', 'OUTI')), (0xA8, ('LDD', 'CPD', 'IND', 'OUTD')),
+                       (0xB0, ('LDIR', 'CPIR', 'INIR', 'OTIR')),
+                       (0xB8, ('LDDR', 'CPDR', 'INDR', 'OTDR'))):
+        for k, name in enumerate(names):
+            t[row + k] = _entry(name, 1)
+    return t
+
+
+def _index(ix):
+    """DD or FD table: HL instructions on ix, any other opcode a NOP* prefix."""
+    t = {op: ('NOP*', 1, OPERAND_NONE) for op in range(256)}
+    t.update(_main(ix))
+    del t[0xCB]                     # DD CB d xx
+    return t
+
+
+def _build_tables():
+    """Return {prefix: 256 entries} for the unprefixed table (prefix 0)
+    and for 0xCB, 0xED, 0xDD, 0xFD, 0xDDCB and 0xFDCB."""
+    tables = {0: _main(), 0xCB: _cb(), 0xED: _ed(), 0xDD: _index('IX'), 0xFD: _index('IY'),
+              0xDDCB: _cb('IX'), 0xFDCB: _cb('IY')}
+    return {prefix: tuple(t.get(op) for op in range(256)) for prefix, t in tables.items()}
+
+
+# TABLES[prefix][op] is (template, length, operand kind); the prefix bytes
+# themselves have no entry in the table they lead out of
+TABLES = _build_tables()
+
+
+def lookup(data, pos):
+    """Return (opcode key, entry) of the instruction at data[pos].
+
+    Returns None for the entry when the prefixes run past the data.
+    """
+    key = 0
+    table = TABLES[0]
+    op_pos = pos
+    while op_pos < len(data):
+        op = data[op_pos]
+        if table[op] is not None:
+            return (key << 8) | op, table[op]
+        key = (key << 8) | op
+        table = TABLES[key]
+        # In DD CB d xx the displacement comes before the opcode
+        op_pos += 2 if key in (0xDDCB, 0xFDCB) else 1
+    return key, None
+
+
+def _fields(data, off, key, entry):
+    """Return {field: value} of the operands of the instruction at off."""
+    text = entry[0]
+    if key > 0xFFFF:                # DD CB d xx
+        d = data[off + 2]
+        return {'d': d - ((d & 0x80) << 1)}
+    pos = off + (2 if key > 0xFF else 1)
+    values = {}
+    present = [(text.index(field), field, n) for field, n in _FIELDS if field in text]
+    for _, field, n in sorted(present):
+        if n == 1:
+            v = data[pos]
+            values[field[1:-1]] = v - ((v & 0x80) << 1) if field in ('{d}', '{e}') else v
+        else:
+            values[field[1:-1]] = data[pos] | (data[pos + 1] << 8)
+        pos += n
+    return values
+
+
+class Z80Stream(InstructionStream):
+    """An InstructionStream whose opcodes carry their prefixes."""
+
+    __slots__ = ()
+
+    def __init__(self, data, origin=0x100):
+        super().__init__(data, origin)
+        self.opcode = array('I')
+
+    def format(self, i):
+        """Return (address, hex bytes, instruction text) for instruction i."""
+        off = self.offset[i]
+        n = self.length[i]
+        hex_bytes = ' '.join(f'{b:02X}' for b in self.data[off:off + n])
+        return off + self.origin, hex_bytes, format_instruction(self.data, off, self.origin)
+
+
+def format_instruction(data, off, origin=0x100):
+    """Format the instruction at data[off] (loaded at origin) as assembler text."""
+    key, entry = lookup(data, off)
+    if entry is None or off + entry[1] > len(data):
+        return 'DB ' + ','.join(f'{b:02X}h' for b in data[off:off + 4])
+    values = _fields(data, off, key, entry)
+    text = entry[0]
+    if 'e' in values:
+        text = text.replace('{e}', f"{(off + origin + entry[1] + values['e']) & 0xFFFF:04X}h")
+    if 'd' in values:
+        d = values['d']
+        text = text.replace('+{d}', f"{'-' if d < 0 else '+'}{abs(d):02X}h")
+    if 'n' in values:
+        text = text.replace('{n}', f"{values['n']:02X}h")
+    if 'nn' in values:
+        text = text.replace('{nn}', f"{values['nn']:04X}h")
+    return text
+
+
+def decode(data, start=0, end=None, origin=0x100):
+    """Decode data[start:end] into a Z80Stream in one linear pass.
+
+    operand holds the 16-bit or 8-bit immediate, or the jump displacement
+    of JR/DJNZ; it is -1 for none, and for a final instruction cut off by
+    end, which keeps the bytes that are present.
+    """
+    if end is None or end > len(data):
+        end = len(data)
+    stream = Z80Stream(data, origin)
+    offsets, opcodes, lengths, operands = [], [], [], []
+    pos = start
+    while pos < end:
+        key, entry = lookup(data, pos)
+        offsets.append(pos)
+        opcodes.append(key)
+        if entry is None or pos + entry[1] > end:
+            n = end - pos
+            operands.append(-1)
+        else:
+            n = entry[1]
+            values = _fields(data, pos, key, entry)
+            operand = values.get('nn', values.get('n', values.get('e', -1)))
+            operands.append(operand)
+        lengths.append(n)
+        pos += n
+    stream.offset.extend(offsets)
+    stream.opcode.extend(opcodes)
+    stream.length.frombytes(bytes(lengths))
+    stream.operand.extend(operands)
+    return stream
+
+
+def mask_operands(data, start=0, stream=None):
+    """Return a copy of data with every 16-bit operand replaced by 0000."""
+    if stream is None:
+        stream = decode(data, start)
+    masked = bytearray(data)
+    for i in range(len(stream)):
+        _, entry = lookup(data, stream.offset[i])
+        if entry is not None and entry[2] == OPERAND_WORD and stream.length[i] == entry[1]:
+            end = stream.offset[i] + stream.length[i]
+            masked[end - 2] = masked[end - 1] = 0
+    return bytes(masked)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Decode a Z80 image')
+    parser.add_argument('file', help='Binary file to decode')
+    parser.add_argument('--start', type=lambda s: int(s, 16), default=0,
+                        help='File offset to start at, hex (default: 0)')
+    parser.add_argument('--count', type=int, default=0,
+                        help='Number of instructions to list (default: all)')
+    parser.add_argument('--origin', type=lambda s: int(s, 16), default=0x100,
+                        help='Load address of file offset 0, hex (default: 100)')
+    args = parser.parse_args()
+
+    with open(args.file, 'rb') as f:
+        data = f.read()
+
+    stream = decode(data, args.start, origin=args.origin)
+    count = len(stream) if args.count <= 0 else min(args.count, len(stream))
+    for i in range(count):
+        addr, hex_bytes, inst = stream.format(i)
+        print(f"{addr:04X}: {hex_bytes:12s}  {inst}")
+    if count == len(stream):
+        print(f"; {len(stream)} instructions, 0x{args.start:04X}-0x{stream.end():04X}",
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
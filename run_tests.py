@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+run_tests.py - Run the BASIC test corpus on every interpreter in parallel
+
+Each target is booted once under emu80 and saved as a snapshot at its
+first prompt (see bench/run_bench.py for the targets and their start-up
+answers).  The test scripts are then split into shards, one per worker
+process, and every script is run from a copy-on-write restore of the
+snapshot, so no run repeats the interpreter's start-up.
+
+The corpus is the 4K/8K session scripts and programs in 4k8k/tests
+(their start-up answers are dropped, the snapshot already gave them)
+and the bench/*.bas programs on the targets their first line names;
+scripts can also be given on the command line.  A .bas file is typed in
+and RUN.  For every run the console transcript, T-states, instruction
+count and exit state (stop reason, PC, CP/M exit code) are written as
+JSON.  A run that hits the instruction limit or halts makes the exit
+status nonzero, and with --compare so does any transcript that changed
+from an earlier results file.  --jit runs the scripts on compiled basic
+blocks (emu80/jit.py).
+
+Usage:
+    python3 run_tests.py [--targets 4k,8k,5.21,z80] [scripts...] [--prebuilt]
+                         [--image TARGET=FILE] [--jobs N] [--shard K/N]
+                         [--limit N] [--json FILE] [--compare FILE] [--jit]
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+from emu80 import STOP_EXIT, STOP_INPUT                     # noqa: E402
+from emu80.snapshot import restore                          # noqa: E402
+from run_bench import TARGETS, TARGETS_RE, boot, target_images   # noqa: E402
+
+LIMIT = 50_000_000              # instructions per script
+
+# Test scripts and the targets they run on; None reads the REM TARGETS line
+CORPUS = [
+    ('4k8k/tests/test_*.txt', ['4k', '8k']),
+    ('4k8k/tests/*.bas', ['4k', '8k']),
+    ('bench/*.bas', None),
+]
+
+# Start-up answers at the top of a session script: blank, a number alone, Y or N
+ANSWER_RE = re.compile(r'^\s*(\d*|[YN])\s*$', re.I)
+
+
+def script_text(path):
+    """Console input for a test file, without its start-up answers."""
+    with open(path, errors='replace') as f:
+        text = f.read()
+    if path.lower().endswith('.bas'):
+        return text.rstrip('\n') + '\nRUN\n'
+    lines = text.split('\n')
+    while lines and ANSWER_RE.match(lines[0]):
+        lines.pop(0)
+    return '\n'.join(lines)
+
+
+def _targets_of(path, default):
+    if default is not None:
+        return default
+    with open(path, errors='replace') as f:
+        m = TARGETS_RE.match(f.readline())
+    return m.group(1).lower().split() if m else list(TARGETS)
+
+
+def corpus(names, scripts=None):
+    """Return [(target, test path)] for the selected targets."""
+    tests = []
+    if scripts:
+        for path in scripts:
+            tests += [(target, path) for target in names]
+        return tests
+    for pattern, targets in CORPUS:
+        for path in sorted(glob.glob(os.path.join(ROOT, pattern))):
+            tests += [(target, path) for target in _targets_of(path, targets) if target in names]
+    return tests
+
+
+def run_test(target, snapshot, path, limit, jit=False):
+    """Run one script from a snapshot; returns a result dict."""
+    start = time.time()
+    with tempfile.TemporaryDirectory(prefix='test_') as tmp:
+        machine = restore(snapshot, directory=tmp, timed=True, jit=jit)
+        cycles, instructions = machine.cpu.cycles, machine.instructions
+        machine.feed(script_text(path))
+        stop = machine.run(machine.instructions + limit)
+    return {'target': target, 'test': os.path.relpath(path, ROOT), 'stop': stop,
+            'pc': machine.cpu.pc, 'exit_code': getattr(machine, 'exit_code', None),
+            'cycles': machine.cpu.cycles - cycles,
+            'instructions': machine.instructions - instructions,
+            'seconds': round(time.time() - start, 2),
+            'output': machine.output_text()}
+
+
+def run_shard(shard):
+    """Run every (target, snapshot, path, limit, jit) job of one shard."""
+    return [run_test(*job) for job in shard]
+
+
+def compare(results, path):
+    """Mark results whose transcript differs from the results file at path."""
+    with open(path) as f:
+        old = {(r['target'], r['test']): r for r in json.load(f)['results']}
+    changed = []
+    for r in results:
+        before = old.get((r['target'], r['test']))
+        if before is not None and before['output'] != r['output']:
+            r['changed'] = True
+            changed.append(r)
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the BASIC test corpus on the interpreters')
+    parser.add_argument('scripts', nargs='*', help='Scripts to run instead of the corpus')
+    parser.add_argument('--targets', default=','.join(TARGETS),
+                        help=f"Comma-separated targets (default: {','.join(TARGETS)})")
+    parser.add_argument('--prebuilt', action='store_true',
+                        help='Use the reference binaries instead of building from source')
+    parser.add_argument('--image', action='append', default=[], metavar='TARGET=FILE',
+                        help='Test this image for a target (repeatable)')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes (default: number of CPUs)')
+    parser.add_argument('--shard', help='Run only shard K of N (K/N, counting from 1)')
+    parser.add_argument('--limit', type=int, default=LIMIT,
+                        help=f'Instructions per script (default: {LIMIT})')
+    parser.add_argument('--json', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', help='Flag transcripts that differ from this results file')
+    parser.add_argument('--jit', action='store_true', help='Run on compiled basic blocks')
+    args = parser.parse_args()
+
+    names = [t.strip() for t in args.targets.split(',') if t.strip()]
+    unknown = [t for t in names if t not in TARGETS]
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(unknown)}")
+    tests = corpus(names, args.scripts)
+    if args.shard:
+        k, n = (int(x) for x in args.shard.split('/'))
+        if not 1 <= k <= n:
+            parser.error(f"bad shard {args.shard}")
+        tests = tests[k - 1::n]
+    names = [name for name in names if any(target == name for target, _ in tests)]
+
+    start = time.time()
+    with tempfile.TemporaryDirectory(prefix='tests_') as tmp:
+        images = target_images(names, tmp, args.prebuilt,
+                               dict(item.split('=', 1) for item in args.image))
+        snapshots = {}
+        for name, image in images.items():
+            snapshots[name] = os.path.join(tmp, f'{name}.snap')
+            error = boot(name, image, snapshots[name])
+            if error:
+                sys.exit(error)
+        jobs = [(target, snapshots[target], path, args.limit, args.jit)
+                for target, path in tests]
+        workers = max(1, min(args.jobs, len(jobs)))
+        shards = [jobs[i::workers] for i in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = [r for shard in pool.map(run_shard, shards) for r in shard]
+    wall = time.time() - start
+    results.sort(key=lambda r: (r['test'], list(TARGETS).index(r['target'])))
+
+    failed = [r for r in results if r['stop'] not in (STOP_INPUT, STOP_EXIT)]
+    changed = compare(results, args.compare) if args.compare else []
+
+    print(f"{'Test':32} {'Target':6} {'Stop':6} {'T-states':>12} {'Instrs':>10} {'Time':>6}")
+    print('-' * 78)
+    for r in results:
+        mark = '  changed' if r.get('changed') else ''
+        print(f"{r['test']:32} {r['target']:6} {r['stop']:6} {r['cycles']:12d} "
+              f"{r['instructions']:10d} {r['seconds']:5.1f}s{mark}")
+    print()
+    print(f"{len(results)} runs in {wall:.1f}s on {len(shards) if results else 0} workers, "
+          f"{len(failed)} did not finish" + (f", {len(changed)} changed" if args.compare else ''))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'wall_seconds': round(wall, 2), 'results': results}, f, indent=1)
+
+    return 1 if failed or changed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+verify_all.py - Build every interpreter and check it against its reference
+
+The 4K, 8K, 5.21 and Z80 targets are assembled and linked concurrently in
+a process pool, each into its own temporary directory so the source trees
+are left untouched.  Every result is compared byte for byte with the
+reference binary, and a per-target summary of build time and differences
+is printed.  mbasicz is checked with its speed-up switches off, the
+configuration that reproduces 5.21 byte for byte.
+
+Usage:
+    python3 verify_all.py [--targets 4k,8k,5.21,z80] [--jobs N] [--json FILE]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, 'mbasic_521', 'utils'))
+
+from compare_binaries import diff_mask, diff_spans       # noqa: E402
+
+
+ASSEMBLE = [sys.executable, '-m', 'um80.um80']
+LINK = [sys.executable, '-m', 'um80.ul80']
+
+# name: (directory, sources in link order, extra link options, reference)
+TARGETS = {
+    '4k': ('4k8k/4k', ['4kbas40_new.mac'], ['-p', '0'], '4kbas40.bin'),
+    '8k': ('4k8k/8k', ['8kbas_src.mac'], ['-p', '0'], '8kbas.bin'),
+    '5.21': ('mbasic_521', [f'mbasic_src/{m}.mac' for m in (
+        'bintrp', 'f4', 'biptrg', 'biedit', 'biprtu', 'bio', 'bimisc',
+        'bistrs', 'binlin', 'fiveo', 'dskcom', 'dcpm', 'fivdsk', 'init')],
+        [], 'com/mbasic.com'),
+    'z80': ('mbasicz', ['mbasicz.mac'], [], 'com/mbasic.com'),
+}
+
+# Assembly switches that must be off for a target to match its reference
+REFERENCE_DEFINES = {
+    'z80': ['lincac=0', 'varhsh=0', 'refcac=0', 'fastgc=0', 'incgc=0'],
+}
+
+
+def _run(cmd, cwd):
+    result = subprocess.run(cmd, cwd=cwd, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, text=True)
+    return result.returncode, result.stdout
+
+
+def build_image(name, out_dir, defines=()):
+    """Assemble and link one target into out_dir.
+
+    defines are SYMBOL=VALUE settings passed to um80 with -D.  Returns (image path, {}) or, on failure, (None, result fields
+    describing it).
+    """
+    directory, sources, link_opts, _ = TARGETS[name]
+    cwd = os.path.join(ROOT, directory)
+    options = [opt for define in defines for opt in ('-D', define)]
+    rels = []
+    for src in sources:
+        rel = os.path.join(out_dir, os.path.splitext(os.path.basename(src))[0] + '.rel')
+        code, output = _run(ASSEMBLE + options + [src, '-o', rel], cwd)
+        if code != 0:
+            return None, {'status': 'assembly failed', 'source': src, 'output': output[-2000:]}
+        rels.append(rel)
+    image = os.path.join(out_dir, 'out.bin')
+    code, output = _run(LINK + ['-o', image] + link_opts + rels, cwd)
+    if code != 0:
+        return None, {'status': 'link failed', 'output': output[-2000:]}
+    return image, {}
+
+
+def build_target(name):
+    """Build one target and compare it; returns a result dict."""
+    directory, _, _, ref_name = TARGETS[name]
+    start = time.time()
+    result = {'target': name, 'status': 'ok', 'seconds': 0.0}
+
+    with tempfile.TemporaryDirectory(prefix=f'verify_{name}_') as tmp:
+        image, failure = build_image(name, tmp, REFERENCE_DEFINES.get(name, ()))
+        result.update(failure)
+        if image:
+            with open(image, 'rb') as f:
+                ours = f.read()
+            with open(os.path.join(ROOT, directory, ref_name), 'rb') as f:
+                ref = f.read()
+            diffs = [(off, length) for off, length, equal in diff_spans(diff_mask(ref, ours))
+                     if not equal]
+            common = min(len(ref), len(ours))
+            if len(ref) != len(ours):
+                # Bytes past the shorter image count as one differing span
+                diffs.append((common, max(len(ref), len(ours)) - common))
+            result.update(size=len(ours), ref_size=len(ref),
+                          diff_bytes=sum(length for _, length in diffs),
+                          diff_spans=len(diffs),
+                          first_diff=diffs[0][0] if diffs else None)
+            if ours != ref:
+                result['status'] = 'differs'
+
+    result['seconds'] = round(time.time() - start, 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build all interpreters and verify them')
+    parser.add_argument('--targets', default=','.join(TARGETS),
+                        help=f"Comma-separated targets (default: {','.join(TARGETS)})")
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='Parallel builds (default: number of CPUs)')
+    parser.add_argument('--json', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    names = [t.strip() for t in args.targets.split(',') if t.strip()]
+    unknown = [t for t in names if t not in TARGETS]
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(unknown)}")
+
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(names)))) as pool:
+        results = list(pool.map(build_target, names))
+    wall = time.time() - start
+
+    print("Target  Status            Time   Size   Ref    Diff bytes  Spans  First diff")
+    print("-" * 78)
+    for r in results:
+        size = f"{r['size']:6d} {r['ref_size']:6d}" if 'size' in r else f"{'':6} {'':6}"
+        diff = f"{r['diff_bytes']:10d} {r['diff_spans']:6d}" if 'size' in r else f"{'':10} {'':6}"
+        first = f"0x{r['first_diff']:04X}" if r.get('first_diff') is not None else ''
+        print(f"{r['target']:7} {r['status']:16} {r['seconds']:5.1f}s {size} {diff}  {first}")
+    for r in results:
+        if 'output' in r:
+            print()
+            print(f"{r['target']}: {r['status']}")
+            print(r['output'].rstrip())
+    total = sum(r['seconds'] for r in results)
+    print()
+    print(f"Wall clock {wall:.1f}s for {total:.1f}s of builds")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'wall_seconds': round(wall, 2), 'results': results}, f, indent=1)
+
+    return 0 if all(r['status'] == 'ok' for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())